@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Batch mode for the Knowledge Base chat: replays a JSONL file of questions
+through the RAG pipeline and writes one JSONL result per question.
+
+Validation, retrieval and generation run as separate pipelined stages, each
+with its own worker pool, so a slow generation never holds up validation of
+the next question. Identical prompts are answered once and the result is
+written for every row that asked it. Each result line is flushed as soon as
+it is ready; re-running with the same output file skips rows that already
+completed and replaces rows that ended in an error, so a crashed run can
+simply be restarted and every id is written once.
+
+Usage:
+    python batch_query.py questions.jsonl results.jsonl
+    python batch_query.py requests.jsonl results.jsonl --prompt-field body --id-field request_id \\
+        --validate-workers 8 --retrieve-workers 8 --generate-workers 4
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import queue
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bedrock_utils import (
+    raise_errors,
+    valid_prompt,
+    query_knowledge_base,
+    generate_response
+)
+from chat import (
+    build_rag_prompt,
+    source_file_names,
+    REJECTED_PROMPT_MESSAGE,
+    NO_CONTEXT_MESSAGE
+)
+
+
+def read_questions(input_path, prompt_field, id_field):
+    """Yields (row_id, prompt) for every row; ids default to the line number."""
+    with open(input_path, encoding="utf-8") as input_file:
+        for line_number, line in enumerate(input_file, 1):
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            yield str(row.get(id_field, line_number)), row[prompt_field]
+
+
+def load_completed(output_path):
+    """
+    Returns the ids already answered in `output_path`.
+
+    Rows that ended in an error are retried, so they are removed from the
+    file (rewritten atomically) along with a line cut off by a crash and
+    any repeat of an id: after a resume every id appears exactly once.
+    """
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+
+    with open(output_path, "rb") as output_file:
+        data = output_file.read()
+
+    kept = []
+    for line in data.split(b"\n"):
+        if not line.strip():
+            continue
+        try:
+            result = json.loads(line)
+        except ValueError:  # The last line of a crashed run
+            continue
+        if "error" in result or result["id"] in completed:
+            continue
+        completed.add(result["id"])
+        kept.append(line + b"\n")
+
+    if len(b"".join(kept)) != len(data):
+        temp_path = f"{output_path}.tmp"
+        with open(temp_path, "wb") as temp_file:
+            temp_file.writelines(kept)
+        os.replace(temp_path, output_path)
+    return completed
+
+
+class BatchPipeline:
+    """
+    Three-stage validate -> retrieve -> generate pipeline.
+
+    Each stage has its own thread pool; finishing one stage for a prompt
+    submits it to the next, and finished prompts go to `results`.
+    """
+
+    def __init__(self, validate_workers=4, retrieve_workers=4, generate_workers=4):
+        self.validate_pool = ThreadPoolExecutor(validate_workers, thread_name_prefix="validate")
+        self.retrieve_pool = ThreadPoolExecutor(retrieve_workers, thread_name_prefix="retrieve")
+        self.generate_pool = ThreadPoolExecutor(generate_workers, thread_name_prefix="generate")
+        self.results = queue.Queue()
+
+    def submit(self, prompt):
+        self._next(self.validate_pool, self._validate, prompt, {"prompt": prompt})
+
+    def _next(self, pool, stage, prompt, state):
+        future = pool.submit(stage, prompt, state)
+        future.add_done_callback(lambda done: self._finish_on_error(done, state))
+
+    def _finish_on_error(self, future, state):
+        if future.exception() is not None:
+            state["error"] = repr(future.exception())
+            self.results.put(state)
+
+    # Stages call Bedrock inside raise_errors(): a failed call must end as an
+    # "error" row (retried on resume), not as a rejection or an empty answer
+
+    def _validate(self, prompt, state):
+        with raise_errors():
+            state["valid"] = valid_prompt(prompt)
+        if not state["valid"]:
+            state["answer"] = REJECTED_PROMPT_MESSAGE
+            state["sources"] = []
+            self.results.put(state)
+            return
+        self._next(self.retrieve_pool, self._retrieve, prompt, state)
+
+    def _retrieve(self, prompt, state):
+        with raise_errors():
+            context_chunks = query_knowledge_base(prompt)
+        if not context_chunks:
+            state["answer"] = NO_CONTEXT_MESSAGE
+            state["sources"] = []
+            self.results.put(state)
+            return
+        state["context_chunks"] = context_chunks
+        self._next(self.generate_pool, self._generate, prompt, state)
+
+    def _generate(self, prompt, state):
+        final_prompt, sources = build_rag_prompt(prompt, state.pop("context_chunks"))
+        with raise_errors():
+            state["answer"] = generate_response(final_prompt)
+        state["sources"] = source_file_names(sources)
+        self.results.put(state)
+
+    def shutdown(self):
+        for pool in (self.validate_pool, self.retrieve_pool, self.generate_pool):
+            pool.shutdown(wait=True)
+
+
+def run_batch(input_path, output_path, prompt_field="body", id_field="request_id",
+              validate_workers=4, retrieve_workers=4, generate_workers=4):
+    """
+    Answers every not-yet-completed row of `input_path` into `output_path`.
+
+    Returns:
+        Dict with rows written, unique prompts sent, rows skipped and elapsed seconds
+    """
+    completed = load_completed(output_path)
+
+    # Group pending rows by prompt so each distinct prompt is answered once
+    ids_by_prompt = {}
+    skipped = 0
+    for row_id, prompt in read_questions(input_path, prompt_field, id_field):
+        if row_id in completed:
+            skipped += 1
+            continue
+        ids_by_prompt.setdefault(prompt, []).append(row_id)
+
+    pipeline = BatchPipeline(validate_workers, retrieve_workers, generate_workers)
+    start = time.perf_counter()
+    written = 0
+
+    with open(output_path, "a", encoding="utf-8") as output_file:
+        for prompt in ids_by_prompt:
+            pipeline.submit(prompt)
+
+        for _ in range(len(ids_by_prompt)):
+            state = pipeline.results.get()
+            for row_id in ids_by_prompt[state["prompt"]]:
+                output_file.write(json.dumps(dict(state, id=row_id)) + "\n")
+                written += 1
+            output_file.flush()
+            print(f"\r{written} rows written", end="", file=sys.stderr)
+
+    pipeline.shutdown()
+    print(file=sys.stderr)
+    return {
+        "rows_written": written,
+        "unique_prompts": len(ids_by_prompt),
+        "rows_skipped": skipped,
+        "elapsed_seconds": time.perf_counter() - start,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions in bulk")
+    parser.add_argument("input", help="JSONL file with one question per line")
+    parser.add_argument("output", help="JSONL results file (appended to; enables resume)")
+    parser.add_argument("--prompt-field", default="body")
+    parser.add_argument("--id-field", default="request_id")
+    parser.add_argument("--validate-workers", type=int, default=4)
+    parser.add_argument("--retrieve-workers", type=int, default=4)
+    parser.add_argument("--generate-workers", type=int, default=4)
+    parser.add_argument("--verbose", action="store_true", help="Show per-call log lines")
+    args = parser.parse_args()
+
+    # The pipeline functions print a line per call; hide them unless asked
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with quiet:
+        summary = run_batch(
+            args.input, args.output, args.prompt_field, args.id_field,
+            args.validate_workers, args.retrieve_workers, args.generate_workers
+        )
+
+    rate = summary["unique_prompts"] / summary["elapsed_seconds"] if summary["elapsed_seconds"] else 0
+    print(f"Wrote {summary['rows_written']} rows ({summary['unique_prompts']} unique prompts, "
+          f"{summary['rows_skipped']} already done) in {summary['elapsed_seconds']:.1f}s "
+          f"- {rate:.1f} prompts/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,322 @@
 # This is the full content of chat.py
 # This script is designed to work with YOUR bedrock_utils.py file.
 
+import contextvars
+import string
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import tracing
+
 # We import all the functions you provided
 from bedrock_utils import (
     valid_prompt, 
     query_knowledge_base, 
-    generate_response
+    generate_response,
+    generate_response_stream,
+    answer_route
 )
+from context_packer import CONTEXT_TOKEN_BUDGET, context_pieces, estimate_tokens, pack_context
+from prompt_guard import (
+    GUARDED_PROMPT_TEMPLATE,
+    GuardedStreamParser,
+    is_accepted,
+    parse_guarded_response,
+    prefilter_prompt
+)
+from retrieved_chunk import chunk_source
+from spec_corpus import model_codes
+from tracing import annotate, span, traced
+
+# How validation and retrieval are scheduled for each chat turn:
+#   "sequential" - validate first, then retrieve (original behaviour)
+#   "threads"    - run both at the same time on a shared thread pool
+#   "asyncio"    - run both at the same time as bedrock_async tasks on a shared event loop
+EXECUTION_MODE = "sequential"
+EXECUTION_MODES = ("sequential", "threads", "asyncio")
+
+# How the Category A-E guard is applied to each chat turn:
+#   "separate"    - valid_prompt classifier call, then the answer call (original behaviour)
+#   "single_call" - one call returns the verdict and the answer (see scripts/prompt_guard.py)
+GUARD_MODE = "separate"
+GUARD_MODES = ("separate", "single_call")
+
+# Stream answers token by token instead of waiting for the full response
+STREAM_RESPONSES = True
+
+# Print a per-stage latency breakdown after each turn (see scripts/tracing.py)
+TRACE_TURNS = False
+
+REJECTED_PROMPT_MESSAGE = "I'm sorry, I can only answer questions related to heavy machinery. Please try another question."
+NO_CONTEXT_MESSAGE = "I'm sorry, I couldn't find any relevant information in the knowledge base for your question."
+
+# Threads in the shared pool for the "threads" mode (chat_server.py raises
+# this to its concurrent turn limit before the pool is created)
+RAG_WORKERS = 4
+
+# Shared pool for the "threads" mode, created on first use
+_executor = None
+
+# Event loop for the "asyncio" mode, running on its own thread, created on first use
+_event_loop = None
+_event_loop_lock = threading.Lock()
+
+# Optional semantic answer cache (see scripts/semantic_cache.py), None = off
+answer_cache = None
+
+# Optional spec-sheet lookup index (see scripts/spec_index.py), None = off
+spec_index = None
+
+# Answer exact spec lookups from the spec index in main_chat_loop
+USE_SPEC_INDEX = True
+
+# Remember earlier turns in main_chat_loop so follow-ups like "how heavy is it?"
+# work (see scripts/conversation_memory.py)
+USE_MEMORY = True
+
+
+def set_answer_cache(cache):
+    """
+    Enables (or with None disables) the semantic answer cache.
+    
+    `cache` needs embed(text), lookup(embedding, models) and
+    add(embedding, answer, sources, models), where models are the
+    spec_corpus.model_codes() of the question, e.g. semantic_cache.SemanticCache.
+    """
+    global answer_cache
+    answer_cache = cache
+
+
+def set_spec_index(index):
+    """
+    Enables (or with None disables) answering exact spec lookups without RAG.
+    
+    `index` needs answer(question) -> (answer, sources) or None,
+    e.g. spec_index.SpecIndex.
+    """
+    global spec_index
+    spec_index = index
+
+
+def _lookup_spec(user_prompt):
+    """
+    Answers `user_prompt` from the spec index if it is an exact spec lookup.
+    
+    Prompts the local pre-filter flags are left to the normal guard.
+    
+    Returns:
+        Tuple (answer, sources), or None to continue with RAG
+    """
+    if spec_index is None:
+        return None
+    with span("spec_index"):
+        hit = None if prefilter_prompt(user_prompt) is not None else spec_index.answer(user_prompt)
+        annotate(spec_hit=hit is not None)
+    if hit is not None:
+        print("Bot: Answering from the spec-sheet index")
+    return hit
+
+
+def _lookup_cached_answer(user_prompt):
+    """
+    Checks the answer cache for a paraphrase of `user_prompt` about the same models.
+    
+    Like _lookup_spec, prompts the local pre-filter flags are left to the
+    normal guard: they are neither served from nor stored in the cache.
+    
+    Returns:
+        Tuple (hit, embedding, models) - hit is (answer, sources, similarity)
+        or None; embedding and models are reused to store the new answer on a miss
+    """
+    if answer_cache is None or prefilter_prompt(user_prompt) is not None:
+        return None, None, None
+    with span("answer_cache"):
+        embedding = answer_cache.embed(user_prompt)
+        models = model_codes(user_prompt)
+        hit = answer_cache.lookup(embedding, models)
+        annotate(cache_hit=hit is not None)
+    if hit is not None:
+        print(f"Bot: Reusing a cached answer (similarity {hit[2]:.2f})")
+    return hit, embedding, models
+
+
+def _start_turn(user_prompt, memory, mode, guard):
+    """
+    Applies conversation memory (if any) to a new turn.
+    
+    Returns:
+        Tuple (question, retrieve, history) - the standalone question used for
+        caching, validation, retrieval and the prompt, the retrieval function
+        (None = the default of the `mode` / `guard` pair) and the history text
+        for the prompt
+    """
+    if memory is None:
+        return user_prompt, None, ""
+    question = memory.rewrite(user_prompt)
+    if question != user_prompt:
+        print(f"Bot: Searching for: {question}")
+    if mode == "asyncio" and guard == "separate":
+        from bedrock_async import query_knowledge_base_async
+        retrieve = memory.retriever(query_knowledge_base_async)
+    else:
+        retrieve = memory.retriever(query_knowledge_base)
+    return question, retrieve, memory.history_text()
+
+
+def _get_executor():
+    """Return the shared thread pool, creating it the first time it is needed."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=RAG_WORKERS, thread_name_prefix="rag")
+    return _executor
+
+
+def _get_event_loop():
+    """Return the shared event loop of the "asyncio" mode, starting its thread the first time."""
+    global _event_loop
+    with _event_loop_lock:
+        if _event_loop is None:
+            import asyncio  # Only the "asyncio" mode needs it; keeps `import chat` fast
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="rag-asyncio", daemon=True).start()
+            _event_loop = loop
+    return _event_loop
+
+
+async def validate_and_retrieve_async(user_prompt, retrieve=None):
+    """
+    Runs valid_prompt_async and query_knowledge_base_async (see
+    scripts/bedrock_async.py) concurrently as asyncio tasks.
+    
+    The retrieval task is cancelled (or its result dropped) as soon as the
+    validator rejects the prompt. `retrieve` is an async retrieval function.
+    
+    Returns:
+        Tuple (is_valid, context_chunks) - context_chunks is [] when rejected
+    """
+    import asyncio
+    from bedrock_async import query_knowledge_base_async, valid_prompt_async
+    
+    retrieval = asyncio.create_task((retrieve or query_knowledge_base_async)(user_prompt))
+    is_valid = await valid_prompt_async(user_prompt)
+    
+    if not is_valid:
+        retrieval.cancel()
+        return False, []
+    
+    return True, await retrieval
+
+
+def validate_and_retrieve(user_prompt, mode=None, retrieve=None):
+    """
+    Validates the prompt and retrieves its context using the given execution mode.
+    
+    In the concurrent modes the Knowledge Base query is started together with
+    the validator, which takes one full network round-trip off every accepted
+    query. If the prompt is rejected the retrieval result is simply dropped.
+    
+    Parameters:
+        user_prompt: The user's question
+        mode: One of EXECUTION_MODES (default: EXECUTION_MODE)
+        retrieve: Retrieval function (default: query_knowledge_base; an async
+                  one such as query_knowledge_base_async in the "asyncio" mode)
+        
+    Returns:
+        Tuple (is_valid, context_chunks) - context_chunks is [] when rejected
+    """
+    mode = mode if mode is not None else EXECUTION_MODE
+    if mode == "asyncio":
+        # Every turn runs on one long-lived loop, so bedrock_async's limiters and
+        # pools are shared between turns; callers already inside an event loop
+        # should await validate_and_retrieve_async() directly
+        import asyncio
+        future = asyncio.run_coroutine_threadsafe(validate_and_retrieve_async(user_prompt, retrieve),
+                                                  _get_event_loop())
+        return future.result()
+    
+    retrieve = retrieve or query_knowledge_base
+    if mode == "sequential":
+        if not valid_prompt(user_prompt):
+            return False, []
+        print("Bot: Retrieving information...")
+        return True, retrieve(user_prompt)
+    
+    if mode == "threads":
+        # Retrieval goes to the pool, validation runs on the calling thread
+        # copy_context keeps the retrieval span inside this turn's trace
+        retrieval = _get_executor().submit(contextvars.copy_context().run, retrieve, user_prompt)
+        if not valid_prompt(user_prompt):
+            retrieval.cancel()
+            return False, []
+        return True, retrieval.result()
+    
+    raise ValueError(f"Unknown execution mode: {mode!r} (expected one of {EXECUTION_MODES})")
+
+
+def prefilter_and_retrieve(user_prompt, retrieve=None):
+    """
+    Single-call counterpart of validate_and_retrieve.
+    
+    Only the local pre-filter runs before retrieval; the model's own verdict
+    is checked when the answer comes back.
+    
+    Returns:
+        Tuple (is_valid, context_chunks) - context_chunks is [] when rejected
+    """
+    category = prefilter_prompt(user_prompt)
+    if category is not None:
+        print(f"Prompt category: {category} (local pre-filter)")
+        return False, []
+    print("Bot: Retrieving information...")
+    return True, (retrieve or query_knowledge_base)(user_prompt)
+
+
+def screen_and_retrieve(user_prompt, mode=None, guard=None, retrieve=None):
+    """Runs the prompt check that `guard` (default: GUARD_MODE) calls for before answering, plus retrieval."""
+    guard = guard if guard is not None else GUARD_MODE
+    if guard == "single_call":
+        return prefilter_and_retrieve(user_prompt, retrieve)
+    if guard != "separate":
+        raise ValueError(f"Unknown guard mode: {guard!r} (expected one of {GUARD_MODES})")
+    print("Bot: Validating prompt...")
+    return validate_and_retrieve(user_prompt, mode, retrieve)
+
+
+@lru_cache(maxsize=None)
+def _prompt_pieces(prompt_template, with_history):
+    """
+    Splits a prompt template into (literal, field) pairs once, so each prompt
+    is a single join of those pieces and the values (no format/replace copies).
+    """
+    if with_history:
+        prompt_template = prompt_template.replace(
+            "<context>", "<conversation>\n    {history}\n    </conversation>\n\n    <context>", 1)
+    return tuple((literal, field) for literal, field, _, _ in string.Formatter().parse(prompt_template))
 
-def build_rag_prompt(user_prompt, context_chunks):
+
+@traced("build_prompt")
+def build_rag_prompt(user_prompt, context_chunks, token_budget=CONTEXT_TOKEN_BUDGET, metrics=None,
+                     guarded=False, history=""):
     """
     This is the missing RAG logic.
     It manually builds a prompt that includes the retrieved context.
+
+    The chunks are packed into `token_budget` estimated tokens (see
+    scripts/context_packer.py): duplicates and overlaps are dropped, the
+    best-scoring chunks go first and the last one is cut at a sentence.
+    Only chunks that made it into the prompt are returned as sources.
+
+    `metrics` (optional dict) receives context_tokens, prompt_tokens,
+    chunks_used and chunks_dropped.
+
+    With `guarded` the prompt also asks the model to classify the question
+    and reply with <verdict>/<answer> tags (GUARD_MODE "single_call").
+
+    `history` (earlier turns, see ConversationMemory.history_text) goes in a
+    <conversation> block before the context; the prompt is unchanged without it.
+
+    The returned sources are retrieved_chunk.RetrievedChunks.
     """
     
     # 1. Start with the system instruction
@@ -29,61 +334,231 @@ def build_rag_prompt(user_prompt, context_chunks):
     
     Assistant:
     """
+    if guarded:
+        prompt_template = GUARDED_PROMPT_TEMPLATE
     
-    # 2. Add the retrieved document chunks to the context
-    context_text = ""
-    for i, chunk in enumerate(context_chunks):
-        context_text += f"Chunk {i+1}:\n{chunk['content']['text']}\n\n"
-        
-    # 3. Inject the context and question into the template
-    final_prompt = prompt_template.format(
-        context=context_text,
-        question=user_prompt
+    # 2. Pack the retrieved document chunks into the token budget
+    packed, context_tokens = pack_context(context_chunks, token_budget)
+
+    # 3. Inject the context and question into the template, in one join
+    values = {'question': user_prompt, 'history': history}
+    pieces = []
+    for literal, field in _prompt_pieces(prompt_template, bool(history)):
+        pieces.append(literal)
+        if field == "context":
+            context_pieces(packed, pieces)
+        elif field is not None:
+            pieces.append(values[field])
+    final_prompt = "".join(pieces)
+
+    if metrics is not None:
+        metrics['context_tokens'] = context_tokens
+        metrics['prompt_tokens'] = estimate_tokens(final_prompt)
+        metrics['chunks_used'] = len(packed)
+        metrics['chunks_dropped'] = len(context_chunks) - len(packed)
+    annotate(chunks_used=len(packed), prompt_chars=len(final_prompt), context_tokens=context_tokens)
+
+    return final_prompt, [chunk for chunk, _ in packed]
+
+def source_file_names(sources):
+    """Returns the file name of each cited chunk, once each, in first-seen order."""
+    # dict keeps first-seen order and skips duplicate file names
+    source_files = dict.fromkeys(chunk_source(chunk) for chunk in sources)
+    source_files.pop(None, None)  # Chunks without an S3 location
+    return list(source_files)
+
+
+def format_sources(sources):
+    """Builds the "Sources:" footer listing each cited file once."""
+    return "\n\nSources:\n" + "".join(
+        f"[{i}] {file_name}\n" for i, file_name in enumerate(source_file_names(sources), 1)
     )
+
+
+@traced("chat_turn")
+def get_rag_response_stream(user_prompt, mode=None, metrics=None, guard=None, memory=None):
+    """
+    Streaming version of get_rag_response.
     
-    return final_prompt, context_chunks
+    Yields the answer as text pieces while Claude generates it, followed by
+    the source citations once the stream has finished. Rejections and
+    "nothing found" replies are yielded as a single piece.
+    
+    `metrics` (optional dict) receives time_to_first_token and total_latency
+    for the generation, see generate_response_stream, and the prompt size
+    figures from build_rag_prompt.
+    
+    With guard "single_call" nothing is shown until the model's verdict has
+    arrived; a rejected verdict ends the stream with the rejection message.
+    
+    With `memory` (a ConversationMemory) follow-ups are rewritten into
+    standalone questions, earlier turns go into the prompt and the answered
+    turn is remembered.
+    
+    `mode` and `guard` default to EXECUTION_MODE and GUARD_MODE.
+    """
+    mode = mode if mode is not None else EXECUTION_MODE
+    guard = guard if guard is not None else GUARD_MODE
+    annotate(mode=mode, guard=guard, streamed=True, prompt_chars=len(user_prompt))
+    question, retrieve, history = _start_turn(user_prompt, memory, mode, guard)
+    
+    # 0. Answer exact spec lookups from the spec index, and paraphrases of
+    # recent questions from the answer cache
+    spec = _lookup_spec(question)
+    if spec is not None:
+        annotate(outcome="spec_index")
+        answer, sources = spec
+        if memory is not None:
+            memory.add_turn(question, answer)
+        yield answer
+        yield format_sources(sources)
+        return
+    
+    cached, embedding, models = _lookup_cached_answer(question)
+    if cached is not None:
+        annotate(outcome="cached")
+        answer, sources, _ = cached
+        if memory is not None:
+            memory.add_turn(question, answer)
+        yield answer
+        yield format_sources(sources)
+        return
+    
+    # 1 + 2. Validate the prompt and retrieve documents from the Knowledge Base
+    is_valid, context_chunks = screen_and_retrieve(question, mode, guard, retrieve)
+    if not is_valid:
+        annotate(outcome="rejected")
+        yield REJECTED_PROMPT_MESSAGE
+        return
+    
+    if not context_chunks:
+        annotate(outcome="no_context")
+        yield NO_CONTEXT_MESSAGE
+        return
+        
+    # 3. Build the final prompt with the retrieved context
+    guarded = guard == "single_call"
+    final_prompt, sources = build_rag_prompt(question, context_chunks, metrics=metrics, guarded=guarded,
+                                             history=history)
+    
+    # 4. Stream the answer as it is generated
+    print("Bot: Generating answer...")
+    answer_parts = []
+    parser = GuardedStreamParser() if guarded else None
+    route = answer_route(question, context_chunks)  # "answer" unless a model router escalates
+    for text in generate_response_stream(final_prompt, metrics=metrics, route=route):
+        if parser is not None:
+            text = parser.feed(text)
+            if parser.verdict is not None and not is_accepted(parser.verdict):
+                print(f"Prompt category: {parser.verdict or 'no verdict'}")
+                annotate(outcome="rejected", category=parser.verdict)
+                yield REJECTED_PROMPT_MESSAGE
+                return
+        if text:
+            answer_parts.append(text)
+            yield text
+    
+    if parser is not None:
+        if not is_accepted(parser.verdict):  # Stream ended before a verdict
+            annotate(outcome="rejected")
+            yield REJECTED_PROMPT_MESSAGE
+            return
+        text = parser.finish()
+        if text:
+            answer_parts.append(text)
+            yield text
+    
+    if answer_cache is not None and answer_parts:
+        answer_cache.add(embedding, "".join(answer_parts), sources, models)
+    if memory is not None:
+        memory.record_prompt(history)
+        memory.add_turn(question, "".join(answer_parts))
+    annotate(outcome="answered")
+    
+    # 5. Append the source citations after the stream finishes
+    yield format_sources(sources)
+
 
-def get_rag_response(user_prompt):
+def get_rag_response(user_prompt, mode=None, stream=None, guard=None, memory=None):
     """
     This is the main function that orchestrates the RAG flow.
     It completes the "generate_response" wrapper requirement.
-    """
     
-    # 1. Validate the prompt (using your function)
-    print("Bot: Validating prompt...")
-    if not valid_prompt(user_prompt):
-        return "I'm sorry, I can only answer questions related to heavy machinery. Please try another question."
+    `mode` selects how validation and retrieval are scheduled
+    (see EXECUTION_MODES). With `stream` the answer is collected from
+    get_rag_response_stream instead of a single blocking model call.
+    `guard` selects a separate validation call or the single-call
+    guard-and-answer prompt (see GUARD_MODES). `memory` (a
+    ConversationMemory) carries earlier turns of the same conversation.
+    `mode`, `stream` and `guard` default to EXECUTION_MODE, STREAM_RESPONSES
+    and GUARD_MODE as they are when the call is made.
+    """
+    mode = mode if mode is not None else EXECUTION_MODE
+    stream = stream if stream is not None else STREAM_RESPONSES
+    guard = guard if guard is not None else GUARD_MODE
+    if stream:
+        return "".join(get_rag_response_stream(user_prompt, mode, guard=guard, memory=memory))
+    return _get_rag_response_blocking(user_prompt, mode, guard, memory)
 
-    # 2. Retrieve documents from the Knowledge Base (using your function)
-    print("Bot: Retrieving information...")
-    context_chunks = query_knowledge_base(user_prompt)
+
+@traced("chat_turn")
+def _get_rag_response_blocking(user_prompt, mode, guard, memory=None):
+    """get_rag_response without streaming: one blocking generation call."""
+    annotate(mode=mode, guard=guard, streamed=False, prompt_chars=len(user_prompt))
+    question, retrieve, history = _start_turn(user_prompt, memory, mode, guard)
+    
+    # 0. Answer exact spec lookups from the spec index, and paraphrases of
+    # recent questions from the answer cache
+    spec = _lookup_spec(question)
+    if spec is not None:
+        annotate(outcome="spec_index")
+        answer, sources = spec
+        if memory is not None:
+            memory.add_turn(question, answer)
+        return answer + format_sources(sources)
+    
+    cached, embedding, models = _lookup_cached_answer(question)
+    if cached is not None:
+        annotate(outcome="cached")
+        answer, sources, _ = cached
+        if memory is not None:
+            memory.add_turn(question, answer)
+        return answer + format_sources(sources)
+    
+    # 1 + 2. Validate the prompt and retrieve documents from the Knowledge Base
+    # (one after the other, or concurrently depending on `mode`)
+    is_valid, context_chunks = screen_and_retrieve(question, mode, guard, retrieve)
+    if not is_valid:
+        annotate(outcome="rejected")
+        return REJECTED_PROMPT_MESSAGE
     
     if not context_chunks:
-        return "I'm sorry, I couldn't find any relevant information in the knowledge base for your question."
+        annotate(outcome="no_context")
+        return NO_CONTEXT_MESSAGE
         
     # 3. Build the final prompt with the retrieved context
-    final_prompt, sources = build_rag_prompt(user_prompt, context_chunks)
+    guarded = guard == "single_call"
+    final_prompt, sources = build_rag_prompt(question, context_chunks, guarded=guarded, history=history)
     
     # 4. Generate the final answer (using your function)
     print("Bot: Generating answer...")
-    answer = generate_response(final_prompt)
+    answer = generate_response(final_prompt, route=answer_route(question, context_chunks))
+    if guarded:
+        # The verdict is enforced here, in code, not left to the model
+        category, answer = parse_guarded_response(answer)
+        if not is_accepted(category):
+            print(f"Prompt category: {category or 'no verdict'}")
+            annotate(outcome="rejected", category=category or "")
+            return REJECTED_PROMPT_MESSAGE
+    if answer_cache is not None and answer:
+        answer_cache.add(embedding, answer, sources, models)
+    if memory is not None:
+        memory.record_prompt(history)
+        memory.add_turn(question, answer)
+    annotate(outcome="answered")
     
     # 5. Format the response with source citations
-    response_text = f"{answer}\n\nSources:\n"
-    source_files = set() # Use a set to avoid duplicate file names
-    
-    for chunk in sources:
-        try:
-            s3_uri = chunk['location']['s3Location']['uri']
-            file_name = s3_uri.split('/')[-1]
-            source_files.add(file_name)
-        except (KeyError, IndexError, TypeError):
-            continue
-            
-    for i, file_name in enumerate(source_files, 1):
-        response_text += f"[{i}] {file_name}\n"
-
-    return response_text
+    return answer + format_sources(sources)
 
 
 def main_chat_loop():
@@ -93,6 +568,14 @@ def main_chat_loop():
     print("(Using your custom bedrock_utils.py file)")
     print("Type 'quit' or 'exit' to end the chat.")
     print("\n")
+    tracer = tracing.enable() if TRACE_TURNS else None
+    if USE_SPEC_INDEX and spec_index is None:
+        from spec_index import SpecIndex
+        set_spec_index(SpecIndex.load_or_build())
+    memory = None
+    if USE_MEMORY:
+        from conversation_memory import ConversationMemory
+        memory = ConversationMemory()
     
     while True:
         try:
@@ -104,11 +587,24 @@ def main_chat_loop():
                 print("Chat ended. Goodbye!")
                 break
                 
-            # 3. Get the RAG response
-            bot_response = get_rag_response(user_prompt)
-            
-            # 4. Print the response
-            print(f"\nBot: {bot_response}\n")
+            # 3 + 4. Get the RAG response and print it as it arrives
+            if STREAM_RESPONSES:
+                metrics = {}
+                stream = get_rag_response_stream(user_prompt, metrics=metrics, memory=memory)
+                for i, piece in enumerate(stream):
+                    if i == 0:
+                        print("\nBot: ", end="")  # After the status lines
+                    print(piece, end="", flush=True)
+                print()
+                if metrics.get('time_to_first_token') is not None:
+                    print(f"(first token {metrics['time_to_first_token']:.2f}s, "
+                          f"total {metrics['total_latency']:.2f}s, "
+                          f"~{metrics['prompt_tokens']} prompt tokens)")
+            else:
+                bot_response = get_rag_response(user_prompt, memory=memory)
+                print(f"\nBot: {bot_response}\n")
+            if tracer is not None:
+                print(f"(trace: {tracer.breakdown()})")
             print("--------------------------------------------------")
 
         except EOFError:
@@ -0,0 +1,577 @@
+#!/usr/bin/env python3
+"""
+Multi-session chat server for the Knowledge Base chat.
+
+main_chat_loop serves one user per process; this serves many. The boto3
+clients, caches and thread pools in bedrock_utils / chat are created once
+when the server starts and are shared by every session, so a new
+conversation never pays for client setup.
+
+Endpoints:
+    POST /chat     {"message": "...", "session_id": "...", "stream": true}
+                   Streamed as Server-Sent Events: `data: {"text": ...}`
+                   pieces, then `event: done`. With "stream": false one
+                   JSON reply {"session_id", "answer"}.
+    GET  /ws       WebSocket. Send {"message": "..."} (or plain text), receive
+                   {"type": "delta", "text": ...} pieces and {"type": "done"}.
+    GET  /health   Status, open sessions and running turns (JSON)
+    GET  /metrics  Server counters, plus the tracing histograms when
+                   tracing is on (Prometheus text format)
+
+Each session remembers its conversation (scripts/conversation_memory.py),
+so follow-ups like "how heavy is it?" work; --no-memory answers every
+message on its own. Exact spec lookups ("operating weight of the BD850")
+are answered from scripts/spec_index.py unless --no-spec-index is given.
+
+Session ids are issued by the server (`X-Session-Id`, the "session"
+WebSocket message, the done event) and act as bearer tokens: a request
+with an id the server never issued starts a new session under a new id.
+
+Every session has its own token bucket (--session-rate turns per second,
+--session-burst). A session over its limit gets HTTP 429 or a
+{"type": "error", "error": "rate_limited"} WebSocket message; when
+--max-turns turns are already running the server answers 503.
+
+SIGINT / SIGTERM stop new turns, let running ones finish (up to
+--drain-seconds) and then close the Bedrock clients.
+
+Usage:
+    python chat_server.py --port 8080
+    python chat_server.py --fake-backend --quiet     # offline, see scripts/bedrock_fake.py
+    curl -N localhost:8080/chat -d '{"message": "What is the payload of the DT1000?"}'
+"""
+
+import argparse
+import base64
+import contextlib
+import contextvars
+import hashlib
+import json
+import secrets
+import select
+import signal
+import struct
+import sys
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import bedrock_utils
+import chat
+import tracing
+from conversation_memory import ConversationMemory
+from resilient_client import TokenBucket
+
+DEFAULT_PORT = 8080
+SESSION_RATE = 1.0          # Turns per second per session (None = unlimited)
+SESSION_BURST = 3           # Turns a session may send back to back
+SESSION_TTL = 30 * 60       # Seconds before an idle session is forgotten
+MAX_SESSIONS = 10000
+MAX_CONCURRENT_TURNS = 64   # Turns running at once across all sessions
+DRAIN_SECONDS = 30          # How long shutdown waits for running turns
+MAX_MESSAGE_CHARS = 4000
+WS_POLL_SECONDS = 1.0       # How often idle WebSockets check for shutdown
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+# Set in the request threads of a --quiet server; chat turns inherit it
+_quiet = contextvars.ContextVar("quiet", default=False)
+
+
+class QuietableStdout:
+    """
+    Pass-through stand-in for sys.stdout that drops what quiet turns print.
+
+    The pipeline reports progress with print(). Replacing sys.stdout with
+    /dev/null (or contextlib.redirect_stdout, which swaps it for every
+    thread) would also silence, or race with, everything else in the
+    process; this only drops writes made while `_quiet` is set.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        if _quiet.get():
+            return len(text)
+        return self.stream.write(text)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class Session:
+    """One conversation: its rate limit, turn count and memory."""
+
+    __slots__ = ("id", "bucket", "created", "last_seen", "turns", "lock", "memory")
+
+    def __init__(self, session_id, rate, burst):
+        self.id = session_id
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.created = self.last_seen = time.monotonic()
+        self.turns = 0
+        self.lock = threading.Lock()  # One turn at a time per session
+        self.memory = None            # ConversationMemory, created on the first turn
+
+
+class SessionStore:
+    """
+    Thread-safe session registry with idle expiry.
+
+    Parameters:
+        rate / burst: Token bucket settings for new sessions
+        ttl: Idle seconds before a session is dropped
+        max_sessions: Oldest sessions are dropped beyond this
+    """
+
+    def __init__(self, rate=SESSION_RATE, burst=SESSION_BURST, ttl=SESSION_TTL, max_sessions=MAX_SESSIONS):
+        self.rate = rate
+        self.burst = burst
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # Least recently used first
+        self._lock = threading.Lock()
+
+    def get(self, session_id=None):
+        """
+        Returns the session for `session_id`, or a new session if there is none.
+
+        New sessions always get a new server-generated id, never the one the
+        client sent, so ids can't be chosen or guessed to join a conversation.
+        """
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                session = Session(secrets.token_urlsafe(24), self.rate, self.burst)
+                self._sessions[session.id] = session
+            else:
+                self._sessions.move_to_end(session.id)
+            session.last_seen = now
+            # Expire from the least recently used end
+            while self._sessions:
+                oldest = next(iter(self._sessions.values()))
+                if len(self._sessions) <= self.max_sessions and now - oldest.last_seen <= self.ttl:
+                    break
+                del self._sessions[oldest.id]
+            return session
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class ChatService:
+    """
+    Admission control and turn execution shared by the HTTP and WebSocket handlers.
+
+    Parameters:
+        sessions: SessionStore
+        max_turns: Turns allowed to run at once
+        mode / guard: chat.EXECUTION_MODES / chat.GUARD_MODES value for every turn
+                      (None = chat.EXECUTION_MODE / chat.GUARD_MODE when the turn runs)
+        memory: Keep per-session conversation memory
+    """
+
+    def __init__(self, sessions, max_turns=MAX_CONCURRENT_TURNS, mode=None, guard=None, memory=True):
+        self.sessions = sessions
+        self.mode = mode
+        self.guard = guard
+        self.memory = memory
+        self.max_turns = max_turns
+        self.draining = False
+        self._slots = threading.BoundedSemaphore(max_turns)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self.active_turns = 0
+        self.counters = {'turns': 0, 'rate_limited': 0, 'busy': 0, 'errors': 0, 'turn_seconds': 0.0}
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.counters[key] += amount
+
+    @contextlib.contextmanager
+    def turn(self, session):
+        """
+        Admits and runs one turn of `session`.
+
+        The session lock is taken first and a global slot only after it, so a
+        turn queued behind the same session's running turn never holds a slot
+        other sessions could use.
+
+        Yields:
+            None if the turn may run inside the block, else the refusal
+            reason: "draining", "rate_limited" or "busy"
+        """
+        if self.draining:
+            yield "draining"
+            return
+        if session.bucket is not None and not session.bucket.try_acquire():
+            self._count('rate_limited')
+            yield "rate_limited"
+            return
+        with session.lock:
+            if self.draining:
+                yield "draining"
+                return
+            if not self._slots.acquire(blocking=False):
+                self._count('busy')
+                yield "busy"
+                return
+            with self._lock:
+                self.active_turns += 1
+            start = time.perf_counter()
+            failed = False
+            try:
+                session.turns += 1
+                yield None
+            except Exception:
+                failed = True
+                raise
+            finally:
+                self._slots.release()
+                with self._lock:
+                    self.active_turns -= 1
+                    self.counters['turns'] += 1
+                    self.counters['turn_seconds'] += time.perf_counter() - start
+                    if failed:
+                        self.counters['errors'] += 1
+                    self._idle.notify_all()
+
+    def stream(self, session, message):
+        """Answer pieces for one message of `session` (call inside an admitted turn())."""
+        if self.memory and session.memory is None:
+            session.memory = ConversationMemory()
+        return chat.get_rag_response_stream(message, self.mode, guard=self.guard, memory=session.memory)
+
+    def drain(self, timeout=DRAIN_SECONDS):
+        """Refuses new turns and waits for running ones. Returns True if all finished."""
+        self.draining = True
+        deadline = time.monotonic() + timeout
+        with self._idle:
+            while self.active_turns:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def health(self):
+        return {"status": "draining" if self.draining else "ok", "sessions": len(self.sessions),
+                "active_turns": self.active_turns}
+
+    def prometheus(self):
+        with self._lock:
+            counters = dict(self.counters)
+        lines = ["# TYPE chat_server_turns_total counter", f"chat_server_turns_total {counters['turns']}",
+                 "# TYPE chat_server_turn_seconds_total counter",
+                 f"chat_server_turn_seconds_total {counters['turn_seconds']:.6f}"]
+        lines.append("# TYPE chat_server_refused_total counter")
+        for reason in ('rate_limited', 'busy'):
+            lines.append(f'chat_server_refused_total{{reason="{reason}"}} {counters[reason]}')
+        lines += ["# TYPE chat_server_turn_errors_total counter", f"chat_server_turn_errors_total {counters['errors']}"]
+        lines += ["# TYPE chat_server_sessions gauge", f"chat_server_sessions {len(self.sessions)}",
+                  "# TYPE chat_server_active_turns gauge", f"chat_server_active_turns {self.active_turns}"]
+        tracer = tracing.get_tracer()
+        return "\n".join(lines) + "\n" + (tracer.to_prometheus() if tracer is not None else "")
+
+
+# HTTP status and Retry-After for each refusal reason
+REFUSALS = {"rate_limited": (429, 1), "busy": (503, 1), "draining": (503, None)}
+
+
+class ChatRequestHandler(BaseHTTPRequestHandler):
+    """Routes /chat, /ws, /health and /metrics to the server's ChatService."""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # Stream pieces go out as soon as they are written
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def handle(self):
+        if self.server.quiet:
+            _quiet.set(True)  # This connection's thread only; turns run from it inherit it
+        super().handle()
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, str(value))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _refuse(self, reason, session_id):
+        status, retry_after = REFUSALS[reason]
+        headers = {'Retry-After': retry_after} if retry_after else {}
+        self._send_json(status, {"error": reason, "session_id": session_id}, headers)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, self.service.health())
+        elif self.path == '/metrics':
+            data = self.service.prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        elif self.path.split('?')[0] == '/ws' and self.headers.get('Upgrade', '').lower() == 'websocket':
+            self._serve_websocket()
+        else:
+            self._send_json(404, {"error": "not_found"})
+
+    def do_POST(self):
+        if self.path != '/chat':
+            self._send_json(404, {"error": "not_found"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b"{}")
+            message = str(request.get('message', '')).strip()
+        except (ValueError, AttributeError):
+            self._send_json(400, {"error": "invalid_json"})
+            return
+        if not message or len(message) > MAX_MESSAGE_CHARS:
+            self._send_json(400, {"error": "invalid_message"})
+            return
+
+        session = self.service.sessions.get(request.get('session_id') or self.headers.get('X-Session-Id'))
+        with self.service.turn(session) as refusal:
+            if refusal is not None:
+                self._refuse(refusal, session.id)
+                return
+            if not request.get('stream', True):
+                self._send_json(200, {"session_id": session.id, "answer": "".join(self.service.stream(session, message))})
+                return
+            self._stream_sse(session, message)
+
+    def _stream_sse(self, session, message):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('X-Session-Id', session.id)
+        self.end_headers()
+        pieces = self.service.stream(session, message)
+        try:
+            for piece in pieces:
+                self._write_chunk(f"data: {json.dumps({'text': piece})}\n\n")
+            self._write_chunk(f"event: done\ndata: {json.dumps({'session_id': session.id})}\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        finally:
+            pieces.close()  # Stops the generation stream if the client went away
+
+    def _write_chunk(self, text):
+        data = text.encode('utf-8')
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    # ----- WebSocket (RFC 6455, text messages only) -----
+
+    def _serve_websocket(self):
+        key = self.headers.get('Sec-WebSocket-Key', '')
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        self.send_response(101)
+        self.send_header('Upgrade', 'websocket')
+        self.send_header('Connection', 'Upgrade')
+        self.send_header('Sec-WebSocket-Accept', accept)
+        self.end_headers()
+        self.wfile.flush()
+        self.close_connection = True
+
+        session = self.service.sessions.get(self.headers.get('X-Session-Id'))
+        self._ws_send({"type": "session", "session_id": session.id})
+        while True:
+            # Poll so idle connections notice a shutdown
+            readable, _, _ = select.select([self.connection], [], [], WS_POLL_SECONDS)
+            if not readable:
+                if self.service.draining:
+                    self._ws_close(1001, "server shutting down")
+                    return
+                continue
+            message = self._ws_receive()
+            if message is None:
+                return
+            self._ws_turn(session, message)
+
+    def _ws_turn(self, session, message):
+        with contextlib.suppress(ValueError):
+            decoded = json.loads(message)
+            message = decoded.get('message', '') if isinstance(decoded, dict) else message
+        message = str(message).strip()
+        if not message or len(message) > MAX_MESSAGE_CHARS:
+            self._ws_send({"type": "error", "error": "invalid_message"})
+            return
+        with self.service.turn(session) as refusal:
+            if refusal is not None:
+                self._ws_send({"type": "error", "error": refusal})
+                return
+            pieces = self.service.stream(session, message)
+            try:
+                for piece in pieces:
+                    self._ws_send({"type": "delta", "text": piece})
+            finally:
+                pieces.close()
+        self._ws_send({"type": "done"})
+
+    def _recv_exact(self, count):
+        data = b""
+        while len(data) < count:
+            part = self.connection.recv(count - len(data))
+            if not part:
+                raise ConnectionResetError("WebSocket closed mid-frame")
+            data += part
+        return data
+
+    def _ws_receive(self):
+        """Next text message, or None once the client closed the connection."""
+        parts = []
+        try:
+            while True:
+                first, second = self._recv_exact(2)
+                opcode, length = first & 0x0F, second & 0x7F
+                if length == 126:
+                    length = struct.unpack("!H", self._recv_exact(2))[0]
+                elif length == 127:
+                    length = struct.unpack("!Q", self._recv_exact(8))[0]
+                if length > 4 * MAX_MESSAGE_CHARS:
+                    self._ws_close(1009, "message too big")
+                    return None
+                mask = self._recv_exact(4) if second & 0x80 else b"\0\0\0\0"
+                payload = bytes(byte ^ mask[i % 4] for i, byte in enumerate(self._recv_exact(length)))
+                if opcode == 0x8:    # Close
+                    self._ws_close(1000)
+                    return None
+                if opcode == 0x9:    # Ping
+                    self._ws_frame(0xA, payload)
+                    continue
+                if opcode in (0x0, 0x1):  # Continuation / text
+                    parts.append(payload)
+                    if first & 0x80:  # FIN
+                        return b"".join(parts).decode('utf-8', errors='replace')
+        except (ConnectionResetError, OSError):
+            return None
+
+    def _ws_frame(self, opcode, payload):
+        header = bytes([0x80 | opcode])
+        if len(payload) < 126:
+            header += bytes([len(payload)])
+        elif len(payload) < 1 << 16:
+            header += bytes([126]) + struct.pack("!H", len(payload))
+        else:
+            header += bytes([127]) + struct.pack("!Q", len(payload))
+        self.wfile.write(header + payload)
+        self.wfile.flush()
+
+    def _ws_send(self, message):
+        self._ws_frame(0x1, json.dumps(message).encode('utf-8'))
+
+    def _ws_close(self, code, reason=""):
+        with contextlib.suppress(OSError):
+            self._ws_frame(0x8, struct.pack("!H", code) + reason.encode('utf-8'))
+
+
+class ChatServer(ThreadingHTTPServer):
+    """ThreadingHTTPServer carrying the shared ChatService."""
+
+    daemon_threads = True
+    request_queue_size = 1024  # Don't drop connects during bursts of new sessions
+
+    def __init__(self, address, service, quiet=False):
+        super().__init__(address, ChatRequestHandler)
+        self.service = service
+        self.quiet = quiet
+
+
+def install_fake_backend(invoke_latency="lognormal:0.08,0.3", retrieve_latency="lognormal:0.05,0.3",
+                         token_latency="fixed:0.002", cassette=None):
+    """Points bedrock_utils at bedrock_fake.ReplayClient (BM25 over spec-sheets/ for retrieval)."""
+    from bedrock_fake import LatencyModel, ReplayClient
+    from hybrid_retrieval import BM25Index
+    from spec_corpus import load_chunks
+
+    runtime = ReplayClient(cassette, latency=LatencyModel.parse(invoke_latency),
+                           token_latency=LatencyModel.parse(token_latency))
+    agent_runtime = ReplayClient(cassette, latency=LatencyModel.parse(retrieve_latency),
+                                 fallback_backend=BM25Index(load_chunks()))
+    bedrock_utils.set_clients(runtime, agent_runtime)
+
+
+def start_server(host="127.0.0.1", port=DEFAULT_PORT, service=None, quiet=False):
+    """Starts serving in a background thread. Returns the ChatServer."""
+    service = service or ChatService(SessionStore())
+    # Size the shared "threads" pool for the turn limit and build it now, not in the first turn
+    chat.RAG_WORKERS = max(chat.RAG_WORKERS, service.max_turns)
+    chat._get_executor()
+    bedrock_utils.prewarm_clients()  # Clients, credentials and connection pools before the first session
+    if quiet and not isinstance(sys.stdout, QuietableStdout):
+        sys.stdout = QuietableStdout(sys.stdout)
+    server = ChatServer((host, port), service, quiet)
+    threading.Thread(target=server.serve_forever, name="chat-server", daemon=True).start()
+    return server
+
+
+def stop_server(server, drain_seconds=DRAIN_SECONDS):
+    """Graceful shutdown: drain running turns, stop accepting, close the clients."""
+    drained = server.service.drain(drain_seconds)
+    server.shutdown()
+    server.server_close()
+    bedrock_utils.clients.close()
+    return drained
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-session HTTP / WebSocket chat server")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--session-rate', type=float, default=SESSION_RATE, help="Turns/sec per session (0 = no limit)")
+    parser.add_argument('--session-burst', type=int, default=SESSION_BURST)
+    parser.add_argument('--max-turns', type=int, default=MAX_CONCURRENT_TURNS)
+    parser.add_argument('--mode', choices=chat.EXECUTION_MODES, default="threads")
+    parser.add_argument('--guard', choices=chat.GUARD_MODES, default=chat.GUARD_MODE)
+    parser.add_argument('--drain-seconds', type=float, default=DRAIN_SECONDS)
+    parser.add_argument('--trace', action='store_true', help="Record spans; histograms appear on /metrics")
+    parser.add_argument('--fake-backend', action='store_true', help="Serve from bedrock_fake instead of AWS")
+    parser.add_argument('--cassette', help="Recorded responses for --fake-backend")
+    parser.add_argument('--no-spec-index', action='store_true', help="Send spec lookups through RAG as well")
+    parser.add_argument('--no-memory', action='store_true', help="Answer each message without earlier turns")
+    parser.add_argument('--quiet', action='store_true', help="No per-turn status lines or access log")
+    args = parser.parse_args()
+
+    if args.fake_backend:
+        install_fake_backend(cassette=args.cassette)
+    if args.trace:
+        tracing.enable()
+    if not args.no_spec_index:
+        from spec_index import SpecIndex
+        chat.set_spec_index(SpecIndex.load_or_build())
+
+    service = ChatService(SessionStore(args.session_rate or None, args.session_burst), args.max_turns,
+                          args.mode, args.guard, memory=not args.no_memory)
+    server = start_server(args.host, args.port, service, args.quiet)
+    print(f"Chat server on http://{args.host}:{server.server_address[1]} "
+          f"(POST /chat, GET /ws, /health, /metrics)", file=sys.stderr)
+
+    stop = threading.Event()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signal_number, lambda *_: stop.set())
+    while not stop.wait(1.0):
+        pass
+    print("Shutting down: waiting for running turns...", file=sys.stderr)
+    drained = stop_server(server, args.drain_seconds)
+    print("Stopped." if drained else f"Stopped with turns still running after {args.drain_seconds}s.",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -32,4 +32,15 @@ USING hnsw (embedding vector_cosine_ops);
 -- Create GIN index on chunks column for full-text search (required by Bedrock KB)
 CREATE INDEX IF NOT EXISTS ahmad_kb_chunks_text_idx 
 ON ahmad_bedrock_schema.ahmad_knowledge_base 
-USING gin (to_tsvector('english', chunks));
\ No newline at end of file
+USING gin (to_tsvector('english', chunks));
+
+-- Expression indexes on the filter tags (machine_model / doc_type, see spec_corpus.py)
+-- for filtered full-text searches and for finding untagged rows
+CREATE INDEX IF NOT EXISTS ahmad_kb_machine_model_idx 
+ON ahmad_bedrock_schema.ahmad_knowledge_base ((metadata->>'machine_model'));
+
+CREATE INDEX IF NOT EXISTS ahmad_kb_doc_type_idx 
+ON ahmad_bedrock_schema.ahmad_knowledge_base ((metadata->>'doc_type'));
+
+-- Per-machine partial HNSW indexes (ahmad_kb_embedding_<model>_idx) are created by
+-- scripts/ingest.py for every machine_model it loads; see pgvector_retrieval.py
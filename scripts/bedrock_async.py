@@ -0,0 +1,303 @@
+"""
+Async Bedrock Utilities for serving many chat sessions from one process
+Author: Ahmad
+Description: asyncio variants of valid_prompt, query_knowledge_base and
+             generate_response with a shared connection pool, bounded
+             in-flight requests per model and backpressure.
+
+boto3 itself is blocking, so every Bedrock call runs on the thread pool of
+its ResilientClient (see resilient_client.call_async), which is exactly as
+large as the HTTP connection pool. That way no call ever waits for a free
+connection inside botocore; the waiting happens in asyncio where it is cheap
+and can be bounded. By default the clients are the shared ones from
+bedrock_utils' client registry, so set_clients() fakes apply here as well.
+"""
+import asyncio
+import json
+import time
+
+import bedrock_utils
+from bedrock_utils import (
+    AGENT_RUNTIME_CLIENT,
+    BEDROCK_ERRORS,
+    KB_ID,
+    MODEL_ID,
+    RUNTIME_CLIENT,
+    boto3_client_factory,
+    build_validation_body,
+    build_generation_body,
+    build_retrieval_config,
+    model_filters,
+    needs_unfiltered_search,
+    record_route,
+    rerank_results,
+    resolve_filter_fallback,
+    resolve_route,
+    retrieval_result_count,
+)
+from prompt_cache import classification_key
+from prompt_guard import prefilter_prompt
+from resilient_client import ResilientClient
+from tracing import traced
+
+# ============= Concurrency Settings =============
+DEFAULT_MAX_IN_FLIGHT = 10    # Concurrent requests per model / knowledge base
+DEFAULT_MAX_WAITING = 200     # Queued requests per model before rejecting
+# ================================================
+
+
+class BedrockBusyError(Exception):
+    """Raised when a model's wait queue is full (backpressure signal)."""
+
+
+class _Limiter:
+    """Bounds in-flight requests for one model and how many may queue behind them."""
+
+    def __init__(self, max_in_flight, max_waiting):
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+        self.max_waiting = max_waiting
+        self.waiting = 0
+
+    async def __aenter__(self):
+        if self.semaphore.locked():
+            if self.waiting >= self.max_waiting:
+                raise BedrockBusyError(
+                    f"{self.waiting} requests already waiting; try again later"
+                )
+            self.waiting += 1
+            try:
+                await self.semaphore.acquire()
+            finally:
+                self.waiting -= 1
+        else:
+            await self.semaphore.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.semaphore.release()
+
+
+class AsyncBedrock:
+    """
+    Shared async access to bedrock-runtime and bedrock-agent-runtime.
+
+    Parameters:
+        pool_size: Max HTTP connections (and worker threads) per client,
+                   default bedrock_utils.MAX_POOL_CONNECTIONS
+        max_in_flight: Max concurrent requests per model id / knowledge base id
+        max_waiting: Max requests queued per model before BedrockBusyError
+        region: AWS region for both clients
+        endpoint_url: Optional endpoint override (e.g. a local fake Bedrock)
+
+    Without pool_size, region, endpoint_url or other boto3.client arguments
+    the shared clients of bedrock_utils are used; with any of them this
+    instance builds (and closes) its own pair through the same factory.
+
+    Concurrency limits apply per event loop; moving to a new loop (e.g. a
+    second asyncio.run) starts with fresh limiters.
+    """
+
+    def __init__(self, pool_size=None, max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+                 max_waiting=DEFAULT_MAX_WAITING, region=None, endpoint_url=None,
+                 **client_kwargs):
+        self._own_clients = {}
+        if pool_size is not None or region is not None or endpoint_url is not None or client_kwargs:
+            settings = dict(client_kwargs, endpoint_url=endpoint_url)
+            if pool_size is not None:
+                settings['pool_size'] = pool_size
+            if region is not None:
+                settings['region'] = region
+            self._own_clients = {name: boto3_client_factory(name, **settings)()
+                                 for name in (RUNTIME_CLIENT, AGENT_RUNTIME_CLIENT)}
+        self.max_in_flight = max_in_flight
+        self.max_waiting = max_waiting
+        self._limiters = {}
+        self._loop = None
+
+    @property
+    def bedrock(self):
+        return self._own_clients.get(RUNTIME_CLIENT) or bedrock_utils.runtime_client()
+
+    @property
+    def bedrock_kb(self):
+        return self._own_clients.get(AGENT_RUNTIME_CLIENT) or bedrock_utils.agent_runtime_client()
+
+    def _limiter(self, key):
+        # asyncio primitives are bound to the loop they were first used on
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._limiters = {}
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            limiter = self._limiters[key] = _Limiter(self.max_in_flight, self.max_waiting)
+        return limiter
+
+    async def _run(self, key, client, method, parse=None, **kwargs):
+        """Runs client.<method>(**kwargs), then parse(response), off the loop once `key` has a free slot."""
+        async with self._limiter(key):
+            if isinstance(client, ResilientClient):
+                return await client.call_async(method, parse=parse, **kwargs)
+            # Clients installed with set_clients(..., resilient=False) and local engines
+            # run on the loop's default pool
+            def call():
+                response = getattr(client, method)(**kwargs)
+                return response if parse is None else parse(response)
+            return await asyncio.get_running_loop().run_in_executor(None, call)
+
+    async def _invoke_text(self, model_id, body, route=None):
+        start = time.perf_counter()
+        # The body is a blocking stream, so it is read (and parsed) on the worker thread too
+        response_data = await self._run(
+            model_id,
+            self.bedrock,
+            'invoke_model',
+            parse=_read_json_body,
+            modelId=model_id,
+            contentType='application/json',
+            accept='application/json',
+            body=body
+        )
+        if route is not None:
+            record_route(route, time.perf_counter() - start, response_data.get('usage'))
+        return response_data['content'][0]["text"]
+
+    @traced("validate")
+    async def valid_prompt(self, prompt, model_id=MODEL_ID):
+        """Async variant of bedrock_utils.valid_prompt (shares its classification cache)."""
+        if bedrock_utils.LOCAL_PREFILTER and prefilter_prompt(prompt) is not None:
+            return False
+        model_id, max_tokens, temperature, top_p = resolve_route("classify", model_id, 10, 0, 0.1)
+        cache = bedrock_utils.classification_cache
+        if cache is not None:
+            cache_key = classification_key(prompt, model_id)
+            category_result = cache.get(cache_key)
+            if category_result is not None:
+                return category_result.lower().strip() == "category e"
+        
+        try:
+            category_result = await self._invoke_text(
+                model_id, build_validation_body(prompt, max_tokens, temperature, top_p), "classify"
+            )
+            print(f"Prompt category: {category_result}")
+            if cache is not None:
+                cache.set(cache_key, category_result)
+            return category_result.lower().strip() == "category e"
+        except BEDROCK_ERRORS as error:
+            record_route("classify", 0.0, error=True)
+            print(f"Error validating prompt: {error}")
+            return False
+
+    @traced("retrieve")
+    async def query_knowledge_base(self, query, kb_id=KB_ID, filters=None):
+        """Async variant of bedrock_utils.query_knowledge_base (shares its retrieval cache and model filter)."""
+        auto_filters = None
+        if filters is None and bedrock_utils.AUTO_MODEL_FILTER:
+            filters = auto_filters = model_filters(query)
+        retrieved_chunks = await self._search_knowledge_base(query, kb_id, filters)
+        if needs_unfiltered_search(auto_filters, retrieved_chunks):
+            retrieved_chunks = resolve_filter_fallback(auto_filters, retrieved_chunks,
+                                                       await self._search_knowledge_base(query, kb_id, None))
+        return retrieved_chunks if retrieved_chunks is not None else []
+
+    async def _search_knowledge_base(self, query, kb_id, filters):
+        """One search of query_knowledge_base; None if it failed."""
+        number_of_results = retrieval_result_count()
+        retrieval_config = build_retrieval_config(number_of_results, filters)
+        backend = bedrock_utils.retrieval_backend
+        if backend is not None:
+            retrieval_config['backend'] = backend.name
+        cache = bedrock_utils.retrieval_cache
+        if cache is not None:
+            cached_chunks = cache.get(kb_id, query, retrieval_config)
+            if cached_chunks is not None:
+                return rerank_results(query, cached_chunks)
+        
+        if backend is not None:
+            # Local engines still go through the pool and the per-KB limit
+            try:
+                retrieved_chunks = await self._run(kb_id, backend, 'retrieve', query=query,
+                                                   number_of_results=number_of_results, filters=filters)
+            except Exception as error:
+                print(f"Error querying {backend.name} retrieval backend: {error}")
+                return None
+            if cache is not None and retrieved_chunks:
+                cache.set(kb_id, query, retrieval_config, retrieved_chunks)
+            return rerank_results(query, retrieved_chunks)
+        
+        try:
+            search_response = await self._run(
+                kb_id,
+                self.bedrock_kb,
+                'retrieve',
+                knowledgeBaseId=kb_id,
+                retrievalQuery={'text': query},
+                retrievalConfiguration=retrieval_config
+            )
+            retrieved_chunks = search_response['retrievalResults']
+            if cache is not None:
+                cache.set(kb_id, query, retrieval_config, retrieved_chunks)
+            return rerank_results(query, retrieved_chunks)
+        except BEDROCK_ERRORS as error:
+            print(f"Error querying Knowledge Base: {error}")
+            return None
+
+    @traced("generate")
+    async def generate_response(self, prompt, model_id=MODEL_ID, temperature=0.1, top_p=0.9, route="answer"):
+        """Async variant of bedrock_utils.generate_response."""
+        model_id, max_tokens, temperature, top_p = resolve_route(route, model_id, 500, temperature, top_p)
+        try:
+            return await self._invoke_text(
+                model_id, build_generation_body(prompt, temperature, top_p, max_tokens), route
+            )
+        except BEDROCK_ERRORS as error:
+            record_route(route, 0.0, error=True)
+            print(f"Error generating response: {error}")
+            return ""
+
+    def close(self):
+        """Closes the clients this instance built; the shared ones stay open."""
+        for client in self._own_clients.values():
+            client.close()
+        self._own_clients = {}
+
+
+def _read_json_body(response):
+    return json.loads(response['body'].read())
+
+
+# Process-wide default instance used by the module-level helpers below
+_default = None
+
+
+def configure(**kwargs):
+    """
+    (Re)creates the shared AsyncBedrock instance used by the *_async helpers.
+
+    Accepts the same keyword arguments as AsyncBedrock. Call it once at
+    startup before serving traffic.
+    """
+    global _default
+    if _default is not None:
+        _default.close()
+    _default = AsyncBedrock(**kwargs)
+    return _default
+
+
+def get_async_bedrock():
+    """Returns the shared AsyncBedrock instance, creating it with defaults if needed."""
+    if _default is None:
+        configure()
+    return _default
+
+
+async def valid_prompt_async(prompt, model_id=MODEL_ID):
+    return await get_async_bedrock().valid_prompt(prompt, model_id)
+
+
+async def query_knowledge_base_async(query, kb_id=KB_ID, filters=None):
+    return await get_async_bedrock().query_knowledge_base(query, kb_id, filters)
+
+
+async def generate_response_async(prompt, model_id=MODEL_ID, temperature=0.1, top_p=0.9, route="answer"):
+    return await get_async_bedrock().generate_response(prompt, model_id, temperature, top_p, route)
@@ -0,0 +1,339 @@
+"""
+Recorded-Response Bedrock Stand-in
+Author: Ahmad
+Description: Offline bedrock-runtime / bedrock-agent-runtime clients so the
+             pipeline can be benchmarked without AWS.
+
+    RecordingClient - wraps a real boto3 client and appends every
+                      invoke_model / invoke_model_with_response_stream /
+                      retrieve request and response to a JSONL cassette,
+                      together with the latency that was observed
+    ReplayClient    - answers the same calls from a cassette; requests that
+                      were never recorded get a synthesized response
+                      (or a ClientError with strict=True)
+
+Latency on replay comes from a LatencyModel: fixed, uniform, normal,
+lognormal, or "recorded" (the latency seen while recording). Streamed
+answers are replayed event by event with their own per-event delay.
+
+Usage:
+    # once, against AWS
+    import bedrock_utils
+    from bedrock_fake import RecordingClient
+    runtime = bedrock_utils.runtime_client()
+    runtime.client = RecordingClient(runtime.client, "cassette.jsonl")
+
+    # any time after, offline
+    from bedrock_fake import LatencyModel, ReplayClient
+    runtime = ReplayClient("cassette.jsonl", latency=LatencyModel.parse("lognormal:0.4,0.3"))
+    bedrock_utils.set_clients(runtime, runtime)
+"""
+import hashlib
+import io
+import json
+import math
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+LATENCY_KINDS = ("fixed", "uniform", "normal", "lognormal", "recorded")
+
+SYNTHETIC_ANSWER = ("The machine is rated for the load listed in its spec sheet. "
+                    "Check the operating weight and capacity before lifting.")
+SYNTHETIC_CHUNK_CHARS = 1000  # Same size as spec_corpus chunks
+
+# Only these parameters identify a request; contentType/accept never change the answer
+REQUEST_KEYS = {
+    'invoke_model': ('modelId', 'body'),
+    'invoke_model_with_response_stream': ('modelId', 'body'),
+    'retrieve': ('knowledgeBaseId', 'retrievalQuery', 'retrievalConfiguration'),
+}
+
+
+def request_key(method, kwargs):
+    """Stable hash of the parts of a request that decide its response."""
+    relevant = {name: kwargs.get(name) for name in REQUEST_KEYS[method]}
+    payload = json.dumps([method, relevant], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LatencyModel:
+    """
+    Draws call latencies in seconds.
+
+    Parameters:
+        kind: One of LATENCY_KINDS
+        a / b: fixed -> (seconds, -), uniform -> (low, high),
+               normal -> (mean, stddev), lognormal -> (median, sigma),
+               recorded -> (scale factor, -)
+        seed: Random seed for repeatable runs
+    """
+
+    def __init__(self, kind="fixed", a=0.0, b=0.0, seed=None):
+        if kind not in LATENCY_KINDS:
+            raise ValueError(f"Unknown latency kind: {kind!r} (expected one of {LATENCY_KINDS})")
+        self.kind = kind
+        self.a = a
+        self.b = b
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def parse(cls, spec, seed=None):
+        """
+        Builds a model from a CLI string such as "fixed:0.05",
+        "uniform:0.02,0.08", "lognormal:0.4,0.3" or "recorded".
+        """
+        kind, _, values = spec.partition(":")
+        numbers = [float(value) for value in values.split(",") if value]
+        if kind == "recorded" and not numbers:
+            numbers = [1.0]
+        return cls(kind, *(numbers + [0.0, 0.0])[:2], seed=seed)
+
+    def sample(self, recorded=None):
+        """One latency; `recorded` is the cassette's latency for this call, if any."""
+        if self.kind == "fixed":
+            return self.a
+        if self.kind == "recorded":
+            return (recorded or 0.0) * self.a
+        with self._lock:
+            if self.kind == "uniform":
+                value = self._random.uniform(self.a, self.b)
+            elif self.kind == "normal":
+                value = self._random.gauss(self.a, self.b)
+            else:
+                value = self._random.lognormvariate(math.log(self.a), self.b) if self.a > 0 else 0.0
+        return max(0.0, value)
+
+    def __repr__(self):
+        return f"LatencyModel({self.kind!r}, {self.a}, {self.b})"
+
+
+NO_LATENCY = LatencyModel("fixed", 0.0)
+
+
+def _sleep(seconds):
+    if seconds > 0:  # time.sleep(0) still gives up the GIL, which skews microbenchmarks
+        time.sleep(seconds)
+
+
+def _stream_event(message):
+    return {'chunk': {'bytes': json.dumps(message).encode('utf-8')}}
+
+
+def _filters_from_bedrock(bedrock_filter):
+    """A Bedrock retrieval filter as {key: value or [values]}; only equals / in / andAll are understood."""
+    if not bedrock_filter:
+        return None
+    filters = {}
+    for condition in bedrock_filter.get('andAll', [bedrock_filter]):
+        for operator, operand in condition.items():
+            if operator in ('equals', 'in'):
+                filters[operand['key']] = operand['value']
+    return filters or None
+
+
+class RecordingClient:
+    """
+    Wraps a boto3 client and records its responses to `cassette_path` (JSONL, appended).
+
+    Responses are handed back unchanged apart from the body, which is
+    re-wrapped after it has been read.
+    """
+
+    def __init__(self, client, cassette_path):
+        self.client = client
+        self.cassette_path = cassette_path
+        self.recorded = 0
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        # Methods that aren't recorded pass straight through
+        return getattr(self.client, name)
+
+    def _write(self, method, kwargs, **entry):
+        line = json.dumps(dict(method=method, key=request_key(method, kwargs), **entry), default=str)
+        with self._lock:
+            with open(self.cassette_path, 'a', encoding='utf-8') as cassette:
+                cassette.write(line + "\n")
+            self.recorded += 1
+
+    def invoke_model(self, **kwargs):
+        start = time.perf_counter()
+        response = self.client.invoke_model(**kwargs)
+        body = response['body'].read()
+        self._write('invoke_model', kwargs, latency=time.perf_counter() - start,
+                    response=body.decode('utf-8'))
+        return dict(response, body=io.BytesIO(body))
+
+    def invoke_model_with_response_stream(self, **kwargs):
+        start = time.perf_counter()
+        response = self.client.invoke_model_with_response_stream(**kwargs)
+
+        def events():
+            messages, gaps = [], []
+            last = start
+            for event in response['body']:
+                now = time.perf_counter()
+                chunk = event.get('chunk')
+                if chunk:
+                    messages.append(chunk['bytes'].decode('utf-8'))
+                    gaps.append(now - last)
+                    last = now
+                yield event
+            # Only complete streams are worth replaying
+            self._write('invoke_model_with_response_stream', kwargs, latency=gaps[0] if gaps else 0.0,
+                        gaps=gaps[1:], events=messages)
+
+        return dict(response, body=events())
+
+    def retrieve(self, **kwargs):
+        start = time.perf_counter()
+        response = self.client.retrieve(**kwargs)
+        recorded = {key: value for key, value in response.items() if key != 'ResponseMetadata'}
+        self._write('retrieve', kwargs, latency=time.perf_counter() - start, response=recorded)
+        return response
+
+
+class ReplayClient:
+    """
+    Serves Bedrock calls from a cassette, with latencies drawn from LatencyModels.
+
+    One instance can stand in for both the runtime and the agent-runtime
+    client. Requests missing from the cassette are answered like
+    resilient_client.FakeBedrockClient does (classification -> "Category E",
+    generation -> SYNTHETIC_ANSWER, retrieval -> `fallback_backend` or
+    synthetic chunks).
+
+    Parameters:
+        cassette_path: JSONL file written by RecordingClient (None = synthesize everything)
+        latency: LatencyModel for invoke_model / retrieve and a stream's first event
+        token_latency: LatencyModel for each following stream event
+        strict: Raise ClientError("ReplayMiss") instead of synthesizing
+        fallback_backend: Retrieval backend answering unrecorded searches
+                          (e.g. hybrid_retrieval.BM25Index over spec-sheets/)
+    """
+
+    def __init__(self, cassette_path=None, latency=NO_LATENCY, token_latency=NO_LATENCY, strict=False,
+                 fallback_backend=None):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.strict = strict
+        self.fallback_backend = fallback_backend
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self._next = {}
+        self._lock = threading.Lock()
+        if cassette_path:
+            self.load(cassette_path)
+
+    def load(self, cassette_path):
+        """Adds a cassette's entries; repeated requests are replayed round-robin."""
+        with open(cassette_path, encoding='utf-8') as cassette:
+            for line in cassette:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.entries.setdefault(entry['key'], []).append(entry)
+
+    def _lookup(self, method, kwargs):
+        key = request_key(method, kwargs)
+        with self._lock:
+            entries = self.entries.get(key)
+            if not entries:
+                self.misses += 1
+                if self.strict:
+                    raise ClientError({'Error': {'Code': 'ReplayMiss', 'Message': f"{method} not in cassette"}},
+                                      method)
+                return None
+            self.hits += 1
+            position = self._next.get(key, 0)
+            self._next[key] = position + 1
+        return entries[position % len(entries)]
+
+    def stats(self):
+        return {'entries': sum(len(entries) for entries in self.entries.values()),
+                'hits': self.hits, 'misses': self.misses}
+
+    # ----- synthesized responses -----
+
+    @staticmethod
+    def _synthesize_text(body):
+        request = json.loads(body)
+        prompt = request['messages'][0]['content'][0]['text']
+        if "Classify the provided user request" in prompt:
+            text = "Category E"
+        elif "<verdict>" in prompt:
+            text = f"<verdict>Category E</verdict>\n<answer>{SYNTHETIC_ANSWER}</answer>"
+        else:
+            text = SYNTHETIC_ANSWER
+        usage = {'input_tokens': len(prompt) // 4, 'output_tokens': max(1, len(text) // 4)}
+        return text, usage
+
+    def _synthesize_chunks(self, query, count, filters=None):
+        if self.fallback_backend is not None:
+            return self.fallback_backend.retrieve(query, number_of_results=count, filters=filters)
+        sentence = f"Spec sheet text about {query.strip('?')}. "
+        text = (sentence * (SYNTHETIC_CHUNK_CHARS // len(sentence) + 1))[:SYNTHETIC_CHUNK_CHARS]
+        return [
+            {
+                'content': {'text': text},
+                'location': {'type': 'S3', 's3Location': {'uri': f"s3://spec-sheets/synthetic-{i}.pdf"}},
+                'score': round(0.9 - 0.05 * i, 4),
+            }
+            for i in range(count)
+        ]
+
+    # ----- client methods -----
+
+    def invoke_model(self, modelId, body, contentType=None, accept=None, **kwargs):
+        entry = self._lookup('invoke_model', {'modelId': modelId, 'body': body})
+        if entry is not None:
+            payload = entry['response']
+        else:
+            text, usage = self._synthesize_text(body)
+            payload = json.dumps({'content': [{'type': 'text', 'text': text}], 'usage': usage})
+        _sleep(self.latency.sample(entry and entry.get('latency')))
+        return {'body': io.BytesIO(payload.encode('utf-8')), 'contentType': 'application/json'}
+
+    def invoke_model_with_response_stream(self, modelId, body, contentType=None, accept=None, **kwargs):
+        entry = self._lookup('invoke_model_with_response_stream', {'modelId': modelId, 'body': body})
+        if entry is not None:
+            messages = [json.loads(message) for message in entry['events']]
+            first, gaps = entry.get('latency'), entry.get('gaps', [])
+        else:
+            text, usage = self._synthesize_text(body)
+            words = text.split(" ")
+            messages = [{'type': 'message_start', 'message': {'usage': {'input_tokens': usage['input_tokens']}}}]
+            messages += [
+                {'type': 'content_block_delta', 'index': 0,
+                 'delta': {'type': 'text_delta', 'text': word if i == len(words) - 1 else word + " "}}
+                for i, word in enumerate(words)
+            ]
+            messages.append({'type': 'message_delta', 'usage': {'output_tokens': usage['output_tokens']}})
+            messages.append({'type': 'message_stop'})
+            first, gaps = None, []
+
+        def events():
+            _sleep(self.latency.sample(first))
+            for i, message in enumerate(messages):
+                if i:
+                    _sleep(self.token_latency.sample(gaps[i - 1] if i - 1 < len(gaps) else None))
+                yield _stream_event(message)
+
+        return {'body': events(), 'contentType': 'application/json'}
+
+    def retrieve(self, knowledgeBaseId, retrievalQuery, retrievalConfiguration=None, **kwargs):
+        entry = self._lookup('retrieve', {'knowledgeBaseId': knowledgeBaseId, 'retrievalQuery': retrievalQuery,
+                                          'retrievalConfiguration': retrievalConfiguration})
+        if entry is not None:
+            response = json.loads(json.dumps(entry['response']))  # Callers may modify the chunks
+        else:
+            vector_config = (retrievalConfiguration or {}).get('vectorSearchConfiguration', {})
+            count = vector_config.get('numberOfResults', 3)
+            filters = _filters_from_bedrock(vector_config.get('filter'))
+            response = {'retrievalResults': self._synthesize_chunks(retrievalQuery['text'], count, filters)}
+        _sleep(self.latency.sample(entry and entry.get('latency')))
+        return response
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Per-turn cost of prompt building and source citations at large top-k and
+large chunk sizes.
+
+One turn is chat.build_rag_prompt over k retrieved chunks followed by
+chat.format_sources over the chunks it used. The chunks are synthetic
+retrievalResults (unique sentences, one S3 file per 4 chunks) and the token
+budget fits all of them, so every chunk is packed, joined and cited.
+Reported per (k, chunk size), as medians over --repeat runs:
+
+    cpu us/turn  - process CPU time per turn
+    peak KiB     - peak memory allocated during one turn (tracemalloc)
+    prompt KiB   - size of the prompt built
+
+Each tree runs in a fresh process. --baseline REV measures another git
+revision (exported with `git archive`, see benchmark_startup.py) as well.
+
+Usage:
+    python scripts/benchmark_chunks.py
+    python scripts/benchmark_chunks.py --baseline HEAD~1 --k 10 100 400 --chunk-chars 1000 8000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmark_startup import REPO_ROOT, export_revision
+
+# Runs inside the measured interpreter: argv[1] is a JSON list of [k, chunk_chars, turns, repeat]
+PROBE = """
+import json, statistics, sys, time, tracemalloc
+import chat
+
+def make_chunks(k, chunk_chars):
+    chunks = []
+    for i in range(k):
+        sentences, size, j = [], 0, 0
+        while size < chunk_chars:
+            sentence = f"Chunk {i} sentence {j} gives the rated load as {i * 7 + j} kg at {j % 9} m."
+            sentences.append(sentence)
+            size += len(sentence) + 1
+            j += 1
+        chunks.append({
+            'content': {'text': " ".join(sentences)[:chunk_chars]},
+            'location': {'type': 'S3', 's3Location': {'uri': f"s3://spec-sheets/machines/spec-{i // 4}.pdf"}},
+            'score': 1.0 - i / (k + 1),
+        })
+    return chunks
+
+def turn(question, chunks, budget):
+    prompt, sources = chat.build_rag_prompt(question, chunks, token_budget=budget)
+    chat.format_sources(sources)
+    return prompt
+
+results = []
+for k, chunk_chars, turns, repeat in json.loads(sys.argv[1]):
+    chunks = make_chunks(k, chunk_chars)
+    budget = k * (chunk_chars // 4 + 20)
+    question = "What is the rated load of the machine?"
+    prompt = turn(question, chunks, budget)  # Warm-up
+    cpu = []
+    for _ in range(repeat):
+        start = time.process_time()
+        for _ in range(turns):
+            turn(question, chunks, budget)
+        cpu.append(1e6 * (time.process_time() - start) / turns)
+    peaks = []
+    for _ in range(repeat):
+        tracemalloc.start()
+        turn(question, chunks, budget)
+        peaks.append(tracemalloc.get_traced_memory()[1] / 1024)
+        tracemalloc.stop()
+    results.append({'k': k, 'chunk_chars': chunk_chars, 'cpu_us': statistics.median(cpu),
+                    'peak_kib': statistics.median(peaks), 'prompt_kib': len(prompt) / 1024})
+print(json.dumps(results))
+"""
+
+
+def measure(tree, cases):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.join(tree, "scripts"), tree]))
+    result = subprocess.run([sys.executable, "-c", PROBE, json.dumps(cases)], cwd=tree, env=env,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"probe failed in {tree}:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU and memory per turn of prompt building and citations")
+    parser.add_argument('--k', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--chunk-chars', type=int, nargs='+', default=[1000, 4000, 16000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--baseline', metavar="REV", help="Git revision to compare against, e.g. HEAD~1")
+    args = parser.parse_args()
+
+    # Fewer turns for the big cases keeps every case at a similar wall time
+    cases = [[k, chunk_chars, max(1, 2_000_000 // (k * chunk_chars)), args.repeat]
+             for k in args.k for chunk_chars in args.chunk_chars]
+    rows = []
+    if args.baseline:
+        with tempfile.TemporaryDirectory() as tree:
+            export_revision(args.baseline, tree)
+            rows.append((args.baseline, measure(tree, cases)))
+    rows.append(("working tree", measure(REPO_ROOT, cases)))
+
+    print(f"median of {args.repeat} runs per case, all chunks fit the token budget\n")
+    print(f"{'tree':<14} {'k':>5} {'chunk chars':>12} {'cpu us/turn':>12} {'peak KiB':>9} {'prompt KiB':>11}")
+    for label, results in rows:
+        for result in results:
+            print(f"{label:<14} {result['k']:>5} {result['chunk_chars']:>12} {result['cpu_us']:>12.0f} "
+                  f"{result['peak_kib']:>9.0f} {result['prompt_kib']:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Prompt size benchmark: full-chunk concatenation vs token-budgeted packing.
+
+Retrieves the top-k chunks for each labelled question (BM25 over
+spec-sheets/, no AWS needed) and builds the RAG prompt two ways:
+
+    legacy - every chunk in full, joined with repeated string +=
+             (chat.build_rag_prompt before context packing)
+    packed - context_packer.pack_context with --budget tokens
+
+For each k it reports the mean prompt size in characters and estimated
+tokens, the chunks that made it in, and the assembly time per prompt.
+
+Usage:
+    python scripts/benchmark_context.py
+    python scripts/benchmark_context.py --k 3 10 20 50 --budget 1000
+"""
+import argparse
+import time
+
+from benchmark_hybrid import LABELLED_QUESTIONS
+from context_packer import CONTEXT_TOKEN_BUDGET, estimate_tokens, format_context, pack_context
+from hybrid_retrieval import BM25Index
+from spec_corpus import load_chunks
+
+# Same template as chat.build_rag_prompt
+PROMPT_TEMPLATE = """Human: You are an expert assistant on heavy machinery.
+    Use the following pieces of context to answer the user's question.
+    If you don't know the answer, just say that you don't know, don't try to make up an answer.
+
+    <context>
+    {context}
+    </context>
+
+    <question>
+    {question}
+    </question>
+
+    Assistant:
+    """
+
+
+def legacy_prompt(question, context_chunks):
+    context_text = ""
+    for i, chunk in enumerate(context_chunks):
+        context_text += f"Chunk {i+1}:\n{chunk['content']['text']}\n\n"
+    return PROMPT_TEMPLATE.format(context=context_text, question=question), len(context_chunks)
+
+
+def packed_prompt(question, context_chunks, budget):
+    packed, _ = pack_context(context_chunks, budget)
+    return PROMPT_TEMPLATE.format(context=format_context(packed), question=question), len(packed)
+
+
+def measure(build, retrieved, repeats):
+    chars = tokens = used = 0
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for question, chunks in retrieved:
+            prompt, count = build(question, chunks)
+    elapsed = time.perf_counter() - start
+    for question, chunks in retrieved:
+        prompt, count = build(question, chunks)
+        chars += len(prompt)
+        tokens += estimate_tokens(prompt)
+        used += count
+    n = len(retrieved)
+    return chars / n, tokens / n, used / n, 1e6 * elapsed / (repeats * n)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare prompt size and assembly time")
+    parser.add_argument('--k', type=int, nargs='+', default=[3, 10, 20, 50])
+    parser.add_argument('--budget', type=int, default=CONTEXT_TOKEN_BUDGET)
+    parser.add_argument('--repeats', type=int, default=200)
+    args = parser.parse_args()
+
+    bm25 = BM25Index(load_chunks())
+    print(f"{len(LABELLED_QUESTIONS)} questions, budget {args.budget} tokens\n")
+    print(f"{'k':>4} {'method':>7} {'chars':>8} {'~tokens':>8} {'chunks':>7} {'us/prompt':>10}")
+    for k in args.k:
+        retrieved = [(question, bm25.retrieve(question, k)) for question, _ in LABELLED_QUESTIONS]
+        for label, build in (
+            ("legacy", legacy_prompt),
+            ("packed", lambda question, chunks: packed_prompt(question, chunks, args.budget)),
+        ):
+            chars, tokens, used, micros = measure(build, retrieved, args.repeats)
+            print(f"{k:>4} {label:>7} {chars:>8.0f} {tokens:>8.0f} {used:>7.1f} {micros:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Metadata filter benchmark: machine-model filtered vs unfiltered retrieval.
+
+Two parts:
+
+    quality - every labelled question (benchmark_hybrid.py) goes through
+              bedrock_utils.query_knowledge_base on a local engine, once with
+              AUTO_MODEL_FILTER off and once on. Reported: precision@3 (share
+              of the top 3 chunks from a correct document) and hit rate
+              (a correct document in the top 3).
+    latency - the corpus is copied --copies times, each copy tagged with its
+              own machine models, and searched with LocalVectorIndex three ways:
+                  unfiltered   - IVF search over the whole index
+                  post-filter  - IVF search, over-fetch, then drop other models
+                                 (what a filter costs without partitions)
+                  partitioned  - exact search over the requested models' rows
+              Reported: ms/query and how often the top 3 was filled.
+
+Usage:
+    python scripts/benchmark_filters.py
+    python scripts/benchmark_filters.py --copies 500 --repeat 5
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import bedrock_utils
+from benchmark_hybrid import LABELLED_QUESTIONS, ExactVectorIndex
+from embedders import HashingEmbedder
+from hybrid_retrieval import BM25Index, HybridRetriever
+from local_index import LocalVectorIndex, spherical_kmeans
+from spec_corpus import GENERAL_MODEL, load_chunks, matches_filters
+
+
+def evaluate(engine):
+    """(precision@3, hit rate) of query_knowledge_base with `engine` as the retrieval backend."""
+    bedrock_utils.set_retrieval_backend(engine)
+    precision, hits = [], 0
+    for question, expected in LABELLED_QUESTIONS:
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = bedrock_utils.query_knowledge_base(question)
+        sources = [result['metadata']['source_file'] for result in results[:3]]
+        precision.append(sum(source in expected for source in sources) / 3)
+        hits += any(source in expected for source in sources)
+    return np.mean(precision), hits / len(LABELLED_QUESTIONS)
+
+
+def run_quality(chunks, embedder):
+    bm25 = BM25Index(chunks)
+    vector = ExactVectorIndex(chunks, embedder)
+    engines = [bm25, vector, HybridRetriever(bm25, vector)]
+
+    print(f"{len(chunks)} chunks, {len(LABELLED_QUESTIONS)} labelled questions\n")
+    print(f"{'engine':>8} {'filter':>7} {'precision@3':>12} {'hit rate':>9}")
+    for engine in engines:
+        for auto_filter in (False, True):
+            bedrock_utils.AUTO_MODEL_FILTER = auto_filter
+            bedrock_utils._unfilterable_models.clear()
+            precision, hit_rate = evaluate(engine)
+            print(f"{engine.name:>8} {'on' if auto_filter else 'off':>7} {precision:>12.3f} {hit_rate:>9.3f}")
+    bedrock_utils.set_retrieval_backend(None)
+
+
+def scaled_index(chunks, embedder, copies, seed=0):
+    """
+    LocalVectorIndex over `copies` copies of the corpus; copy i tags its
+    chunks "<model>-<i>" (copy 0 keeps the real tags), vectors get a little noise.
+    """
+    rng = np.random.default_rng(seed)
+    base = embedder.embed_batch([chunk['text'] for chunk in chunks]).astype(np.float32)
+    vectors = np.tile(base, (copies, 1))
+    vectors += rng.normal(0, 0.01, vectors.shape).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    scaled_chunks = []
+    for copy in range(copies):
+        for chunk in chunks:
+            metadata = dict(chunk['metadata'])
+            if copy:
+                metadata['machine_model'] = f"{metadata['machine_model']}-{copy}"
+            scaled_chunks.append({'text': chunk['text'], 'metadata': metadata})
+
+    n_clusters = max(1, int(np.sqrt(len(scaled_chunks))))
+    centroids, labels = spherical_kmeans(vectors, n_clusters, iterations=5)
+    order = np.argsort(labels, kind='stable')
+    offsets = np.searchsorted(labels[order], np.arange(n_clusters + 1))
+    return LocalVectorIndex(vectors[order], centroids, offsets, [scaled_chunks[i] for i in order], embedder)
+
+
+def run_latency(chunks, embedder, copies, repeat):
+    index = scaled_index(chunks, embedder, copies)
+    queries = []
+    for question, _ in LABELLED_QUESTIONS:
+        filters = bedrock_utils.model_filters(question) or {'machine_model': [GENERAL_MODEL]}
+        queries.append((embedder(question), filters))
+
+    def unfiltered(vector, filters):
+        return index.search_batch([vector], 3)[0]
+
+    def post_filter(vector, filters):
+        kept = [(row, score) for row, score in index.search_batch([vector], 30)[0]
+                if matches_filters(index.chunks[row]['metadata'], filters)]
+        return kept[:3]
+
+    def partitioned(vector, filters):
+        return index.search_partitions(vector, filters['machine_model'], 3)
+
+    print(f"\n{len(index.chunks)} chunks ({copies} copies, {len(index.partitions)} machine models), "
+          f"{len(queries)} queries x {repeat}\n")
+    print(f"{'search':>12} {'ms/query':>9} {'top 3 filled':>13}")
+    for name, search in (("unfiltered", unfiltered), ("post-filter", post_filter), ("partitioned", partitioned)):
+        filled = 0
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for vector, filters in queries:
+                filled += len(search(vector, filters)) == 3
+        elapsed = time.perf_counter() - start
+        total = repeat * len(queries)
+        print(f"{name:>12} {1000 * elapsed / total:>9.3f} {filled / total:>13.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Filtered vs unfiltered retrieval quality and latency")
+    parser.add_argument('--copies', type=int, default=200, help="Corpus copies in the latency index")
+    parser.add_argument('--repeat', type=int, default=3, help="Passes over the questions per latency run")
+    args = parser.parse_args()
+
+    chunks = load_chunks()
+    embedder = HashingEmbedder()
+    run_quality(chunks, embedder)
+    run_latency(chunks, embedder, args.copies, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Retrieval quality benchmark: BM25 vs vector vs hybrid (RRF) over spec-sheets/.
+
+Each question is labelled with the document(s) that answer it. For every
+engine the script reports:
+    precision@3 - share of the top 3 chunks that come from a correct document
+    recall@k    - share of questions with a correct document in the top k
+    ms/query    - mean retrieval time
+
+The vector side is an exact in-memory cosine search, embedded with the local
+hashing embedder by default or Titan (--embedder titan, needs AWS).
+
+Usage:
+    python scripts/benchmark_hybrid.py
+    python scripts/benchmark_hybrid.py --embedder titan --k 1 3 5 10
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from embedders import HashingEmbedder, TitanEmbedder
+from hybrid_retrieval import BM25Index, HybridRetriever
+from spec_corpus import load_chunks, matches_filters, to_retrieval_result
+
+# (question, documents that answer it)
+LABELLED_QUESTIONS = [
+    ("What is the operating weight of the BD850?", {"bulldozer-bd850-spec-sheet.pdf"}),
+    ("What is the blade capacity of the BD850 bulldozer?", {"bulldozer-bd850-spec-sheet.pdf"}),
+    ("What is the payload capacity of the DT1000?", {"dump-truck-dt1000-spec-sheet.pdf"}),
+    ("How much engine power does the DT1000 have?", {"dump-truck-dt1000-spec-sheet.pdf"}),
+    ("What is the maximum lift height of the FL250?", {"forklift-fl250-spec-sheet.pdf"}),
+    ("How much weight can the FL250 lift?", {"forklift-fl250-spec-sheet.pdf"}),
+    ("What is the maximum boom length of the MC750?", {"mobile-crane-mc750-spec-sheet.pdf"}),
+    ("MC750 maximum lifting capacity", {"mobile-crane-mc750-spec-sheet.pdf"}),
+    ("What is the operating weight of the LE950 excavator?", {"excavator-x950-spec-sheet.pdf"}),
+    ("LE950 engine power", {"excavator-x950-spec-sheet.pdf"}),
+    ("What PPE is required when working near mobile equipment?", {"safety_procedures.txt"}),
+    ("How do I perform lockout/tagout before maintenance?",
+     {"safety_procedures.txt", "sample_machine_manual.txt"}),
+    ("What is the processing speed of the XL-2000?", {"sample_machine_manual.txt"}),
+    ("What are the hardware requirements for the Industrial Control Software?",
+     {"software_documentation.md"}),
+    ("Which operating systems does ICS v4.2 support?", {"software_documentation.md"}),
+]
+
+
+class ExactVectorIndex:
+    """Brute-force cosine search over all chunk embeddings."""
+
+    name = "vector"
+
+    def __init__(self, chunks, embedder):
+        self.chunks = chunks
+        self.embedder = embedder
+        self.matrix = embedder.embed_batch([chunk['text'] for chunk in chunks])
+
+    def retrieve(self, query, number_of_results=3, filters=None):
+        scores = self.matrix @ self.embedder(query)
+        if filters:
+            scores[[not matches_filters(chunk['metadata'], filters) for chunk in self.chunks]] = -np.inf
+        top = [i for i in np.argsort(-scores)[:number_of_results] if scores[i] > -np.inf]
+        return [
+            to_retrieval_result(self.chunks[i]['text'], self.chunks[i]['metadata'], float(scores[i]))
+            for i in top
+        ]
+
+
+def evaluate(engine, ks):
+    max_k = max(ks + [3])
+    precision, hits, elapsed = [], {k: 0 for k in ks}, 0.0
+    for question, expected in LABELLED_QUESTIONS:
+        start = time.perf_counter()
+        results = engine.retrieve(question, max_k)
+        elapsed += time.perf_counter() - start
+        sources = [result['metadata']['source_file'] for result in results]
+        precision.append(sum(source in expected for source in sources[:3]) / 3)
+        for k in ks:
+            hits[k] += any(source in expected for source in sources[:k])
+
+    row = f"{engine.name:>8} {np.mean(precision):>12.3f}"
+    for k in ks:
+        row += f" {hits[k] / len(LABELLED_QUESTIONS):>9.3f}"
+    return row + f" {1000 * elapsed / len(LABELLED_QUESTIONS):>9.2f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare BM25, vector and hybrid retrieval")
+    parser.add_argument('--embedder', choices=['hashing', 'titan'], default='hashing')
+    parser.add_argument('--k', type=int, nargs='+', default=[1, 3, 5])
+    args = parser.parse_args()
+
+    chunks = load_chunks()
+    embedder = TitanEmbedder() if args.embedder == 'titan' else HashingEmbedder()
+    bm25 = BM25Index(chunks)
+    vector = ExactVectorIndex(chunks, embedder)
+    hybrid = HybridRetriever(bm25, vector)
+
+    print(f"{len(chunks)} chunks, {len(LABELLED_QUESTIONS)} labelled questions, "
+          f"{embedder.name} embeddings\n")
+    header = f"{'engine':>8} {'precision@3':>12}" + "".join(f" {'recall@' + str(k):>9}" for k in args.k)
+    print(header + f" {'ms/query':>9}")
+    for engine in (bm25, vector, hybrid):
+        print(evaluate(engine, args.k))
+
+
+if __name__ == "__main__":
+    main()
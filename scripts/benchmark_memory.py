@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Multi-turn benchmark for conversation memory (scripts/conversation_memory.py).
+
+Plays scripted conversations full of follow-ups ("How heavy is it?",
+"And the BD850?") through chat.get_rag_response_stream on the offline fake
+backend (bedrock_fake.ReplayClient, BM25 over spec-sheets/ for retrieval).
+Every session is run three ways:
+
+    stateless     - each message on its own (chat.py before memory)
+    full_history  - the whole transcript in every prompt, messages not rewritten
+    memory        - ConversationMemory: rewritten queries, summarized
+                    history, chunk reuse
+
+Reported per strategy: retrieval hit rate (the expected spec sheet among the
+cited sources), Knowledge Base calls, retrieved chunk tokens, prompt tokens
+sent for generation and summarizer calls.
+
+Usage:
+    python scripts/benchmark_memory.py
+    python scripts/benchmark_memory.py --history-tokens 150 --repeat 3
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import bedrock_utils
+import chat
+from bedrock_fake import NO_LATENCY, ReplayClient
+from context_packer import estimate_tokens
+from conversation_memory import HISTORY_TOKENS, ConversationMemory
+from hybrid_retrieval import BM25Index
+from spec_corpus import load_chunks
+
+BD850 = "bulldozer-bd850-spec-sheet.pdf"
+DT1000 = "dump-truck-dt1000-spec-sheet.pdf"
+FL250 = "forklift-fl250-spec-sheet.pdf"
+MC750 = "mobile-crane-mc750-spec-sheet.pdf"
+
+# (message, spec sheet that should be cited)
+CONVERSATIONS = [
+    [("What is the payload capacity of the DT1000?", DT1000),
+     ("How much engine power does it have?", DT1000),
+     ("And its top speed?", DT1000),
+     ("What about the BD850?", BD850),
+     ("What is its operating weight?", BD850),
+     ("And the blade capacity?", BD850)],
+    [("What is the maximum lift height of the FL250?", FL250),
+     ("How much weight can it lift?", FL250),
+     ("What engine does it use?", FL250),
+     ("And the MC750?", MC750),
+     ("What is its maximum boom length?", MC750),
+     ("How much can it lift?", MC750)],
+    [("What is the operating weight of the BD850?", BD850),
+     ("What is its blade capacity?", BD850),
+     ("And the DT1000?", DT1000),
+     ("What is its payload capacity?", DT1000),
+     ("How much fuel does it hold?", DT1000)],
+]
+
+
+class FullHistory(ConversationMemory):
+    """Baseline: every earlier turn verbatim in the prompt, no rewriting, summaries or reuse."""
+
+    def __init__(self):
+        super().__init__(summarizer=None, history_tokens=10 ** 9, max_pool_chunks=0)
+
+    def rewrite(self, query):
+        return query
+
+
+STRATEGIES = {
+    "stateless": lambda history_tokens: None,
+    "full_history": lambda history_tokens: FullHistory(),
+    "memory": lambda history_tokens: ConversationMemory(history_tokens=history_tokens),
+}
+
+
+def install_backend():
+    bedrock_utils.set_clients(ReplayClient(latency=NO_LATENCY),
+                              ReplayClient(latency=NO_LATENCY, fallback_backend=BM25Index(load_chunks())),
+                              resilient=False)
+
+
+def run_strategy(name, history_tokens, repeat):
+    totals = {'turns': 0, 'hits': 0, 'kb_calls': 0, 'retrieved_tokens': 0, 'prompt_tokens': 0, 'summaries': 0}
+    query_knowledge_base = chat.query_knowledge_base
+
+    def counting_retrieve(query):
+        chunks = query_knowledge_base(query)
+        totals['kb_calls'] += 1
+        totals['retrieved_tokens'] += sum(estimate_tokens(chunk['content']['text']) for chunk in chunks)
+        return chunks
+
+    chat.query_knowledge_base = counting_retrieve
+    try:
+        for _ in range(repeat):
+            for conversation in CONVERSATIONS:
+                memory = STRATEGIES[name](history_tokens)
+                for message, expected in conversation:
+                    metrics = {}
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        reply = "".join(chat.get_rag_response_stream(message, "sequential", metrics=metrics,
+                                                                     memory=memory))
+                    totals['turns'] += 1
+                    totals['hits'] += expected in reply.rpartition("Sources:")[2]
+                    totals['prompt_tokens'] += metrics.get('prompt_tokens', 0)
+                if memory is not None:
+                    totals['summaries'] += memory.stats()['summaries']
+    finally:
+        chat.query_knowledge_base = query_knowledge_base
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stateless vs full history vs conversation memory")
+    parser.add_argument('--history-tokens', type=int, default=HISTORY_TOKENS,
+                        help="ConversationMemory history budget (lower it to exercise summarization)")
+    parser.add_argument('--repeat', type=int, default=1, help="Play every conversation this many times")
+    args = parser.parse_args()
+
+    install_backend()
+    chat.set_answer_cache(None)
+    turns = sum(len(conversation) for conversation in CONVERSATIONS) * args.repeat
+    print(f"{len(CONVERSATIONS) * args.repeat} conversations, {turns} turns, "
+          f"history budget {args.history_tokens} tokens\n")
+    print(f"{'strategy':<13} {'hit rate':>8} {'KB calls':>9} {'retrieved tok':>14} "
+          f"{'prompt tok':>11} {'summaries':>10}")
+    for name in STRATEGIES:
+        totals = run_strategy(name, args.history_tokens, args.repeat)
+        print(f"{name:<13} {totals['hits'] / totals['turns']:>8.0%} {totals['kb_calls']:>9} "
+              f"{totals['retrieved_tokens']:>14} {totals['prompt_tokens']:>11} {totals['summaries']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the direct pgvector retrieval backend.
+
+Loads N random 1536-dimensional vectors into a scratch copy of the
+ahmad_knowledge_base table (same columns and HNSW cosine index as
+aurora_sql.sql), then measures query latency and recall@k against an exact
+NumPy search for several ef_search values.
+
+Start a local Postgres with pgvector first, e.g.:
+    docker run -d --name pgvector -e POSTGRES_PASSWORD=postgres -p 5432:5432 pgvector/pgvector:pg16
+
+Usage:
+    PGHOST=localhost PGUSER=postgres PGPASSWORD=postgres python scripts/benchmark_pgvector.py
+    python scripts/benchmark_pgvector.py --rows 50000 --queries 200 --top-k 3 10 --ef-search 20 40 100 200
+"""
+
+import argparse
+import time
+import uuid
+
+import numpy as np
+from psycopg2.extras import Json, execute_values
+
+from pgvector_retrieval import PgVectorRetriever, SOURCE_URI_KEY, vector_literal
+
+BENCH_TABLE = "ahmad_bedrock_schema.ahmad_knowledge_base_bench"
+DIMENSIONS = 1536  # Titan Embeddings G1 - Text
+
+
+def create_table(retriever):
+    with retriever.connection() as conn, conn.cursor() as cursor:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS vector")
+        cursor.execute("CREATE SCHEMA IF NOT EXISTS ahmad_bedrock_schema")
+        cursor.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+        cursor.execute(
+            f"CREATE TABLE {BENCH_TABLE} ("
+            f" id uuid PRIMARY KEY, embedding vector({DIMENSIONS}), chunks text, metadata json)"
+        )
+
+
+def load_rows(retriever, vectors, batch_size=500):
+    """Inserts the vectors, then builds the HNSW index (faster than indexing row by row)."""
+    machines = ["bd850", "dt1000", "x950", "fl250", "mc750"]
+    for start in range(0, len(vectors), batch_size):
+        rows = [
+            (
+                str(uuid.uuid4()),
+                vector_literal(vector),
+                f"Synthetic chunk {start + i}",
+                Json({SOURCE_URI_KEY: f"s3://bench/{machines[(start + i) % 5]}-spec-sheet.pdf"}),
+            )
+            for i, vector in enumerate(vectors[start:start + batch_size])
+        ]
+        with retriever.connection() as conn, conn.cursor() as cursor:
+            execute_values(
+                cursor,
+                f"INSERT INTO {BENCH_TABLE} (id, embedding, chunks, metadata) VALUES %s",
+                rows,
+                template="(%s, %s::vector, %s, %s)"
+            )
+
+    with retriever.connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            f"CREATE INDEX ON {BENCH_TABLE} USING hnsw (embedding vector_cosine_ops)"
+        )
+        cursor.execute(f"ANALYZE {BENCH_TABLE}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark direct pgvector retrieval")
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--top-k', type=int, nargs='+', default=[3, 10])
+    parser.add_argument('--ef-search', type=int, nargs='+', default=[20, 40, 100, 200])
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    vectors = rng.standard_normal((args.rows, DIMENSIONS)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    # Queries near existing rows, like real questions near their answer chunk
+    queries = vectors[rng.integers(0, args.rows, args.queries)] \
+        + 0.05 * rng.standard_normal((args.queries, DIMENSIONS)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    retriever = PgVectorRetriever(embedder=lambda text: None, table=BENCH_TABLE)
+    print(f"Loading {args.rows} vectors into {BENCH_TABLE}...")
+    start = time.perf_counter()
+    create_table(retriever)
+    load_rows(retriever, vectors)
+    print(f"Loaded and indexed in {time.perf_counter() - start:.1f}s\n")
+
+    # Exact neighbours for recall, keyed by chunk text
+    exact = np.argsort(-(queries @ vectors.T), axis=1)
+
+    print(f"{'top_k':>6} {'ef_search':>10} {'p50 ms':>8} {'p99 ms':>8} {'qps':>8} {'recall':>7}")
+    for top_k in args.top_k:
+        for ef_search in args.ef_search:
+            latencies, recalls = [], []
+            for i, query in enumerate(queries):
+                t0 = time.perf_counter()
+                results = retriever.search(query, top_k, ef_search=ef_search)
+                latencies.append((time.perf_counter() - t0) * 1000)
+                found = {result['content']['text'] for result in results}
+                expected = {f"Synthetic chunk {j}" for j in exact[i, :top_k]}
+                recalls.append(len(found & expected) / top_k)
+            latencies.sort()
+            print(f"{top_k:>6} {ef_search:>10} {latencies[len(latencies) // 2]:>8.2f} "
+                  f"{latencies[int(len(latencies) * 0.99) - 1]:>8.2f} "
+                  f"{1000 * len(latencies) / sum(latencies):>8.1f} {np.mean(recalls):>7.3f}")
+
+    with retriever.connection() as conn, conn.cursor() as cursor:
+        cursor.execute(f"DROP TABLE {BENCH_TABLE}")
+    retriever.close()
+
+
+if __name__ == "__main__":
+    main()
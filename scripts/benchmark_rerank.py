@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Rerank benchmark: fixed top-3 vs over-fetch + rerank + adaptive k.
+
+Runs the labelled questions from benchmark_hybrid.py against a base
+retriever (hashing-embedded vector search, or BM25 with --base bm25) and
+reports, per pipeline:
+
+    precision - share of the chunks sent to the model that come from a correct document
+    hit rate  - share of questions with at least one correct chunk
+    chunks    - mean chunks sent to the model
+    ~tokens   - mean estimated context tokens (what generation pays for)
+    ms        - mean retrieval + rerank time
+
+Usage:
+    python scripts/benchmark_rerank.py
+    python scripts/benchmark_rerank.py --base bm25 --candidates 20
+"""
+import argparse
+import time
+
+from benchmark_hybrid import LABELLED_QUESTIONS, ExactVectorIndex
+from context_packer import estimate_tokens
+from embedders import HashingEmbedder
+from hybrid_retrieval import BM25Index
+from reranking import RERANK_CANDIDATES, LexicalOverlapReranker, RerankStage
+from spec_corpus import load_chunks
+
+
+def evaluate(label, retrieve):
+    precision = hits = chunks_sent = tokens = elapsed = 0.0
+    for question, expected in LABELLED_QUESTIONS:
+        start = time.perf_counter()
+        results = retrieve(question)
+        elapsed += time.perf_counter() - start
+        correct = [result['metadata']['source_file'] in expected for result in results]
+        precision += sum(correct) / len(results) if results else 0.0
+        hits += any(correct)
+        chunks_sent += len(results)
+        tokens += sum(estimate_tokens(result['content']['text']) for result in results)
+
+    n = len(LABELLED_QUESTIONS)
+    print(f"{label:>22} {precision / n:>10.3f} {hits / n:>9.3f} {chunks_sent / n:>7.2f} "
+          f"{tokens / n:>8.0f} {1000 * elapsed / n:>7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare fixed top-3 with rerank + adaptive k")
+    parser.add_argument('--base', choices=['vector', 'bm25'], default='vector')
+    parser.add_argument('--candidates', type=int, default=RERANK_CANDIDATES)
+    args = parser.parse_args()
+
+    chunks = load_chunks()
+    base = BM25Index(chunks) if args.base == 'bm25' else ExactVectorIndex(chunks, HashingEmbedder())
+    reranker = LexicalOverlapReranker()
+
+    print(f"Base retriever: {base.name}, {args.candidates} candidates\n")
+    print(f"{'pipeline':>22} {'precision':>10} {'hit rate':>9} {'chunks':>7} {'~tokens':>8} {'ms':>7}")
+    evaluate("top-3", lambda question: base.retrieve(question, 3))
+    for cutoff in ("gap", "cumulative"):
+        stage = RerankStage(reranker, candidates=args.candidates, cutoff=cutoff)
+        evaluate(f"rerank + {cutoff}",
+                 lambda question: stage.apply(question, base.retrieve(question, stage.candidates)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Resilience benchmark: raw client vs ResilientClient under injected faults.
+
+Sends --calls KB retrieve requests from --threads threads to a fake client
+that throttles --throttle-rate of the calls and makes --slow-rate of them
+--slow-seconds slower. Reports, for the raw client, retries only, and
+retries + hedging:
+
+    ok %      - calls that returned a result
+    p50 / p99 - latency in ms of the successful calls
+    requests  - requests that reached the fake client per call
+
+Usage:
+    python scripts/benchmark_resilience.py
+    python scripts/benchmark_resilience.py --throttle-rate 0.3 --slow-rate 0.1
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from resilient_client import FakeBedrockClient, FaultInjectingClient, ResilientClient
+
+
+def run(client, calls, threads):
+    latencies, failures = [], 0
+
+    def one(i):
+        start = time.perf_counter()
+        try:
+            client.retrieve(knowledgeBaseId="kb", retrievalQuery={'text': f"question {i}"})
+        except ClientError:
+            return None
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for result in pool.map(one, range(calls)):
+            if result is None:
+                failures += 1
+            else:
+                latencies.append(result)
+    latencies.sort()
+    return latencies, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure retries and hedging against injected faults")
+    parser.add_argument('--calls', type=int, default=400)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--throttle-rate', type=float, default=0.2)
+    parser.add_argument('--slow-rate', type=float, default=0.03)
+    parser.add_argument('--slow-seconds', type=float, default=1.0)
+    args = parser.parse_args()
+
+    print(f"{args.calls} calls, {args.threads} threads, {args.throttle_rate:.0%} throttled, "
+          f"{args.slow_rate:.0%} +{args.slow_seconds}s\n")
+    print(f"{'client':>18} {'ok %':>6} {'p50 ms':>7} {'p99 ms':>7} {'requests':>9}")
+    for label, hedge in (("raw", None), ("retries", False), ("retries + hedging", True)):
+        faulty = FaultInjectingClient(FakeBedrockClient(args.latency), args.throttle_rate,
+                                      slow_rate=args.slow_rate, slow_seconds=args.slow_seconds, seed=7)
+        client = faulty if hedge is None else ResilientClient(
+            faulty, base_delay=0.05, deadline=10, hedge_methods=("retrieve",) if hedge else ()
+        )
+        latencies, failures = run(client, args.calls, args.threads)
+        p50 = 1000 * latencies[len(latencies) // 2] if latencies else 0
+        p99 = 1000 * latencies[int(0.99 * (len(latencies) - 1))] if latencies else 0
+        print(f"{label:>18} {100 * (1 - failures / args.calls):>6.1f} {p50:>7.0f} {p99:>7.0f} "
+              f"{faulty.calls / args.calls:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
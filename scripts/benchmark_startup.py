@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark: how long a fresh process takes to `import chat`.
+
+Each run is a new interpreter, so nothing is cached in memory (the OS file
+cache is warm after the first run, as it is for a CLI started repeatedly).
+Reported, as medians over --runs:
+
+    process ms      - a whole `python -c "import chat"` run, interpreter start
+                      included (a CLI path that never calls Bedrock)
+    import chat ms  - the import itself
+    first client ms - building the bedrock-runtime client on first use
+                      (0 when the import already built it)
+
+--baseline REV measures the same for another git revision (exported with
+`git archive`) to show the change side by side.
+
+Usage:
+    python scripts/benchmark_startup.py
+    python scripts/benchmark_startup.py --baseline HEAD~1 --runs 15
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# Runs inside the measured interpreter; works with eager (old) and lazy clients
+PROBE = """
+import json, time
+start = time.perf_counter()
+import chat
+imported = time.perf_counter()
+import bedrock_utils
+getattr(bedrock_utils, 'runtime_client', lambda: bedrock_utils.bedrock)()
+built = time.perf_counter()
+print(json.dumps({'import_ms': 1000 * (imported - start), 'first_client_ms': 1000 * (built - imported)}))
+"""
+
+
+def _run(tree, env, code):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", code], cwd=tree, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"probe failed in {tree}:\n{result.stderr}")
+    return 1000 * (time.perf_counter() - start), result.stdout
+
+
+def measure(tree, runs):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.join(tree, "scripts"), tree]))
+    env.setdefault('AWS_DEFAULT_REGION', "us-east-1")
+    samples = []
+    for _ in range(runs):
+        process_ms, _ = _run(tree, env, "import chat")
+        _, output = _run(tree, env, PROBE)
+        sample = json.loads(output.strip().splitlines()[-1])
+        sample['process_ms'] = process_ms
+        samples.append(sample)
+    return {key: statistics.median(sample[key] for sample in samples)
+            for key in ('process_ms', 'import_ms', 'first_client_ms')}
+
+
+def export_revision(revision, target):
+    """Writes the files of `revision` into `target` (no .git needed there)."""
+    archive = subprocess.run(["git", "archive", "--format=tar", revision], cwd=REPO_ROOT,
+                             capture_output=True, check=True).stdout
+    archive_path = os.path.join(target, "tree.tar")
+    with open(archive_path, 'wb') as archive_file:
+        archive_file.write(archive)
+    with tarfile.open(archive_path) as tar:
+        tar.extractall(target)
+    os.remove(archive_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold start of `import chat`")
+    parser.add_argument('--runs', type=int, default=11)
+    parser.add_argument('--baseline', metavar="REV", help="Git revision to compare against, e.g. HEAD~1")
+    args = parser.parse_args()
+
+    rows = []
+    if args.baseline:
+        with tempfile.TemporaryDirectory() as tree:
+            export_revision(args.baseline, tree)
+            rows.append((args.baseline, measure(tree, args.runs)))
+    rows.append(("working tree", measure(REPO_ROOT, args.runs)))
+
+    print(f"median of {args.runs} fresh processes\n")
+    print(f"{'tree':<14} {'process ms':>11} {'import chat ms':>15} {'first client ms':>16}")
+    for label, result in rows:
+        print(f"{label:<14} {result['process_ms']:>11.0f} {result['import_ms']:>15.0f} "
+              f"{result['first_client_ms']:>16.0f}")
+
+
+if __name__ == "__main__":
+    main()
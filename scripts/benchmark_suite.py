@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark suite for the chat pipeline.
+
+Runs against bedrock_fake.ReplayClient instead of AWS: responses come from
+a recorded cassette (--cassette) or are synthesized, retrieval falls back to
+BM25 over spec-sheets/, and latencies are drawn from the given distributions.
+
+    micro     - build_rag_prompt at several top-k, response body parsing,
+                stream event parsing, guard-and-answer parsing, source footer
+    scenarios - full chat turns (chat.get_rag_response_stream) in each
+                execution / guard mode, and N concurrent sessions:
+                turns/sec, p50/p95/p99 turn latency, time to first token
+
+Results are written as JSON (--output) so two commits can be compared
+(--compare baseline.json flags anything more than --threshold worse).
+
+Usage:
+    python scripts/benchmark_suite.py --output results.json
+    python scripts/benchmark_suite.py --compare results.json
+    python scripts/benchmark_suite.py --invoke-latency lognormal:0.6,0.4 --sessions 1 10 50
+    python scripts/benchmark_suite.py --record cassette.jsonl      # needs AWS
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import bedrock_utils
+import chat
+from bedrock_fake import LatencyModel, RecordingClient, ReplayClient
+from benchmark_hybrid import LABELLED_QUESTIONS
+from hybrid_retrieval import BM25Index
+from prompt_guard import GuardedStreamParser, parse_guarded_response
+from spec_corpus import load_chunks
+
+# Metrics where a larger value is better; everything else is a latency
+HIGHER_IS_BETTER = {"turns_per_sec"}
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else None
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+# ----- microbenchmarks -----
+
+def time_call(func, repeats, number):
+    """Median and best microseconds per call over `repeats` batches of `number` calls."""
+    func()  # Warm-up: imports, regex compilation, first-call allocations
+    batches = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        batches.append(1e6 * (time.perf_counter() - start) / number)
+    return {"us_per_call": round(_percentile(batches, 0.5), 3), "best_us": round(min(batches), 3)}
+
+
+def run_micro(bm25, repeats, number):
+    question = LABELLED_QUESTIONS[0][0]
+    results = {}
+    for k in (3, 10, 50):
+        chunks = bm25.retrieve(question, k)
+        results[f"build_rag_prompt_k{k}"] = time_call(lambda: chat.build_rag_prompt(question, chunks), repeats, number)
+
+    replay = ReplayClient(fallback_backend=bm25)
+    sources = bm25.retrieve(question, 10)
+    body = bedrock_utils.build_generation_body("What is the payload of the DT1000?")
+    response_body = replay.invoke_model(modelId=bedrock_utils.MODEL_ID, body=body)['body'].read()
+
+    def parse_response():
+        json.loads(response_body)['content'][0]["text"]
+
+    def parse_stream():
+        for _ in bedrock_utils.generate_response_stream("What is the payload of the DT1000?"):
+            pass
+
+    guarded = "<verdict>Category E</verdict>\n<answer>" + "The DT1000 carries 100 tons. " * 20 + "</answer>"
+
+    def parse_guarded_stream():
+        parser = GuardedStreamParser()
+        for i in range(0, len(guarded), 16):
+            parser.feed(guarded[i:i + 16])
+        parser.finish()
+
+    results["parse_invoke_response"] = time_call(parse_response, repeats, number)
+    bedrock_utils.set_clients(runtime=replay, resilient=False)  # Only the event parsing is timed
+    try:
+        results["parse_response_stream"] = time_call(parse_stream, repeats, max(1, number // 10))
+    finally:
+        bedrock_utils.clients.set(bedrock_utils.RUNTIME_CLIENT, None)
+    results["parse_guarded_response"] = time_call(lambda: parse_guarded_response(guarded), repeats, number)
+    results["guarded_stream_parser"] = time_call(parse_guarded_stream, repeats, number)
+    results["format_sources_k10"] = time_call(lambda: chat.format_sources(sources), repeats, number)
+    return results
+
+
+# ----- end-to-end scenarios -----
+
+def chat_turn(question, mode, guard):
+    """One streamed chat turn. Returns (seconds, seconds to first answer piece)."""
+    start = time.perf_counter()
+    first = None
+    for _ in chat.get_rag_response_stream(question, mode, guard=guard):
+        if first is None:
+            first = time.perf_counter() - start
+    return time.perf_counter() - start, first
+
+
+def run_scenario(sessions, turns, mode="sequential", guard="separate"):
+    questions = [question for question, _ in LABELLED_QUESTIONS]
+
+    def session(index):
+        return [chat_turn(questions[(index + turn) % len(questions)], mode, guard) for turn in range(turns)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        timings = [timing for result in pool.map(session, range(sessions)) for timing in result]
+    elapsed = time.perf_counter() - start
+
+    latencies = [seconds for seconds, _ in timings]
+    first_pieces = [first for _, first in timings if first is not None]
+    return {
+        "sessions": sessions,
+        "turns": len(timings),
+        "turns_per_sec": round(len(timings) / elapsed, 2),
+        "p50_ms": round(1000 * _percentile(latencies, 0.50), 1),
+        "p95_ms": round(1000 * _percentile(latencies, 0.95), 1),
+        "p99_ms": round(1000 * _percentile(latencies, 0.99), 1),
+        "first_piece_p50_ms": round(1000 * _percentile(first_pieces, 0.50), 1) if first_pieces else None,
+    }
+
+
+def run_scenarios(args, bm25):
+    invoke_latency = LatencyModel.parse(args.invoke_latency, seed=args.seed)
+    retrieve_latency = LatencyModel.parse(args.retrieve_latency, seed=args.seed + 1)
+    token_latency = LatencyModel.parse(args.token_latency, seed=args.seed + 2)
+    runtime = ReplayClient(args.cassette, latency=invoke_latency, token_latency=token_latency,
+                           strict=args.strict)
+    agent_runtime = ReplayClient(args.cassette, latency=retrieve_latency, strict=args.strict,
+                                 fallback_backend=bm25)
+    bedrock_utils.set_clients(runtime, agent_runtime)  # Wrapped in ResilientClient as in production
+
+    results = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for mode in chat.EXECUTION_MODES:
+            results[f"single_session_{mode}"] = run_scenario(1, args.turns, mode)
+        results["single_session_single_call"] = run_scenario(1, args.turns, "sequential", "single_call")
+        for sessions in args.sessions:
+            results[f"concurrent_{sessions}_sessions"] = run_scenario(sessions, args.turns, "threads")
+    results["replay"] = {"runtime": runtime.stats(), "agent_runtime": agent_runtime.stats()}
+    return results
+
+
+def record(cassette_path, turns):
+    """Runs the scenario questions once against AWS, recording every response."""
+    runtime, agent_runtime = bedrock_utils.runtime_client(), bedrock_utils.agent_runtime_client()
+    runtime.client = RecordingClient(runtime.client, cassette_path)
+    agent_runtime.client = RecordingClient(agent_runtime.client, cassette_path)
+    for question, _ in LABELLED_QUESTIONS[:turns]:
+        for guard in chat.GUARD_MODES:
+            "".join(chat.get_rag_response_stream(question, "sequential", guard=guard))
+            chat.get_rag_response(question, "sequential", stream=False, guard=guard)
+    print(f"Recorded {runtime.client.recorded + agent_runtime.client.recorded} responses to {cassette_path}")
+
+
+# ----- comparison -----
+
+def flatten(results):
+    """{'micro.build_rag_prompt_k3.us_per_call': value, ...} for the compared metrics."""
+    flat = {}
+    for name, metrics in results.get("micro", {}).items():
+        flat[f"micro.{name}.us_per_call"] = metrics["us_per_call"]
+    for name, metrics in results.get("scenarios", {}).items():
+        for key in ("turns_per_sec", "p50_ms", "p95_ms"):
+            if metrics.get(key) is not None:
+                flat[f"scenarios.{name}.{key}"] = metrics[key]
+    return flat
+
+
+def compare(baseline, current, threshold):
+    """Prints the change of every metric. Returns the names of regressions."""
+    old, new = flatten(baseline), flatten(current)
+    regressions = []
+    print(f"\nvs {baseline['meta'].get('commit') or 'baseline'}:")
+    print(f"{'metric':<55} {'before':>10} {'after':>10} {'change':>8}")
+    for name in sorted(old.keys() & new.keys()):
+        if not old[name]:
+            continue
+        change = (new[name] - old[name]) / old[name]
+        worse = -change if name.rsplit(".", 1)[-1] in HIGHER_IS_BETTER else change
+        flag = "  REGRESSION" if worse > threshold else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:<55} {old[name]:>10.2f} {new[name]:>10.2f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline micro and end-to-end benchmarks")
+    parser.add_argument('--cassette', help="JSONL cassette written with --record (default: synthesized responses)")
+    parser.add_argument('--strict', action='store_true', help="Fail on requests missing from the cassette")
+    parser.add_argument('--invoke-latency', default="lognormal:0.08,0.3",
+                        help="invoke_model / first stream event latency (fixed|uniform|normal|lognormal|recorded)")
+    parser.add_argument('--retrieve-latency', default="lognormal:0.05,0.3")
+    parser.add_argument('--token-latency', default="fixed:0.002", help="Delay between stream events")
+    parser.add_argument('--turns', type=int, default=10, help="Turns per session")
+    parser.add_argument('--sessions', type=int, nargs='+', default=[10, 50])
+    parser.add_argument('--repeats', type=int, default=7)
+    parser.add_argument('--number', type=int, default=200, help="Calls per microbenchmark batch")
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--skip-micro', action='store_true')
+    parser.add_argument('--skip-scenarios', action='store_true')
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    parser.add_argument('--compare', help="Results JSON of an earlier run to compare against")
+    parser.add_argument('--threshold', type=float, default=0.10, help="Relative change counted as a regression")
+    parser.add_argument('--record', metavar="CASSETTE", help="Record real AWS responses instead of benchmarking")
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.record, args.turns)
+        return
+
+    bm25 = BM25Index(load_chunks())
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "args": vars(args),
+        },
+    }
+    if not args.skip_micro:
+        results["micro"] = run_micro(bm25, args.repeats, args.number)
+        print(f"{'microbenchmark':<28} {'us/call':>10} {'best':>10}")
+        for name, metrics in results["micro"].items():
+            print(f"{name:<28} {metrics['us_per_call']:>10.1f} {metrics['best_us']:>10.1f}")
+    if not args.skip_scenarios:
+        results["scenarios"] = run_scenarios(args, bm25)
+        print(f"\n{'scenario':<28} {'turns':>6} {'turns/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'first ms':>9}")
+        for name, metrics in results["scenarios"].items():
+            if name == "replay":
+                continue
+            first = metrics['first_piece_p50_ms']
+            print(f"{name:<28} {metrics['turns']:>6} {metrics['turns_per_sec']:>8.1f} {metrics['p50_ms']:>8.1f} "
+                  f"{metrics['p95_ms']:>8.1f} {metrics['p99_ms']:>8.1f} {first if first is not None else '-':>9}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump(results, output_file, indent=2)
+        print(f"\nResults written to {args.output}")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as baseline_file:
+            regressions = compare(json.load(baseline_file), results, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
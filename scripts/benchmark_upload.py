@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Timing for the incremental parallel upload on a synthetic corpus.
+
+Generates N small files, then runs upload_to_s3.sync_incremental three
+times against an S3-compatible stand-in: a cold upload, a re-run with no
+changes, and a run after editing 1% of the files. Run it against a local
+server such as MinIO or `moto_server -p 5000`, never a real bucket.
+
+Usage:
+    python scripts/benchmark_upload.py --endpoint-url http://127.0.0.1:5000
+    python scripts/benchmark_upload.py --endpoint-url http://127.0.0.1:5000 --files 10000 --workers 1 8 32
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+from upload_to_s3 import get_files_to_upload, get_s3_client, sync_incremental
+
+
+def make_corpus(folder, count, size):
+    """Writes `count` text files of `size` bytes, 100 per sub-folder."""
+    for i in range(count):
+        sub_folder = os.path.join(folder, f"batch-{i // 100:04d}")
+        os.makedirs(sub_folder, exist_ok=True)
+        with open(os.path.join(sub_folder, f"spec-{i:05d}.txt"), 'w') as spec_file:
+            spec_file.write((f"Spec sheet {i}. " * (size // 16 + 1))[:size])
+
+
+def touch_percent(files, percent):
+    """Appends a line to every (100/percent)-th file so its hash changes."""
+    step = max(1, int(100 / percent))
+    for local_file, _ in files[::step]:
+        with open(local_file, 'a') as spec_file:
+            spec_file.write("\nRevised.")
+    return len(files[::step])
+
+
+def run(label, s3_client, files, bucket, manifest, workers):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # Hide per-file lines
+        result = sync_incremental(s3_client, files, bucket, manifest, workers)
+    elapsed = time.perf_counter() - start
+    print(f"{label:>14} {workers:>8} {len(result['uploaded']):>9} {len(result['unchanged']):>10} "
+          f"{result['plan_seconds']:>8.2f} {result['upload_seconds']:>9.2f} {elapsed:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark incremental S3 upload")
+    parser.add_argument('--endpoint-url', required=True, help="Local S3 stand-in endpoint")
+    parser.add_argument('--files', type=int, default=10000)
+    parser.add_argument('--size', type=int, default=4096, help="Bytes per file")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 8, 32])
+    args = parser.parse_args()
+
+    # Stand-ins accept any credentials
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'fake')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'fake')
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        corpus = os.path.join(work_dir, 'corpus')
+        make_corpus(corpus, args.files, args.size)
+        files = get_files_to_upload(corpus)
+        print(f"{len(files)} files of {args.size} bytes")
+        print(f"{'run':>14} {'workers':>8} {'uploaded':>9} {'unchanged':>10} "
+              f"{'plan s':>8} {'upload s':>9} {'total s':>8}")
+
+        for workers in args.workers:
+            bucket = f"upload-bench-{workers}-{int(time.time())}"
+            s3_client = get_s3_client(args.endpoint_url, max_pool_connections=workers * 4)
+            s3_client.create_bucket(Bucket=bucket)
+            manifest = os.path.join(work_dir, f"manifest-{workers}.json")
+
+            run("cold", s3_client, files, bucket, manifest, workers)
+            run("no changes", s3_client, files, bucket, manifest, workers)
+            touch_percent(files, 1)
+            run("1% changed", s3_client, files, bucket, manifest, workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Lazy Client Registry
+Author: Ahmad
+Description: Builds the boto3 clients on first use instead of at import time.
+
+Creating a Bedrock client means importing boto3, resolving credentials and
+loading the service model, which costs a few hundred milliseconds. A
+ClientRegistry keeps one factory per client name and runs it on the first
+get(). Concurrent first calls wait on a per-client lock and end up sharing
+one client.
+
+    prewarm()  builds clients up front, e.g. in a server before it takes
+               traffic. It can run in a background thread.
+    set()      installs a ready-made client (fakes, recorders). The
+               factory is then never called.
+    fork       a child process drops the parent's built clients, because
+               their connections and worker threads don't survive fork().
+               It builds its own on first use. Clients installed with
+               set() are kept (they can't be rebuilt); one wrapped in
+               resilient_client.ResilientClient starts a new thread pool
+               in the child, anything else must be fork-safe itself.
+
+Usage:
+    registry = ClientRegistry()
+    registry.register("bedrock-runtime", lambda: boto3.client("bedrock-runtime"))
+    registry.get("bedrock-runtime").invoke_model(...)
+"""
+import os
+import threading
+import time
+
+
+class ClientRegistry:
+    """Process-wide, thread-safe, fork-safe map of lazily built clients."""
+
+    def __init__(self):
+        self._factories = {}
+        self._locks = {}
+        self._clients = {}
+        self._installed = set()  # Names whose client came from set()
+        self.build_seconds = {}  # Name -> seconds its factory took
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def register(self, name, factory):
+        """Adds (or replaces) the zero-argument factory that builds client `name`."""
+        self._factories[name] = factory
+        self._locks.setdefault(name, threading.Lock())
+
+    def get(self, name):
+        """Returns client `name`, building it on the first call."""
+        client = self._clients.get(name)
+        if client is not None:
+            return client
+        with self._locks[name]:
+            client = self._clients.get(name)  # Another thread may have just built it
+            if client is None:
+                start = time.perf_counter()
+                client = self._factories[name]()
+                self.build_seconds[name] = time.perf_counter() - start
+                self._clients[name] = client
+            return client
+
+    def set(self, name, client):
+        """Installs `client` under `name`; None forgets it so the factory runs again."""
+        self._locks.setdefault(name, threading.Lock())
+        with self._locks[name]:
+            if client is None:
+                self._clients.pop(name, None)
+                self._installed.discard(name)
+            else:
+                self._clients[name] = client
+                self._installed.add(name)
+
+    def is_built(self, name):
+        return name in self._clients
+
+    def prewarm(self, names=None, background=False):
+        """
+        Builds the named clients (default: all registered) now.
+
+        Returns:
+            The started thread with background=True, else None
+        """
+        names = list(names or self._factories)
+        if background:
+            thread = threading.Thread(target=self.prewarm, args=(names,), name="prewarm-clients", daemon=True)
+            thread.start()
+            return thread
+        for name in names:
+            self.get(name)
+        return None
+
+    def close(self):
+        """Closes and forgets every built client (a later get() builds a new one)."""
+        for name in list(self._clients):
+            with self._locks[name]:
+                client = self._clients.pop(name, None)
+                self._installed.discard(name)
+            if client is not None and hasattr(client, 'close'):
+                client.close()
+
+    def _after_fork(self):
+        # Locks may have been held by threads that don't exist in the child
+        self._locks = {name: threading.Lock() for name in self._locks}
+        self._clients = {name: client for name, client in self._clients.items() if name in self._installed}
@@ -0,0 +1,136 @@
+"""
+Token-Budgeted Context Packing
+Author: Ahmad
+Description: Fits retrieved chunks into a fixed token budget before they
+             go into the RAG prompt.
+
+Steps:
+    1. Order chunks by retrieval score, best first
+    2. Split each chunk into sentences and drop sentences already packed
+       (neighbouring chunks overlap, and the same passage is often
+       returned twice); leftover fragments of an overlap window are only
+       looked for in text packed from the same source file
+    3. Add sentences until the budget is reached; the chunk that hits the
+       limit is cut at a sentence boundary and nothing after it is added.
+       If not even one sentence fits yet, that sentence is cut to the
+       budget instead, so the best chunk always makes it in
+
+Token counts come from estimate_tokens(), a character-based estimate that
+costs nothing next to a real tokenizer.
+
+Chunks are read through retrieved_chunk.RetrievedChunk, so packed entries
+carry their parsed score, text and source name on to the citations.
+"""
+import math
+
+from retrieved_chunk import as_chunks
+
+CHARS_PER_TOKEN = 4           # Rough average for English text with Claude's tokenizer
+CONTEXT_TOKEN_BUDGET = 2000   # Tokens allowed for the <context> block
+MIN_FRAGMENT_CHARS = 20       # Shorter leftovers of an overlap are compared as substrings
+
+
+def estimate_tokens(text):
+    """Estimated token count of `text` (chars / CHARS_PER_TOKEN, rounded up)."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def split_sentences(line):
+    """Splits one line at ". " and keeps the full stops. Empty pieces are dropped."""
+    pieces = line.split(". ")
+    return [
+        piece.strip() + ("." if i < len(pieces) - 1 else "")
+        for i, piece in enumerate(pieces) if piece.strip()
+    ]
+
+
+def chunk_header(index):
+    return f"Chunk {index}:\n"
+
+
+def pack_context(context_chunks, token_budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Selects and trims chunks so the context fits in `token_budget`.
+
+    Parameters:
+        context_chunks: retrievalResults-shaped chunks or RetrievedChunks
+                        (need content.text; score optional)
+        token_budget: Maximum estimated tokens for the packed context
+
+    Returns:
+        Tuple (packed, tokens) - packed is [(RetrievedChunk, text)] in prompt
+        order, where text may be shorter than the chunk; tokens is the
+        estimate for the packed context including the "Chunk N:" headers
+    """
+    # sorted() is stable, so chunks without scores keep their retrieval order
+    ranked = sorted(as_chunks(context_chunks), key=lambda chunk: chunk.score, reverse=True)
+
+    # Counting characters and converting once is much cheaper than per-sentence estimates
+    char_budget = token_budget * CHARS_PER_TOKEN
+    used = 0
+    packed = []
+    seen = set()
+    packed_text = {}  # Source file -> everything packed from it so far, for catching partial overlaps
+    for chunk in ranked:
+        chunk_chars = len(chunk_header(len(packed) + 1)) + 2  # + the blank line after it
+        source_text = packed_text.pop(chunk.source, "")  # Popped, so += below can grow it in place
+        lines = []
+        first = True
+        truncated = False
+        for line in chunk.text.split("\n"):
+            kept = []
+            for sentence in split_sentences(line):
+                # Only the first piece can be the tail of an overlap window
+                if sentence in seen or (first and _overlaps(sentence, source_text)):
+                    first = False
+                    continue
+                first = False
+                if used + chunk_chars + len(sentence) + 1 > char_budget:
+                    truncated = True
+                    room = char_budget - used - chunk_chars - 1
+                    if not packed and not lines and not kept and room > 0:
+                        # A single sentence longer than the whole budget: hard cut
+                        kept.append(sentence[:room])
+                        chunk_chars += room + 1
+                    break
+                seen.add(sentence)
+                kept.append(sentence)
+                chunk_chars += len(sentence) + 1  # + the joining space/newline
+            if kept:
+                lines.append(" ".join(kept))
+            if truncated:
+                break
+
+        if lines:
+            text = "\n".join(lines)
+            if text == chunk.text:
+                text = chunk.text  # Nothing dropped: keep the retrieved string, not a second copy
+            packed.append((chunk, text))
+            source_text += "\n" + text
+            used += chunk_chars
+        packed_text[chunk.source] = source_text
+        if truncated:
+            break
+
+    return packed, math.ceil(used / CHARS_PER_TOKEN)
+
+
+def _overlaps(sentence, packed_text):
+    """True if a leftover fragment (e.g. the start of an overlap window) was already packed."""
+    return len(sentence) >= MIN_FRAGMENT_CHARS and sentence in packed_text
+
+
+def context_pieces(packed, pieces=None):
+    """
+    Appends the context block's pieces (header, text, blank line per chunk)
+    to `pieces` and returns it, so a prompt can be joined in one go.
+    """
+    pieces = [] if pieces is None else pieces
+    for i, (_, text) in enumerate(packed, 1):
+        pieces += (chunk_header(i), text, "\n\n")
+    return pieces
+
+
+def format_context(packed):
+    """Renders packed chunks as the prompt's context block, in one join."""
+    return "".join(context_pieces(packed))
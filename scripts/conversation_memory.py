@@ -0,0 +1,396 @@
+"""
+Conversation Memory for multi-turn chat
+Author: Ahmad
+Description: Per-session memory so follow-up questions work without re-typing
+             the machine they are about.
+
+A ConversationMemory does four things for each turn:
+
+    1. Rewrites follow-ups into standalone queries for validation and
+       retrieval, using the last machine model mentioned:
+           "How heavy is it?"            -> "How heavy is the DT1000?"
+           "and what about its engine?"  -> "What is the DT1000's engine?"
+           "And the BD850?"              -> previous question, about the BD850
+    2. Keeps a token-bounded history for the answer prompt. When the recent
+       turns go over `history_tokens`, the oldest turns are folded into a
+       running summary (the small "summarize" model route), one batch at a
+       time. Model summaries are written on a background worker, so the turn
+       that overflowed is answered without waiting; the next turn's prompt
+       waits for the summary only if it is still being written.
+    3. Reuses chunks already retrieved in the session when they cover the
+       new query well enough, which saves a Knowledge Base call.
+    4. Counts what this saves: skipped retrievals and their chunk tokens,
+       and prompt tokens compared with sending the full transcript.
+
+Everything per session is bounded: turns kept, answer length stored,
+summary size and the chunk pool.
+
+Usage:
+    from conversation_memory import ConversationMemory
+    memory = ConversationMemory()
+    get_rag_response("What is the payload of the DT1000?", memory=memory)
+    get_rag_response("And how heavy is it?", memory=memory)
+    print(memory.stats())
+"""
+import hashlib
+import inspect
+import re
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from context_packer import estimate_tokens
+from model_routing import MODEL_CODE_PATTERN
+
+HISTORY_TOKENS = 600          # Recent turns kept verbatim in the answer prompt
+SUMMARY_TOKENS = 200          # Cap on the running summary
+KEEP_RECENT_TURNS = 1         # Never summarized away, however long
+MAX_TURNS = 20                # Turns stored at most (older ones live on in the summary)
+MAX_ANSWER_CHARS = 800        # Stored answers are cut to this
+MAX_POOL_CHUNKS = 30          # Retrieved chunks kept for reuse
+REUSE_MIN_OVERLAP = 0.75      # Share of query terms a pooled chunk must contain to be reused
+FOLD_WORKERS = 2              # Background summarizer threads shared by all sessions
+MAX_FOLLOW_UP_WORDS = 10      # Longer messages are never rewritten from pronouns
+
+LEADING_CONNECTOR = re.compile(r"^\s*(?:(?:and|also|so|ok(?:ay)?|then|what about|how about)\b[\s,]*)+",
+                               re.IGNORECASE)
+POSSESSIVE_PRONOUN = re.compile(r"\b(?:its|their)\b", re.IGNORECASE)
+# "it" is left alone in dummy uses ("is it true", "it is possible"), and
+# "this"/"that" only count at the end of a phrase ("how heavy is that?"),
+# never as the conjunction in "... true that operators need ..."
+PRONOUN = re.compile(
+    r"\b(?:this one|that one|the same one|they|them"
+    r"|it(?!\s+(?:is|was|'s|seems|true|possible|necessary|required|safe|ok|okay|important|allowed|legal"
+    r"|recommended|better|best|worth|normal|common|mandatory|advisable)\b)"
+    r"|(?:this|that)(?=\s*(?:[?.!,]|$)))\b",
+    re.IGNORECASE)
+QUESTION_START = re.compile(r"^(?:what|which|how|why|when|where|who|is|are|can|does|do|should|could|will)\b",
+                            re.IGNORECASE)
+
+SUMMARY_PROMPT_TEMPLATE = """Human: Summarize this conversation about heavy machinery for later turns.
+    Keep machine models, numbers and units exactly as written. At most {max_words} words.
+
+    <summary_so_far>
+    {summary}
+    </summary_so_far>
+
+    <new_turns>
+    {turns}
+    </new_turns>
+
+    Assistant:
+    """
+
+
+def model_codes(text):
+    """Machine model codes in `text`, normalized ("dt-1000" -> "DT1000"), in order."""
+    return [code.upper().replace("-", "") for code in MODEL_CODE_PATTERN.findall(text)]
+
+
+def _swap_entity(question, old, new):
+    """
+    `question` about `new` instead of `old`. Codes are compared normalized
+    ("DT-1000" matches DT1000); without `old` in it, the new model is appended.
+    """
+    swapped = MODEL_CODE_PATTERN.sub(
+        lambda match: new if model_codes(match.group(0)) == [old] else match.group(0), question)
+    if swapped != question:
+        return swapped
+    return f"{question.rstrip(' ?')} for the {new}?"
+
+
+# Shared pool for background summaries, created on first use
+_fold_executor = None
+_fold_executor_lock = threading.Lock()
+
+
+def _get_fold_executor():
+    global _fold_executor
+    with _fold_executor_lock:
+        if _fold_executor is None:
+            _fold_executor = ThreadPoolExecutor(max_workers=FOLD_WORKERS, thread_name_prefix="memory-fold")
+    return _fold_executor
+
+
+def summarize_with_model(summary, turns_text, max_words=SUMMARY_TOKENS * 3 // 4):
+    """
+    Default summarizer: one call on the "summarize" route. Returns "" on failure.
+
+    Without a model router the route's default profile (Haiku, 300 tokens)
+    is used rather than generate_response's answer model.
+    """
+    from bedrock_utils import generate_response
+    from model_routing import DEFAULT_ROUTES
+
+    profile = DEFAULT_ROUTES["summarize"]
+    prompt = SUMMARY_PROMPT_TEMPLATE.format(summary=summary or "(none)", turns=turns_text, max_words=max_words)
+    return generate_response(prompt, model_id=profile['model_id'], temperature=profile['temperature'],
+                             top_p=profile['top_p'], route="summarize", max_tokens=profile['max_tokens']).strip()
+
+
+def extractive_summary(summary, turns):
+    """Fallback summary without a model call: previous summary plus each question and the answer's first sentence."""
+    lines = [summary] if summary else []
+    for turn in turns:
+        first_sentence = turn['answer'].split(". ")[0].strip()
+        lines.append(f"Asked: {turn['question']} Answer: {first_sentence}")
+    return "\n".join(lines)
+
+
+def _truncate_tokens(text, tokens):
+    """Keeps the end of `text` (the newest facts) within `tokens` estimated tokens."""
+    limit = tokens * 4
+    if len(text) <= limit:
+        return text
+    cut = text[-limit:]
+    return cut[cut.find(" ") + 1:]
+
+
+def _chunk_key(chunk):
+    location = chunk.get('location', {}).get('s3Location', {}).get('uri', "")
+    return location + hashlib.sha1(chunk['content']['text'].encode('utf-8')).hexdigest()
+
+
+class ConversationMemory:
+    """
+    Memory of one chat session. Not shared between sessions; a session runs
+    one turn at a time (chat_server.py holds the session lock).
+
+    Parameters:
+        summarizer: Callable (summary, turns_text) -> new summary, "" on failure,
+                    run on a background worker (default: summarize_with_model);
+                    None uses extractive_summary, inline, which is also the fallback
+        history_tokens / summary_tokens: Prompt budgets for recent turns and the summary
+        max_pool_chunks: Retrieved chunks kept for reuse (0 = no reuse)
+        reuse_min_overlap: Query-term coverage a pooled chunk needs to be reused
+    """
+
+    def __init__(self, summarizer=summarize_with_model, history_tokens=HISTORY_TOKENS,
+                 summary_tokens=SUMMARY_TOKENS, max_pool_chunks=MAX_POOL_CHUNKS,
+                 reuse_min_overlap=REUSE_MIN_OVERLAP):
+        self.summarizer = summarizer
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self.max_pool_chunks = max_pool_chunks
+        self.reuse_min_overlap = reuse_min_overlap
+        self._summary = ""
+        self._unfolded = []            # Overflowed turns waiting for the background summarizer
+        self._fold_lock = threading.Lock()
+        self._folded = threading.Event()  # Set while no background fold is pending
+        self._folded.set()
+        self.turns = deque(maxlen=MAX_TURNS)
+        self.entity = None             # Last machine model the user asked about
+        self._last_standalone = None
+        self._pool = OrderedDict()     # chunk key -> chunk, least recently used first
+        self.counters = {
+            'turns': 0, 'rewrites': 0, 'summaries': 0,
+            'retrievals': 0, 'retrievals_skipped': 0, 'retrieval_tokens_saved': 0,
+            'history_tokens_sent': 0, 'transcript_tokens': 0,
+        }
+        self._transcript_tokens = 0    # What the full, unsummarized history would cost
+
+    # ----- 1. follow-up rewriting -----
+
+    def rewrite(self, query):
+        """
+        Returns a standalone version of `query` (unchanged if it already is one).
+
+        Also remembers the machine model the query is about.
+        """
+        query = query.strip()
+        codes = model_codes(query)
+        if codes:
+            previous_entity, self.entity = self.entity, codes[-1]
+            remainder = LEADING_CONNECTOR.sub("", query)
+            remainder = MODEL_CODE_PATTERN.sub("", remainder)
+            # "And the BD850?" - same question as before, about another machine
+            elliptical = len(re.findall(r"[a-z]+", remainder, re.IGNORECASE)) <= 2
+            if elliptical and previous_entity and self._last_standalone and previous_entity != self.entity:
+                self.counters['rewrites'] += 1
+                return self._remember(_swap_entity(self._last_standalone, previous_entity, self.entity))
+            return self._remember(query)
+
+        # Only short follow-ups are rewritten; anything longer is taken as it is
+        if self.entity is None or len(query.split()) > MAX_FOLLOW_UP_WORDS:
+            return self._remember(query)
+        text = LEADING_CONNECTOR.sub("", query)
+        text, possessives = POSSESSIVE_PRONOUN.subn(f"the {self.entity}'s", text)
+        text, pronouns = PRONOUN.subn(f"the {self.entity}", text)
+        if not possessives and not pronouns:
+            if text == query:
+                return self._remember(query)  # Nothing suggests a follow-up
+            text = f"{text.rstrip(' ?')} of the {self.entity}?"
+        if not QUESTION_START.match(text):
+            text = f"What is {text}" if text.lower().startswith("the ") else f"What is the {text}"
+        self.counters['rewrites'] += 1
+        return self._remember(text[0].upper() + text[1:])
+
+    def _remember(self, standalone):
+        self._last_standalone = standalone
+        return standalone
+
+    # ----- 2. history -----
+
+    @property
+    def summary(self):
+        """The running summary of folded turns (waits for a background fold still in progress)."""
+        self._folded.wait()
+        return self._summary
+
+    def history_text(self):
+        """Summary plus recent turns, formatted for the answer prompt ("" on the first turn)."""
+        parts = [f"Summary of earlier turns: {self.summary}"] if self.summary else []
+        for turn in self.turns:
+            parts.append(f"User: {turn['question']}\nAssistant: {turn['answer']}")
+        return "\n\n".join(parts)
+
+    def _recent_tokens(self):
+        return sum(turn['tokens'] for turn in self.turns)
+
+    def add_turn(self, question, answer):
+        """Stores a finished turn and summarizes the oldest turns if the history overflows."""
+        answer = answer[:MAX_ANSWER_CHARS]
+        turn_text = f"User: {question}\nAssistant: {answer}"
+        tokens = estimate_tokens(turn_text)
+        self._transcript_tokens += tokens
+        if len(self.turns) == self.turns.maxlen:
+            self._schedule_fold([self.turns.popleft()])
+        self.turns.append({'question': question, 'answer': answer, 'tokens': tokens})
+        self.counters['turns'] += 1
+
+        overflow = []
+        while len(self.turns) > KEEP_RECENT_TURNS and self._recent_tokens() > self.history_tokens:
+            overflow.append(self.turns.popleft())
+        if overflow:
+            self._schedule_fold(overflow)
+
+    def _schedule_fold(self, turns):
+        """Folds `turns` into the summary: inline without a summarizer, otherwise on the background pool."""
+        if self.summarizer is None:
+            self._fold(turns)
+            return
+        with self._fold_lock:
+            self._unfolded.extend(turns)
+            if not self._folded.is_set():
+                return  # The running fold picks these turns up as well
+            self._folded.clear()
+        _get_fold_executor().submit(self._fold_pending)
+
+    def _fold_pending(self):
+        """Background worker: folds queued turns, in order, until none are left."""
+        while True:
+            with self._fold_lock:
+                turns, self._unfolded = self._unfolded, []
+                if not turns:
+                    self._folded.set()
+                    return
+            self._fold(turns)
+
+    def _fold(self, turns):
+        """Merges `turns` into the running summary (one summarizer call for the batch)."""
+        turns_text = "\n".join(f"User: {turn['question']}\nAssistant: {turn['answer']}" for turn in turns)
+        summary = ""
+        if self.summarizer is not None:
+            try:
+                summary = self.summarizer(self._summary, turns_text)
+            except Exception as error:  # A failed summary must not leave the next turn waiting
+                print(f"Error summarizing conversation: {error}")
+        if not summary:
+            summary = extractive_summary(self._summary, turns)
+        self._summary = _truncate_tokens(summary, self.summary_tokens)
+        self.counters['summaries'] += 1
+
+    def record_prompt(self, history):
+        """Counts the history tokens sent with one answer prompt, against the full transcript."""
+        self.counters['history_tokens_sent'] += estimate_tokens(history) if history else 0
+        self.counters['transcript_tokens'] += self._transcript_tokens
+
+    # ----- 3. chunk reuse -----
+
+    def reusable_chunks(self, query, count=3):
+        """
+        Pooled chunks that cover `query`, best first, or None if a new retrieval is needed.
+
+        A chunk qualifies when it contains at least reuse_min_overlap of the
+        query's terms, the model code included.
+        """
+        if not self._pool:
+            return None
+        from embedders import tokenize
+        from reranking import STOPWORDS
+
+        terms = {term for term in tokenize(query) if term not in STOPWORDS}
+        codes = {code.lower() for code in model_codes(query)}
+        if not terms:
+            return None
+        scored = []
+        for chunk in self._pool.values():
+            chunk_terms = set(tokenize(chunk['content']['text']))
+            if codes and not codes <= chunk_terms:
+                continue
+            overlap = len(terms & chunk_terms) / len(terms)
+            if overlap >= self.reuse_min_overlap:
+                scored.append((overlap, chunk))
+        if not scored:
+            return None
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+        chunks = [chunk for _, chunk in scored[:count]]
+        for chunk in chunks:
+            self._pool.move_to_end(_chunk_key(chunk))
+        self.counters['retrievals_skipped'] += 1
+        self.counters['retrieval_tokens_saved'] += sum(estimate_tokens(chunk['content']['text']) for chunk in chunks)
+        return chunks
+
+    def remember_chunks(self, chunks):
+        self.counters['retrievals'] += 1
+        if not self.max_pool_chunks:
+            return
+        for chunk in chunks:
+            key = _chunk_key(chunk)
+            self._pool[key] = chunk
+            self._pool.move_to_end(key)
+        while len(self._pool) > self.max_pool_chunks:
+            self._pool.popitem(last=False)
+
+    def retriever(self, retrieve):
+        """
+        Wraps a retrieval function (e.g. query_knowledge_base, or an async one
+        such as bedrock_async.query_knowledge_base_async) with pool reuse.
+
+        Returns:
+            Callable query -> chunks (async if `retrieve` is), for
+            chat.screen_and_retrieve(retrieve=...)
+        """
+        if inspect.iscoroutinefunction(retrieve):
+            async def retrieve_with_memory_async(query):
+                chunks = self.reusable_chunks(query)
+                if chunks is not None:
+                    print("Bot: Reusing chunks retrieved earlier in this conversation")
+                    return chunks
+                chunks = await retrieve(query)
+                self.remember_chunks(chunks)
+                return chunks
+            return retrieve_with_memory_async
+
+        def retrieve_with_memory(query):
+            chunks = self.reusable_chunks(query)
+            if chunks is not None:
+                print("Bot: Reusing chunks retrieved earlier in this conversation")
+                return chunks
+            chunks = retrieve(query)
+            self.remember_chunks(chunks)
+            return chunks
+        return retrieve_with_memory
+
+    # ----- 4. accounting -----
+
+    def stats(self):
+        """Counters plus generation_tokens_saved (full transcript minus history actually sent)."""
+        self._folded.wait()
+        result = dict(self.counters)
+        result['generation_tokens_saved'] = result['transcript_tokens'] - result['history_tokens_sent']
+        result['pooled_chunks'] = len(self._pool)
+        result['stored_chars'] = (len(self.summary) + sum(len(turn['question']) + len(turn['answer'])
+                                                          for turn in self.turns)
+                                  + sum(len(chunk['content']['text']) for chunk in self._pool.values()))
+        return result
@@ -0,0 +1,95 @@
+"""
+Text Embedders for the local retrieval engines
+Author: Ahmad
+Description: Pluggable text -> vector functions with a common interface:
+
+    embedder(text)               -> float32 vector (L2-normalized)
+    embedder.embed_batch(texts)  -> float32 matrix, one row per text
+    embedder.dimensions, embedder.name
+
+TitanEmbedder matches the Bedrock Knowledge Base (needs AWS); HashingEmbedder
+is fully local and deterministic, for offline sites and tests.
+"""
+import re
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """Lowercase alphanumeric tokens; model codes like "DT1000" stay whole."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class HashingEmbedder:
+    """
+    Feature-hashing embedder: words and character trigrams hashed into a
+    fixed number of signed buckets.
+
+    No vocabulary or training needed, so the same text always gets the same
+    vector on any machine. Captures lexical overlap, not meaning.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dimensions=768):
+        self.dimensions = dimensions
+
+    def _features(self, text):
+        words = tokenize(text)
+        features = list(words)
+        for word in words:
+            padded = f"#{word}#"
+            features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def embed_batch(self, texts):
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                hashed = zlib.crc32(feature.encode())
+                sign = 1.0 if hashed & 0x80000000 else -1.0
+                matrix[row, hashed % self.dimensions] += sign
+        return _normalize_rows(matrix)
+
+    def __call__(self, text):
+        return self.embed_batch([text])[0]
+
+
+class TitanEmbedder:
+    """
+    Titan Embeddings through Bedrock - the same vectors the Knowledge Base uses.
+
+    Titan embeds one text per request, so batches are sent concurrently.
+    """
+
+    name = "titan"
+    dimensions = 1536
+
+    def __init__(self, model_id=None, max_workers=8):
+        from bedrock_utils import EMBEDDING_MODEL_ID
+        self.model_id = model_id or EMBEDDING_MODEL_ID
+        self.max_workers = max_workers
+
+    def __call__(self, text):
+        from bedrock_utils import embed_text
+        vector = embed_text(text, self.model_id)
+        if vector is None:
+            return None
+        return _normalize_rows(np.asarray([vector], dtype=np.float32))[0]
+
+    def embed_batch(self, texts):
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            vectors = list(pool.map(self, texts))
+        if any(vector is None for vector in vectors):
+            raise RuntimeError("Titan embedding failed for part of the batch")
+        return np.vstack(vectors) if vectors else np.zeros((0, self.dimensions), dtype=np.float32)
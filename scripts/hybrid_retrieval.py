@@ -0,0 +1,146 @@
+"""
+Hybrid Lexical + Vector Retrieval with Reciprocal-Rank Fusion
+Author: Ahmad
+Description: Runs a lexical search (BM25 / Postgres full-text) and a vector
+             search in parallel and merges them with reciprocal-rank fusion.
+
+Spec-sheet questions often hinge on exact model codes ("DT1000", "MC750")
+that vector search ranks poorly but lexical search nails. RRF only looks at
+ranks, so the two engines' incompatible score scales don't matter:
+
+    fused_score(chunk) = sum over engines of 1 / (rrf_k + rank_in_engine)
+
+Usage:
+    from bedrock_utils import set_retrieval_backend
+    from pgvector_retrieval import PgVectorRetriever, PgFullTextRetriever
+    from hybrid_retrieval import HybridRetriever
+
+    vector = PgVectorRetriever()
+    set_retrieval_backend(HybridRetriever(PgFullTextRetriever(vector), vector))
+"""
+import math
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from embedders import tokenize
+from spec_corpus import matches_filters, to_retrieval_result
+
+RRF_K = 60            # Standard RRF constant; dampens the weight of top ranks
+CANDIDATES = 20       # Results fetched from each engine before fusing
+
+
+def result_key(result):
+    """Identifies a chunk across engines by its source and text."""
+    uri = result.get('location', {}).get('s3Location', {}).get('uri')
+    return uri, result['content']['text']
+
+
+def reciprocal_rank_fusion(result_lists, rrf_k=RRF_K, weights=None):
+    """
+    Merges several ranked retrievalResults lists into one.
+
+    Parameters:
+        result_lists: Lists of results, each best match first
+        rrf_k: RRF constant
+        weights: Optional per-list multipliers (default 1.0 each)
+
+    Returns:
+        Fused list, best first; 'score' is replaced by the fused score
+    """
+    weights = weights or [1.0] * len(result_lists)
+    scores = defaultdict(float)
+    first_seen = {}
+    for results, weight in zip(result_lists, weights):
+        for rank, result in enumerate(results, 1):
+            key = result_key(result)
+            scores[key] += weight / (rrf_k + rank)
+            first_seen.setdefault(key, result)
+
+    fused = []
+    for key in sorted(scores, key=scores.get, reverse=True):
+        result = dict(first_seen[key], score=scores[key])
+        fused.append(result)
+    return fused
+
+
+class BM25Index:
+    """
+    In-memory Okapi BM25 over a list of chunk dicts (see spec_corpus).
+
+    Parameters:
+        chunks: Chunk dicts with 'text' and 'metadata'
+        k1: Term-frequency saturation
+        b: Document-length normalization
+    """
+
+    name = "bm25"
+
+    def __init__(self, chunks, k1=1.2, b=0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)  # term -> [(chunk index, term frequency)]
+        self.lengths = []
+        for index, chunk in enumerate(chunks):
+            counts = Counter(tokenize(chunk['text']))
+            self.lengths.append(sum(counts.values()))
+            for term, frequency in counts.items():
+                self.postings[term].append((index, frequency))
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+
+    def search(self, query, number_of_results=3):
+        """Returns [(chunk index, score)] for the best matches."""
+        scores = defaultdict(float)
+        total = len(self.chunks)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for index, frequency in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[index] / self.average_length)
+                scores[index] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:number_of_results]
+
+    def retrieve(self, query, number_of_results=3, filters=None):
+        results = []
+        for index, score in self.search(query, number_of_results if not filters else len(self.chunks)):
+            chunk = self.chunks[index]
+            if filters and not matches_filters(chunk['metadata'], filters):
+                continue
+            results.append(to_retrieval_result(chunk['text'], chunk['metadata'], score))
+            if len(results) == number_of_results:
+                break
+        return results
+
+
+class HybridRetriever:
+    """
+    Retrieval backend fusing a lexical and a vector retriever with RRF.
+
+    Parameters:
+        lexical: Retriever with retrieve(query, number_of_results, filters)
+        vector: Retriever with retrieve(query, number_of_results, filters)
+        candidates: Results requested from each engine
+        rrf_k: RRF constant
+        lexical_weight / vector_weight: Relative influence of each engine
+    """
+
+    name = "hybrid"
+
+    def __init__(self, lexical, vector, candidates=CANDIDATES, rrf_k=RRF_K,
+                 lexical_weight=1.0, vector_weight=1.0):
+        self.lexical = lexical
+        self.vector = vector
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.weights = [lexical_weight, vector_weight]
+        self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hybrid")
+
+    def retrieve(self, query, number_of_results=3, filters=None):
+        candidates = max(self.candidates, number_of_results)
+        # Both engines run at the same time; the slower one sets the latency
+        lexical = self._executor.submit(self.lexical.retrieve, query, candidates, filters)
+        vector = self._executor.submit(self.vector.retrieve, query, candidates, filters)
+        fused = reciprocal_rank_fusion([lexical.result(), vector.result()], self.rrf_k, self.weights)
+        return fused[:number_of_results]
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Incremental Ingestion Pipeline for the Knowledge Base table
+Author: Ahmad
+Description: Re-embeds only the chunks that actually changed.
+
+Stages:
+    1. discover - files from upload_to_s3.get_files_to_upload()
+    2. parse    - PDF/txt/md text extraction in a process pool (one file per task)
+    3. chunk    - streaming generator over parsed pages; each chunk is hashed
+    4. diff     - chunk hashes compared with what the store already holds
+    5. embed    - only added/changed chunks, in batches
+    6. upsert   - new rows written; chunks that disappeared are tombstoned
+
+A chunk's id is derived from its source file and content hash, so an edited
+paragraph produces one new row and one tombstone while the rest of the
+document is untouched.
+
+Chunks carry the filter tags of spec_corpus.document_tags (machine_model,
+doc_type, source_file). Rows ingested before they had tags are re-tagged
+in place without re-embedding, and the pg store creates the per-machine
+partial indexes PgVectorRetriever uses for filtered searches.
+
+Every run that changes the table publishes a new KB version
+(retrieval_cache.publish_kb_version), so running chat processes stop
+serving cached retrievals and answers from before the ingest.
+
+Usage:
+    python scripts/ingest.py                                  # local state file, hashing embedder
+    python scripts/ingest.py --store pg --embedder titan      # ahmad_knowledge_base via PG* env vars
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from embedders import HashingEmbedder, TitanEmbedder
+from retrieval_cache import publish_kb_version
+from spec_corpus import (
+    CORPUS_EXTENSIONS,
+    SOURCE_URI_KEY,
+    SOURCE_URI_PREFIX,
+    SPEC_SHEETS_FOLDER,
+    chunk_text,
+    document_tags,
+    read_pages,
+)
+from upload_to_s3 import get_files_to_upload
+
+EMBED_BATCH_SIZE = 32
+DEFAULT_STATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".ingest_state.json")
+
+
+def chunk_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_id(source_file, content_hash):
+    """Stable uuid for a chunk: same file + same text -> same id."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{source_file}#{content_hash}"))
+
+
+def parse_document(item):
+    """Process-pool task: (local_path, s3_key) -> (s3_key, [page texts])."""
+    local_path, s3_key = item
+    return s3_key, read_pages(local_path)
+
+
+def iter_chunks(files, workers=None, stats=None, source_uri_prefix=SOURCE_URI_PREFIX):
+    """
+    Streams chunk dicts for `files` while later files are still being parsed.
+
+    Parameters:
+        files: [(local_path, s3_key)]
+        workers: Parser processes (default: CPU count)
+        stats: Optional dict; 'files', 'pages' and 'chunks' counts are added
+
+    Yields:
+        {'id', 'text', 'hash', 'metadata'} per chunk
+    """
+    stats = stats if stats is not None else {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for s3_key, pages in pool.map(parse_document, files):
+            stats['files'] = stats.get('files', 0) + 1
+            stats['pages'] = stats.get('pages', 0) + len(pages)
+            tags = document_tags(s3_key, pages)
+            for page_number, page_text in enumerate(pages, 1):
+                for text in chunk_text(page_text):
+                    content_hash = chunk_hash(text)
+                    stats['chunks'] = stats.get('chunks', 0) + 1
+                    yield {
+                        'id': chunk_id(s3_key, content_hash),
+                        'text': text,
+                        'hash': content_hash,
+                        'metadata': dict(tags, **{
+                            SOURCE_URI_KEY: source_uri_prefix + s3_key,
+                            'page': page_number,
+                            'chunk_hash': content_hash,
+                        }),
+                    }
+
+
+class LocalChunkStore:
+    """
+    Chunk ids kept in a JSON state file - for offline runs and benchmarks.
+
+    Embeddings are not persisted; the store only remembers which chunks
+    were ingested so the next run can skip them.
+    """
+
+    def __init__(self, path=DEFAULT_STATE_FILE):
+        self.path = path
+        self.rows = {}  # id -> metadata
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as state_file:
+                self.rows = json.load(state_file)
+
+    def live_ids(self):
+        return {row_id for row_id, metadata in self.rows.items() if not metadata.get('tombstoned')}
+
+    def untagged_ids(self):
+        return {row_id for row_id in self.live_ids() if 'machine_model' not in self.rows[row_id]}
+
+    def upsert(self, rows):
+        for row in rows:
+            self.rows[row['id']] = row['metadata']
+
+    def retag(self, rows):
+        self.upsert(rows)
+
+    def tombstone(self, ids):
+        for row_id in ids:
+            self.rows[row_id] = dict(self.rows[row_id], tombstoned=True)
+
+    def commit(self):
+        if self.path:
+            with open(self.path, 'w', encoding='utf-8') as state_file:
+                json.dump(self.rows, state_file)
+
+
+class PgChunkStore:
+    """
+    Writes chunks into ahmad_bedrock_schema.ahmad_knowledge_base.
+
+    Only rows created by this pipeline (metadata has chunk_hash) are
+    considered, so rows written by a Bedrock data-source sync are left alone.
+    Tombstoned rows keep their data but are excluded from retrieval by
+    PgVectorRetriever.
+    """
+
+    def __init__(self, pg_retriever):
+        self.pg_retriever = pg_retriever
+        self.table = pg_retriever.table
+        self.models = set()  # machine_model values written this run
+
+    def live_ids(self):
+        with self.pg_retriever.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                f"SELECT id::text FROM {self.table} "
+                f"WHERE metadata->>'chunk_hash' IS NOT NULL AND metadata->>'tombstoned' IS NULL"
+            )
+            return {row[0] for row in cursor.fetchall()}
+
+    def untagged_ids(self):
+        with self.pg_retriever.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                f"SELECT id::text FROM {self.table} "
+                f"WHERE metadata->>'chunk_hash' IS NOT NULL AND metadata->>'tombstoned' IS NULL "
+                f"AND metadata->>'machine_model' IS NULL"
+            )
+            return {row[0] for row in cursor.fetchall()}
+
+    def upsert(self, rows):
+        from psycopg2.extras import Json, execute_values
+        from pgvector_retrieval import vector_literal
+
+        self.models.update(row['metadata']['machine_model'] for row in rows)
+        values = [
+            (row['id'], vector_literal(row['embedding']), row['text'], Json(row['metadata']))
+            for row in rows
+        ]
+        with self.pg_retriever.connection() as conn, conn.cursor() as cursor:
+            execute_values(
+                cursor,
+                f"INSERT INTO {self.table} (id, embedding, chunks, metadata) VALUES %s "
+                f"ON CONFLICT (id) DO UPDATE SET embedding = EXCLUDED.embedding, "
+                f"chunks = EXCLUDED.chunks, metadata = EXCLUDED.metadata",
+                values,
+                template="(%s::uuid, %s::vector, %s, %s)"
+            )
+
+    def retag(self, rows):
+        """Replaces the metadata of existing rows (the embeddings are kept)."""
+        from psycopg2.extras import Json, execute_values
+
+        self.models.update(row['metadata']['machine_model'] for row in rows)
+        with self.pg_retriever.connection() as conn, conn.cursor() as cursor:
+            execute_values(
+                cursor,
+                f"UPDATE {self.table} AS kb SET metadata = tagged.metadata "
+                f"FROM (VALUES %s) AS tagged (id, metadata) WHERE kb.id = tagged.id",
+                [(row['id'], Json(row['metadata'])) for row in rows],
+                template="(%s::uuid, %s::json)"
+            )
+
+    def tombstone(self, ids):
+        if not ids:
+            return
+        with self.pg_retriever.connection() as conn, conn.cursor() as cursor:
+            # metadata is json (not jsonb), so round-trip through jsonb to add the flag
+            cursor.execute(
+                f"UPDATE {self.table} "
+                f"SET metadata = (metadata::jsonb || '{{\"tombstoned\": true}}'::jsonb)::json "
+                f"WHERE id = ANY(%s::uuid[])",
+                (list(ids),)
+            )
+
+    def commit(self):
+        # Every write above is committed by its own transaction; new machines get their index
+        if self.models:
+            self.pg_retriever.ensure_partition_indexes(self.models)
+
+
+def ingest(store, embedder, folder=SPEC_SHEETS_FOLDER, workers=None, batch_size=EMBED_BATCH_SIZE,
+           source_uri_prefix=SOURCE_URI_PREFIX, allow_empty=False):
+    """
+    Runs the pipeline against `store` and returns counts plus per-stage rates.
+
+    Every live chunk whose file is not found is tombstoned, so a folder
+    without corpus files (a typo in --folder, an unmounted volume) is
+    refused unless allow_empty is set.
+
+    Returns:
+        Dict with files, pages, chunks, added, unchanged, retagged, tombstoned and
+        pages_per_sec / chunks_per_sec / embeddings_per_sec; None when the folder
+        has no corpus files and allow_empty is False (nothing is changed)
+    """
+    files = [
+        (local_path, s3_key) for local_path, s3_key in get_files_to_upload(folder)
+        if Path(local_path).suffix.lower() in CORPUS_EXTENSIONS
+    ]
+    if not files and not allow_empty:
+        print(f"Error: no {'/'.join(sorted(CORPUS_EXTENSIONS))} files found in '{folder}'; "
+              f"nothing ingested or tombstoned (use --allow-empty to tombstone every chunk)")
+        return None
+
+    live_ids = store.live_ids()
+    untagged_ids = store.untagged_ids()
+    seen_ids = set()
+    stats = {'added': 0, 'unchanged': 0, 'retagged': 0}
+    retag = []
+    parse_seconds = embed_seconds = 0.0
+    pending = []
+
+    def flush():
+        nonlocal embed_seconds
+        start = time.perf_counter()
+        vectors = embedder.embed_batch([row['text'] for row in pending])
+        embed_seconds += time.perf_counter() - start
+        for row, vector in zip(pending, vectors):
+            row['embedding'] = vector
+        store.upsert(pending)
+        stats['added'] += len(pending)
+        pending.clear()
+
+    start = time.perf_counter()
+    chunks = iter_chunks(files, workers, stats, source_uri_prefix)
+    while True:
+        # Time spent waiting on the generator is parse + chunk time
+        step = time.perf_counter()
+        chunk = next(chunks, None)
+        parse_seconds += time.perf_counter() - step
+        if chunk is None:
+            break
+        if chunk['id'] in seen_ids:
+            continue  # Identical chunk repeated within one file
+        seen_ids.add(chunk['id'])
+        if chunk['id'] in live_ids:
+            stats['unchanged'] += 1
+            if chunk['id'] in untagged_ids:
+                retag.append(chunk)
+            continue
+        pending.append(chunk)
+        if len(pending) >= batch_size:
+            flush()
+    if pending:
+        flush()
+    if retag:
+        store.retag(retag)
+        stats['retagged'] = len(retag)
+
+    removed = live_ids - seen_ids
+    store.tombstone(removed)
+    store.commit()
+    total_seconds = time.perf_counter() - start
+
+    stats['tombstoned'] = len(removed)
+    stats['seconds'] = total_seconds
+    stats['pages_per_sec'] = stats.get('pages', 0) / parse_seconds if parse_seconds else 0.0
+    stats['chunks_per_sec'] = stats.get('chunks', 0) / parse_seconds if parse_seconds else 0.0
+    stats['embeddings_per_sec'] = stats['added'] / embed_seconds if embed_seconds else 0.0
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally ingest spec sheets into the KB table")
+    parser.add_argument('--folder', default=SPEC_SHEETS_FOLDER)
+    parser.add_argument('--store', choices=['local', 'pg'], default='local')
+    parser.add_argument('--state-file', default=DEFAULT_STATE_FILE, help="State for --store local")
+    parser.add_argument('--embedder', choices=['hashing', 'titan'], default='hashing')
+    parser.add_argument('--workers', type=int, default=None, help="Parser processes")
+    parser.add_argument('--batch-size', type=int, default=EMBED_BATCH_SIZE)
+    parser.add_argument('--source-uri-prefix', default=SOURCE_URI_PREFIX,
+                        help="e.g. s3://your-bucket/ so sources match the KB data source")
+    parser.add_argument('--allow-empty', action='store_true',
+                        help="Run even if the folder has no files, tombstoning every chunk")
+    args = parser.parse_args()
+
+    # The table is vector(1536); the hashing embedder is sized to match
+    embedder = TitanEmbedder() if args.embedder == 'titan' else HashingEmbedder(1536)
+    if args.store == 'pg':
+        from pgvector_retrieval import PgVectorRetriever
+        store = PgChunkStore(PgVectorRetriever(embedder=embedder))
+    else:
+        store = LocalChunkStore(args.state_file)
+
+    stats = ingest(store, embedder, args.folder, args.workers, args.batch_size, args.source_uri_prefix,
+                   args.allow_empty)
+    if stats is None:
+        sys.exit(1)
+    if stats['added'] or stats['tombstoned'] or stats['retagged']:
+        publish_kb_version(f"ingest-{uuid.uuid4().hex}")
+    print(f"Files: {stats.get('files', 0)}  Pages: {stats.get('pages', 0)}  Chunks: {stats.get('chunks', 0)}")
+    print(f"  + Added/changed: {stats['added']}")
+    print(f"  = Unchanged:     {stats['unchanged']} ({stats['retagged']} re-tagged)")
+    print(f"  - Tombstoned:    {stats['tombstoned']}")
+    print(f"Throughput: {stats['pages_per_sec']:.1f} pages/sec, {stats['chunks_per_sec']:.1f} chunks/sec, "
+          f"{stats['embeddings_per_sec']:.1f} embeddings/sec ({stats['seconds']:.2f}s total)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Load test for the async Bedrock API against a local fake Bedrock endpoint.
+
+Starts a small HTTP server that answers InvokeModel and Retrieve requests
+after a configurable delay, points bedrock_async at it and runs chat turns
+(validate + retrieve concurrently, then generate) from 1, 10 and 100
+concurrent sessions. Reports p50/p99 turn latency and queries/sec.
+
+Usage:
+    python scripts/load_test_async.py
+    python scripts/load_test_async.py --sessions 1 10 100 --turns 5 --latency-ms 50
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bedrock_async import AsyncBedrock
+
+
+class FakeBedrockHandler(BaseHTTPRequestHandler):
+    """Answers bedrock-runtime InvokeModel and bedrock-agent-runtime Retrieve calls."""
+
+    protocol_version = 'HTTP/1.1'  # Keep-alive, so the client pool is exercised
+    disable_nagle_algorithm = True
+    latency_ms = 50
+    jitter_ms = 10
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b"{}")
+        time.sleep(max(0.0, self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000)
+
+        if self.path.endswith('/invoke'):
+            text = "Category E" if body.get("max_tokens") == 10 else "The FL250 lifts up to 2,500 kg."
+            payload = {"content": [{"type": "text", "text": text}]}
+        elif self.path.endswith('/retrieve'):
+            payload = {"retrievalResults": [
+                {
+                    "content": {"text": f"Fake chunk {i} about heavy machinery."},
+                    "location": {"s3Location": {"uri": f"s3://fake-bucket/spec-{i}.pdf"}},
+                    "score": 0.9 - i * 0.1,
+                }
+                for i in range(3)
+            ]}
+        else:
+            self.send_error(404)
+            return
+
+        data = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass  # Keep the benchmark output readable
+
+
+def start_fake_bedrock(latency_ms=50, jitter_ms=10):
+    """Starts the fake endpoint on a free local port. Returns (server, endpoint_url)."""
+    FakeBedrockHandler.latency_ms = latency_ms
+    FakeBedrockHandler.jitter_ms = jitter_ms
+    ThreadingHTTPServer.request_queue_size = 1024  # Don't drop connects at 100 sessions
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeBedrockHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+async def chat_turn(client, prompt):
+    """One chat turn: validation and retrieval together, then generation."""
+    is_valid, chunks = await asyncio.gather(
+        client.valid_prompt(prompt),
+        client.query_knowledge_base(prompt)
+    )
+    if not is_valid or not chunks:
+        return ""
+    return await client.generate_response(prompt)
+
+
+async def run_sessions(client, sessions, turns):
+    """Runs `sessions` concurrent sessions of `turns` turns each. Returns latencies in ms."""
+    latencies = []
+
+    async def session(session_id):
+        for turn in range(turns):
+            start = time.perf_counter()
+            await chat_turn(client, f"Session {session_id} question {turn} about the FL250?")
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(session(i) for i in range(sessions)))
+    return latencies
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the async Bedrock API")
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--turns', type=int, default=5, help="Chat turns per session")
+    parser.add_argument('--latency-ms', type=float, default=50, help="Fake endpoint latency")
+    parser.add_argument('--pool-size', type=int, default=50)
+    parser.add_argument('--max-in-flight', type=int, default=50)
+    args = parser.parse_args()
+
+    server, endpoint_url = start_fake_bedrock(args.latency_ms)
+    print(f"Fake Bedrock endpoint: {endpoint_url} ({args.latency_ms:.0f} ms per call)")
+    print(f"{'sessions':>8} {'turns':>6} {'p50 ms':>9} {'p99 ms':>9} {'qps':>8}")
+
+    for sessions in args.sessions:
+        client = AsyncBedrock(
+            pool_size=args.pool_size,
+            max_in_flight=args.max_in_flight,
+            max_waiting=sessions * 3,
+            endpoint_url=endpoint_url,
+            aws_access_key_id='fake',
+            aws_secret_access_key='fake'
+        )
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):  # Hide per-call category prints
+            latencies = asyncio.run(run_sessions(client, sessions, args.turns))
+        elapsed = time.perf_counter() - start
+        client.close()
+
+        print(f"{sessions:>8} {len(latencies):>6} {percentile(latencies, 50):>9.1f} "
+              f"{percentile(latencies, 99):>9.1f} {len(latencies) / elapsed:>8.1f}")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Load test for chat_server.py.
+
+Starts the server in-process on the offline fake backend (or targets a
+running server with --url) and runs --turns chat turns from each of 1, 10
+and 100 concurrent sessions, over streamed HTTP (SSE) or WebSocket.
+Each session keeps one connection open, as a browser tab would.
+
+Reports turns/sec, p50/p99 turn latency, time to the first streamed piece
+and how many turns were refused (429 rate limited / 503 busy).
+
+Usage:
+    python scripts/load_test_server.py
+    python scripts/load_test_server.py --transport ws --sessions 1 10 100 --turns 5
+    python scripts/load_test_server.py --url http://127.0.0.1:8080
+"""
+import argparse
+import base64
+import contextlib
+import http.client
+import io
+import json
+import os
+import socket
+import struct
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from benchmark_hybrid import LABELLED_QUESTIONS
+
+QUESTIONS = [question for question, _ in LABELLED_QUESTIONS]
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+def http_session(host, port, index, turns):
+    """One session over a keep-alive HTTP connection. Returns [(seconds, first, status)]."""
+    connection = http.client.HTTPConnection(host, port, timeout=120)
+    session_id = None
+    results = []
+    for turn in range(turns):
+        body = json.dumps({"message": QUESTIONS[(index + turn) % len(QUESTIONS)], "session_id": session_id})
+        start = time.perf_counter()
+        connection.request("POST", "/chat", body, {"Content-Type": "application/json"})
+        response = connection.getresponse()
+        if response.status != 200:
+            response.read()
+            results.append((time.perf_counter() - start, None, response.status))
+            continue
+        session_id = response.getheader('X-Session-Id')
+        first = None
+        while True:
+            line = response.readline()
+            if not line:
+                break
+            if first is None and line.startswith(b"data:"):
+                first = time.perf_counter() - start
+        results.append((time.perf_counter() - start, first, 200))
+    connection.close()
+    return results
+
+
+class WebSocketClient:
+    """Just enough of a WebSocket client for the load test (text frames, masked)."""
+
+    def __init__(self, host, port):
+        self.sock = socket.create_connection((host, port), timeout=120)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        key = base64.b64encode(os.urandom(16)).decode()
+        self.sock.sendall((f"GET /ws HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\n"
+                           f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\n"
+                           f"Sec-WebSocket-Version: 13\r\n\r\n").encode())
+        self.file = self.sock.makefile('rb')
+        status = self.file.readline()
+        if b" 101 " not in status:
+            raise ConnectionError(f"WebSocket upgrade refused: {status!r}")
+        while self.file.readline() not in (b"\r\n", b""):
+            pass
+
+    def send(self, message):
+        payload = json.dumps(message).encode('utf-8')
+        mask = os.urandom(4)
+        if len(payload) < 126:
+            header = bytes([0x81, 0x80 | len(payload)])
+        else:
+            header = bytes([0x81, 0x80 | 126]) + struct.pack("!H", len(payload))
+        self.sock.sendall(header + mask + bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload)))
+
+    def receive(self):
+        first, second = self.file.read(2)
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack("!H", self.file.read(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", self.file.read(8))[0]
+        payload = self.file.read(length)
+        return json.loads(payload) if first & 0x0F == 0x1 else None
+
+    def close(self):
+        with contextlib.suppress(OSError):
+            self.sock.sendall(bytes([0x88, 0x80]) + os.urandom(4))
+            self.sock.close()
+
+
+def ws_session(host, port, index, turns):
+    """One session over a single WebSocket. Returns [(seconds, first, status)]."""
+    client = WebSocketClient(host, port)
+    client.receive()  # {"type": "session", ...}
+    results = []
+    for turn in range(turns):
+        start = time.perf_counter()
+        client.send({"message": QUESTIONS[(index + turn) % len(QUESTIONS)]})
+        first, status = None, 200
+        while True:
+            message = client.receive()
+            if message is None:
+                continue
+            if message['type'] == "delta" and first is None:
+                first = time.perf_counter() - start
+            elif message['type'] == "error":
+                status = 429 if message['error'] == "rate_limited" else 503
+                break
+            elif message['type'] == "done":
+                break
+        results.append((time.perf_counter() - start, first, status))
+    client.close()
+    return results
+
+
+def run(host, port, transport, sessions, turns):
+    session = http_session if transport == "http" else ws_session
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        results = [result for results in pool.map(lambda i: session(host, port, i, turns), range(sessions))
+                   for result in results]
+    elapsed = time.perf_counter() - start
+    answered = [result for result in results if result[2] == 200]
+    latencies = [seconds for seconds, _, _ in answered]
+    firsts = [first for _, first, _ in answered if first is not None]
+    refused = {status: sum(1 for result in results if result[2] == status) for status in (429, 503)}
+    return len(answered) / elapsed, latencies, firsts, refused
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent sessions against chat_server.py")
+    parser.add_argument('--url', help="Running server to test (default: start one on the fake backend)")
+    parser.add_argument('--transport', choices=("http", "ws"), default="http")
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--turns', type=int, default=5, help="Turns per session")
+    parser.add_argument('--session-rate', type=float, default=0, help="In-process server: turns/sec per session")
+    parser.add_argument('--max-turns', type=int, default=128, help="In-process server: concurrent turn limit")
+    parser.add_argument('--invoke-latency', default="lognormal:0.08,0.3")
+    parser.add_argument('--retrieve-latency', default="lognormal:0.05,0.3")
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        target = urlparse(args.url)
+        host, port = target.hostname, target.port or 80
+    else:
+        import chat_server
+        chat_server.install_fake_backend(args.invoke_latency, args.retrieve_latency)
+        service = chat_server.ChatService(chat_server.SessionStore(args.session_rate or None), args.max_turns,
+                                          mode="threads")
+        server = chat_server.start_server(port=0, service=service, quiet=True)
+        host, port = server.server_address
+
+    print(f"{args.transport} transport, {args.turns} turns per session\n")
+    print(f"{'sessions':>8} {'turns/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'first ms':>9} {'429':>5} {'503':>5}")
+    for sessions in args.sessions:
+        # The in-process pipeline prints status lines for every turn; keep the table readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = run(host, port, args.transport, sessions, args.turns)
+        print_row(sessions, result)
+
+    if server is not None:
+        chat_server.stop_server(server, drain_seconds=5)
+
+
+def print_row(sessions, result):
+    throughput, latencies, firsts, refused = result
+    print(f"{sessions:>8} {throughput:>8.1f} {1000 * _percentile(latencies, 0.5):>8.0f} "
+          f"{1000 * _percentile(latencies, 0.99):>8.0f} {1000 * _percentile(firsts, 0.5):>9.0f} "
+          f"{refused[429]:>5} {refused[503]:>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Offline Vector Index over the spec-sheets corpus
+Author: Ahmad
+Description: Fully local retrieval engine for edge sites and fast tests.
+
+Chunks spec-sheets/ (see spec_corpus.py), embeds the chunks with a pluggable
+embedder (see embedders.py) and stores:
+
+    vectors.npy  - float32 matrix, rows grouped by IVF cluster, memory-mapped on load
+    centroids.npy- IVF cluster centroids (spherical k-means)
+    offsets.npy  - start row of each cluster in vectors.npy
+    chunks.json  - chunk text + metadata in the same row order
+    index.json   - embedder name/dimensions and build settings
+
+A query scores the centroids, then runs one batched matrix product over the
+rows of the `nprobe` closest clusters (contiguous slices of the mmap) and
+picks the top k with argpartition. A search filtered on machine_model
+skips the clusters and scores exactly the rows of the requested models
+(row lists built once on load). Results use the retrievalResults shape,
+so chat.py works unchanged:
+
+    from bedrock_utils import set_retrieval_backend
+    from local_index import LocalVectorIndex
+    set_retrieval_backend(LocalVectorIndex.load())
+
+Usage:
+    python scripts/local_index.py build [--embedder hashing|titan] [--index-dir DIR]
+    python scripts/local_index.py query "What is the payload of the DT1000?"
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from embedders import HashingEmbedder, TitanEmbedder
+from spec_corpus import SPEC_SHEETS_FOLDER, load_chunks, matches_filters, to_retrieval_result
+
+DEFAULT_INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".local_index")
+DEFAULT_NPROBE = 8
+PARTITION_KEY = "machine_model"  # Filter key with precomputed row lists
+
+
+def make_embedder(name, dimensions=None):
+    """Builds an embedder from the name stored in index.json."""
+    if name == "titan":
+        return TitanEmbedder()
+    if name == "hashing":
+        return HashingEmbedder(dimensions) if dimensions else HashingEmbedder()
+    raise ValueError(f"Unknown embedder: {name!r}")
+
+
+def spherical_kmeans(vectors, n_clusters, iterations=20, seed=0):
+    """Clusters L2-normalized vectors by cosine similarity. Returns (centroids, labels)."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        labels = np.argmax(vectors @ centroids.T, axis=1)
+        for cluster in range(n_clusters):
+            members = vectors[labels == cluster]
+            if len(members):
+                centroid = members.sum(axis=0)
+                centroids[cluster] = centroid / (np.linalg.norm(centroid) or 1.0)
+    return centroids, np.argmax(vectors @ centroids.T, axis=1)
+
+
+def build_index(index_dir=DEFAULT_INDEX_DIR, embedder=None, folder=SPEC_SHEETS_FOLDER, n_clusters=None):
+    """
+    Chunks, embeds and writes the index files to `index_dir`.
+
+    Parameters:
+        index_dir: Output folder (created if missing)
+        embedder: Embedder instance (default: HashingEmbedder)
+        folder: Corpus folder
+        n_clusters: IVF cluster count (default: about sqrt(number of chunks))
+
+    Returns:
+        Number of chunks indexed
+    """
+    embedder = embedder or HashingEmbedder()
+    chunks = load_chunks(folder)
+    vectors = embedder.embed_batch([chunk['text'] for chunk in chunks]).astype(np.float32)
+
+    n_clusters = n_clusters or max(1, int(np.sqrt(len(chunks))))
+    n_clusters = min(n_clusters, len(chunks))
+    centroids, labels = spherical_kmeans(vectors, n_clusters)
+
+    # Store rows cluster by cluster so each cluster is one contiguous slice
+    order = np.argsort(labels, kind='stable')
+    offsets = np.searchsorted(labels[order], np.arange(n_clusters + 1))
+
+    os.makedirs(index_dir, exist_ok=True)
+    np.save(os.path.join(index_dir, "vectors.npy"), vectors[order])
+    np.save(os.path.join(index_dir, "centroids.npy"), centroids.astype(np.float32))
+    np.save(os.path.join(index_dir, "offsets.npy"), offsets.astype(np.int64))
+    with open(os.path.join(index_dir, "chunks.json"), 'w', encoding='utf-8') as chunks_file:
+        json.dump([chunks[i] for i in order], chunks_file)
+    with open(os.path.join(index_dir, "index.json"), 'w', encoding='utf-8') as info_file:
+        json.dump({
+            'embedder': embedder.name,
+            'dimensions': int(vectors.shape[1]),
+            'chunks': len(chunks),
+            'clusters': n_clusters,
+        }, info_file, indent=1)
+    return len(chunks)
+
+
+class LocalVectorIndex:
+    """
+    Memory-mapped IVF vector index; a drop-in retrieval backend.
+
+    Use LocalVectorIndex.load() to open an index written by build_index().
+    """
+
+    name = "local"
+
+    def __init__(self, vectors, centroids, offsets, chunks, embedder, nprobe=DEFAULT_NPROBE):
+        self.vectors = vectors
+        self.centroids = centroids
+        self.offsets = offsets
+        self.chunks = chunks
+        self.embedder = embedder
+        self.nprobe = nprobe
+        partitions = {}
+        for row, chunk in enumerate(chunks):
+            partitions.setdefault(str(chunk['metadata'].get(PARTITION_KEY)), []).append(row)
+        self.partitions = {value: np.array(rows, dtype=np.int64) for value, rows in partitions.items()}
+
+    @classmethod
+    def load(cls, index_dir=DEFAULT_INDEX_DIR, embedder=None, nprobe=DEFAULT_NPROBE):
+        """Opens an index without reading the vectors into memory."""
+        with open(os.path.join(index_dir, "index.json"), encoding='utf-8') as info_file:
+            info = json.load(info_file)
+        with open(os.path.join(index_dir, "chunks.json"), encoding='utf-8') as chunks_file:
+            chunks = json.load(chunks_file)
+        if embedder is None:
+            embedder = make_embedder(info['embedder'], info['dimensions'])
+        return cls(
+            np.load(os.path.join(index_dir, "vectors.npy"), mmap_mode='r'),
+            np.load(os.path.join(index_dir, "centroids.npy")),
+            np.load(os.path.join(index_dir, "offsets.npy")),
+            chunks,
+            embedder,
+            nprobe
+        )
+
+    def search_batch(self, queries, number_of_results=3, nprobe=None):
+        """
+        Top-k search for several query vectors at once.
+
+        Parameters:
+            queries: (n, dimensions) array of normalized query vectors
+            number_of_results: k
+            nprobe: Clusters scanned per query (more = better recall, slower)
+
+        Returns:
+            List (one per query) of [(row, score)], best first
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        probes = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :nprobe]
+
+        results = []
+        for query, clusters in zip(queries, probes):
+            rows = np.concatenate([
+                np.arange(self.offsets[c], self.offsets[c + 1]) for c in clusters
+            ])
+            if not len(rows):
+                results.append([])
+                continue
+            # Clusters are contiguous, so sorted rows read the mmap sequentially
+            rows.sort()
+            scores = self.vectors[rows] @ query
+            k = min(number_of_results, len(rows))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            results.append([(int(rows[i]), float(scores[i])) for i in top])
+        return results
+
+    def search_partitions(self, query, values, number_of_results=3):
+        """
+        Exact top-k over the rows whose PARTITION_KEY is one of `values`.
+
+        Returns:
+            [(row, score)], best first
+        """
+        if not isinstance(values, (list, tuple, set)):
+            values = [values]
+        parts = [self.partitions[str(value)] for value in values if str(value) in self.partitions]
+        if not parts:
+            return []
+        rows = np.sort(np.concatenate(parts))
+        scores = self.vectors[rows] @ np.asarray(query, dtype=np.float32)
+        k = min(number_of_results, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(rows[i]), float(scores[i])) for i in top]
+
+    def retrieve(self, query, number_of_results=3, filters=None):
+        """Embeds `query` and returns retrievalResults-shaped matches."""
+        vector = self.embedder(query)
+        if vector is None:
+            return []
+        # Over-fetch when filtering so enough matches survive the filter
+        fetch = number_of_results * 10 if filters else number_of_results
+        if filters and PARTITION_KEY in filters:
+            matches = self.search_partitions(vector, filters[PARTITION_KEY], fetch)
+        else:
+            matches = self.search_batch([vector], fetch)[0]
+        results = []
+        for row, score in matches:
+            chunk = self.chunks[row]
+            if filters and not matches_filters(chunk['metadata'], filters):
+                continue
+            results.append(to_retrieval_result(chunk['text'], chunk['metadata'], score))
+            if len(results) == number_of_results:
+                break
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the offline spec-sheet index")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    build = subcommands.add_parser('build')
+    build.add_argument('--embedder', choices=['hashing', 'titan'], default='hashing')
+    build.add_argument('--index-dir', default=DEFAULT_INDEX_DIR)
+    build.add_argument('--folder', default=SPEC_SHEETS_FOLDER)
+    query = subcommands.add_parser('query')
+    query.add_argument('text')
+    query.add_argument('--index-dir', default=DEFAULT_INDEX_DIR)
+    query.add_argument('--top-k', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        count = build_index(args.index_dir, make_embedder(args.embedder), args.folder)
+        print(f"Indexed {count} chunks into {args.index_dir} in {time.perf_counter() - start:.2f}s")
+        return
+
+    start = time.perf_counter()
+    index = LocalVectorIndex.load(args.index_dir)
+    loaded = time.perf_counter()
+    results = index.retrieve(args.text, args.top_k)
+    done = time.perf_counter()
+    print(f"Cold start {1000 * (loaded - start):.1f} ms, query {1000 * (done - loaded):.1f} ms\n")
+    for result in results:
+        print(f"[{result['score']:.3f}] {result['location']['s3Location']['uri']}")
+        print(f"    {result['content']['text'][:150]!r}")
+
+
+if __name__ == "__main__":
+    main()
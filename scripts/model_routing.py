@@ -0,0 +1,160 @@
+"""
+Model Routing Tier
+Author: Ahmad
+Description: Sends each kind of Claude call to the model that fits it.
+
+A one-letter classification doesn't need Sonnet. A ModelRouter maps each
+task ("route") to a model profile - model id, max_tokens and sampling:
+
+    classify      -> Haiku, 10 tokens, temperature 0    (valid_prompt)
+    summarize     -> Haiku, 300 tokens
+    answer        -> Sonnet, 500 tokens                (generate_response)
+    answer_small  -> Haiku, 500 tokens                 (only with escalation on)
+
+With escalation on, answers start on "answer_small" and go to "answer"
+when the question looks complex or the retrieved chunks score low.
+
+Every routed call records latency and token usage per route; stats() and
+report() show them so the profiles can be tuned.
+
+Usage:
+    from bedrock_utils import set_model_router
+    from model_routing import ModelRouter
+    router = ModelRouter(escalation=True)
+    set_model_router(router)
+    ...
+    print(router.report())
+"""
+import re
+import threading
+from collections import deque
+
+HAIKU_MODEL_ID = "anthropic.claude-3-haiku-20240307-v1:0"
+SONNET_MODEL_ID = "anthropic.claude-3-sonnet-20240229-v1:0"
+
+DEFAULT_ROUTES = {
+    "classify": {"model_id": HAIKU_MODEL_ID, "max_tokens": 10, "temperature": 0, "top_p": 0.1},
+    "summarize": {"model_id": HAIKU_MODEL_ID, "max_tokens": 300, "temperature": 0.1, "top_p": 0.9},
+    "answer": {"model_id": SONNET_MODEL_ID, "max_tokens": 500, "temperature": 0.1, "top_p": 0.9},
+    "answer_small": {"model_id": HAIKU_MODEL_ID, "max_tokens": 500, "temperature": 0.1, "top_p": 0.9},
+}
+
+# Escalation triggers
+COMPLEX_QUERY_WORDS = 25     # Longer questions go to the large model
+MIN_RETRIEVAL_SCORE = 0.5    # Best chunk scoring below this -> large model
+COMPLEX_QUERY_PATTERN = re.compile(
+    r"\b(compare|comparison|versus|vs|difference|differences|why|explain|trade-?offs?|recommend\w*)\b",
+    re.IGNORECASE
+)
+MODEL_CODE_PATTERN = re.compile(r"\b[a-z]{1,3}-?\d{3,4}\b", re.IGNORECASE)
+
+LATENCY_SAMPLES = 1000  # Recent latencies kept per route for percentiles
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class ModelRouter:
+    """
+    Maps tasks to model profiles and keeps per-route counters.
+
+    Parameters:
+        routes: {route: {'model_id', 'max_tokens', 'temperature', 'top_p'}},
+                merged over DEFAULT_ROUTES
+        escalation: Answer on "answer_small" unless a trigger escalates to "answer"
+        min_retrieval_score / complex_query_words: Escalation thresholds
+    """
+
+    def __init__(self, routes=None, escalation=False, min_retrieval_score=MIN_RETRIEVAL_SCORE,
+                 complex_query_words=COMPLEX_QUERY_WORDS):
+        self.routes = {name: dict(profile) for name, profile in DEFAULT_ROUTES.items()}
+        for name, profile in (routes or {}).items():
+            self.routes[name] = dict(self.routes.get(name, {}), **profile)
+        self.escalation = escalation
+        self.min_retrieval_score = min_retrieval_score
+        self.complex_query_words = complex_query_words
+        self.escalations = 0
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def profile(self, route):
+        """Returns the profile dict for `route` (KeyError for unknown routes)."""
+        return self.routes[route]
+
+    def is_complex(self, query):
+        """Heuristic: long, comparative/explanatory, or about several models."""
+        if len(query.split()) > self.complex_query_words or query.count("?") > 1:
+            return True
+        if COMPLEX_QUERY_PATTERN.search(query):
+            return True
+        return len(set(code.lower() for code in MODEL_CODE_PATTERN.findall(query))) > 1
+
+    def answer_route(self, query, context_chunks=()):
+        """Picks the route for answering `query` from `context_chunks`."""
+        if not self.escalation:
+            return "answer"
+        # Rerank scores replace 'score'; the retriever's own score is kept in 'retrievalScore'
+        scores = [chunk.get('retrievalScore', chunk.get('score')) for chunk in context_chunks]
+        scores = [score for score in scores if score is not None]
+        low_scores = not scores or max(scores) < self.min_retrieval_score
+        if low_scores or self.is_complex(query):
+            with self._lock:
+                self.escalations += 1
+            return "answer"
+        return "answer_small"
+
+    def _counter(self, route):
+        counter = self._counters.get(route)
+        if counter is None:
+            counter = self._counters[route] = {
+                'calls': 0, 'errors': 0, 'input_tokens': 0, 'output_tokens': 0,
+                'latencies': deque(maxlen=LATENCY_SAMPLES),
+            }
+        return counter
+
+    def record(self, route, seconds, usage=None):
+        """Counts one finished call; `usage` is Claude's {'input_tokens', 'output_tokens'}."""
+        usage = usage or {}
+        with self._lock:
+            counter = self._counter(route)
+            counter['calls'] += 1
+            counter['latencies'].append(seconds)
+            counter['input_tokens'] += usage.get('input_tokens') or 0
+            counter['output_tokens'] += usage.get('output_tokens') or 0
+
+    def record_error(self, route):
+        with self._lock:
+            self._counter(route)['errors'] += 1
+
+    def stats(self):
+        """Per-route calls, errors, latency (p50/p95/mean seconds) and token totals."""
+        with self._lock:
+            snapshot = {
+                route: dict(counter, latencies=list(counter['latencies']))
+                for route, counter in self._counters.items()
+            }
+        result = {}
+        for route, counter in snapshot.items():
+            latencies = counter.pop('latencies')
+            counter['model_id'] = self.routes.get(route, {}).get('model_id')
+            counter['p50'] = _percentile(latencies, 0.50)
+            counter['p95'] = _percentile(latencies, 0.95)
+            counter['mean'] = sum(latencies) / len(latencies) if latencies else None
+            result[route] = counter
+        return result
+
+    def report(self):
+        """Formats stats() as a table."""
+        lines = [f"{'route':<13} {'calls':>6} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} "
+                 f"{'in tok':>8} {'out tok':>8}  model"]
+        for route, counter in sorted(self.stats().items()):
+            p50 = f"{1000 * counter['p50']:.0f}" if counter['p50'] is not None else "-"
+            p95 = f"{1000 * counter['p95']:.0f}" if counter['p95'] is not None else "-"
+            lines.append(f"{route:<13} {counter['calls']:>6} {counter['errors']:>6} {p50:>8} {p95:>8} "
+                         f"{counter['input_tokens']:>8} {counter['output_tokens']:>8}  {counter['model_id']}")
+        lines.append(f"Escalations to the large model: {self.escalations}")
+        return "\n".join(lines)
@@ -0,0 +1,247 @@
+"""
+Direct pgvector Retrieval for the Heavy Machinery Knowledge Base
+Author: Ahmad
+Description: Queries ahmad_bedrock_schema.ahmad_knowledge_base (see
+             aurora_sql.sql) directly over pooled Postgres connections,
+             skipping the managed Bedrock `retrieve` hop.
+
+The query is embedded with the same Titan model the Knowledge Base used for
+the chunks, then matched against the HNSW cosine index. Results come back in
+the same shape as bedrock_kb.retrieve()['retrievalResults'], so chat.py works
+unchanged.
+
+Filters on `machine_model` (see query_knowledge_base) are served by one
+partial HNSW index per machine (ensure_partition_indexes, created by
+ingest.py), so a filtered search walks only that machine's rows instead of
+post-filtering the candidates of the table-wide index. Several machines are
+searched as one UNION ALL branch each.
+
+Connection settings come from the standard libpq environment variables
+(PGHOST, PGPORT, PGUSER, PGPASSWORD, PGDATABASE), explicit keyword
+arguments, or the Aurora secret in Secrets Manager.
+
+Usage:
+    from bedrock_utils import set_retrieval_backend
+    from pgvector_retrieval import PgVectorRetriever
+    set_retrieval_backend(PgVectorRetriever(secret_arn="arn:aws:secretsmanager:...", ef_search=64))
+"""
+import json
+import re
+import threading
+from contextlib import contextmanager
+
+import boto3
+from psycopg2.pool import ThreadedConnectionPool
+
+from spec_corpus import SOURCE_URI_KEY, to_retrieval_result
+
+TABLE_NAME = "ahmad_bedrock_schema.ahmad_knowledge_base"
+DEFAULT_EF_SEARCH = 40  # pgvector's default; higher = better recall, slower
+PARTITION_KEY = "machine_model"  # Metadata key with one partial HNSW index per value
+
+
+def load_db_secret(secret_arn, region=None):
+    """
+    Reads Aurora connection settings from a Secrets Manager secret.
+
+    Returns:
+        Dict of psycopg2.connect keyword arguments
+    """
+    from bedrock_utils import AWS_REGION
+
+    secrets = boto3.client(service_name='secretsmanager', region_name=region or AWS_REGION)
+    secret = json.loads(secrets.get_secret_value(SecretId=secret_arn)['SecretString'])
+    return {
+        'host': secret['host'],
+        'port': secret.get('port', 5432),
+        'user': secret['username'],
+        'password': secret['password'],
+        'dbname': secret.get('dbname', 'postgres'),
+    }
+
+
+def partition_index_name(value):
+    """Name of the partial HNSW index for one PARTITION_KEY value, e.g. ahmad_kb_embedding_bd850_idx."""
+    return f"ahmad_kb_embedding_{re.sub(r'[^a-z0-9]+', '_', str(value).lower()).strip('_')[:40]}_idx"
+
+
+def vector_literal(vector):
+    """Formats a vector as a pgvector text literal, e.g. '[0.1,0.2]'."""
+    return "[" + ",".join(f"{value:.7g}" for value in vector) + "]"
+
+
+class PgVectorRetriever:
+    """
+    Retrieval backend that searches the pgvector table directly.
+
+    Parameters:
+        embedder: Callable text -> vector; defaults to bedrock_utils.embed_text
+        ef_search: HNSW candidate list size per query (recall/latency knob)
+        filters: Default metadata filters {key: value or [values]} for every query
+        min_connections / max_connections: Connection pool bounds
+        secret_arn: Optional Secrets Manager secret with the DB credentials
+        **connect_kwargs: Extra psycopg2.connect arguments (host, user, ...)
+    """
+
+    name = "pgvector"
+
+    def __init__(self, embedder=None, ef_search=DEFAULT_EF_SEARCH, filters=None,
+                 min_connections=1, max_connections=10, secret_arn=None, table=TABLE_NAME,
+                 **connect_kwargs):
+        if embedder is None:
+            from bedrock_utils import embed_text
+            embedder = embed_text
+        if secret_arn:
+            connect_kwargs = dict(load_db_secret(secret_arn), **connect_kwargs)
+        self.embedder = embedder
+        self.ef_search = ef_search
+        self.filters = filters or {}
+        self.table = table
+        self.pool = ThreadedConnectionPool(min_connections, max_connections, **connect_kwargs)
+        self._pool_slots = threading.BoundedSemaphore(max_connections)
+
+    @contextmanager
+    def connection(self):
+        """Borrows a pooled connection, waiting if all of them are busy."""
+        with self._pool_slots:
+            conn = self.pool.getconn()
+            try:
+                with conn:  # Commit on success, roll back on error
+                    yield conn
+            finally:
+                self.pool.putconn(conn)
+
+    def search(self, vector, number_of_results=3, filters=None, ef_search=None):
+        """
+        Nearest-neighbour search by embedding vector.
+
+        Parameters:
+            vector: Query embedding
+            number_of_results: Top-k chunks to return
+            filters: Metadata filters {key: value or [values]}, merged over the defaults
+            ef_search: Overrides the retriever's ef_search for this query
+
+        Returns:
+            List shaped like retrievalResults, best match first
+        """
+        filters = dict(self.filters, **(filters or {}))
+        literal = vector_literal(vector)
+        partitions = filters.get(PARTITION_KEY)
+        if isinstance(partitions, (list, tuple, set)) and len(partitions) > 1:
+            # One branch per machine, so each can use that machine's partial index
+            branches, params = [], []
+            for value in sorted(str(item) for item in partitions):
+                branch, branch_params = self._nearest_query(literal, dict(filters, **{PARTITION_KEY: value}),
+                                                            number_of_results)
+                branches.append(f"({branch})")
+                params += branch_params
+            query = " UNION ALL ".join(branches) + " ORDER BY score DESC LIMIT %s"
+            params.append(number_of_results)
+        else:
+            if isinstance(partitions, (list, tuple, set)):
+                filters[PARTITION_KEY] = next(iter(partitions))  # "= value" matches the partial index
+            query, params = self._nearest_query(literal, filters, number_of_results)
+
+        with self.connection() as conn, conn.cursor() as cursor:
+            # SET LOCAL only lasts for this transaction, so pooled connections stay clean
+            cursor.execute("SET LOCAL hnsw.ef_search = %s", (int(ef_search or self.ef_search),))
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+
+        return [to_retrieval_result(chunks, metadata, float(score)) for chunks, metadata, score in rows]
+
+    def retrieve(self, query, number_of_results=3, filters=None, ef_search=None):
+        """Embeds `query` and searches for it. Returns [] if embedding failed."""
+        vector = self.embedder(query)
+        if vector is None:
+            return []
+        return self.search(vector, number_of_results, filters, ef_search)
+
+    def full_text_search(self, query, number_of_results=3, filters=None):
+        """
+        Lexical search over the chunks using the GIN to_tsvector('english') index.
+
+        Any query word may match (OR); rows are ranked with ts_rank_cd, which
+        rewards chunks where the words occur often and close together. Exact
+        model codes such as "DT1000" survive as single tokens.
+
+        Returns:
+            List shaped like retrievalResults, best match first
+        """
+        words = re.findall(r"[a-z0-9]+", query.lower())
+        if not words:
+            return []
+        conditions, params = self._filter_conditions(dict(self.filters, **(filters or {})))
+        # Same expression as the index, so the planner can use it
+        conditions.insert(0, "to_tsvector('english', chunks) @@ ts_query")
+
+        with self.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                f"SELECT chunks, metadata, ts_rank_cd(to_tsvector('english', chunks), ts_query) AS score "
+                f"FROM {self.table}, to_tsquery('english', %s) AS ts_query "
+                f"WHERE {' AND '.join(conditions)} "
+                f"ORDER BY score DESC LIMIT %s",
+                [" | ".join(words)] + params + [number_of_results]
+            )
+            rows = cursor.fetchall()
+
+        return [to_retrieval_result(chunks, metadata, float(score)) for chunks, metadata, score in rows]
+
+    def _nearest_query(self, literal, filters, number_of_results):
+        """SELECT for the nearest rows matching `filters`. Returns (sql, params)."""
+        conditions, params = self._filter_conditions(filters)
+        return (
+            f"SELECT chunks, metadata, 1 - (embedding <=> %s::vector) AS score "
+            f"FROM {self.table} WHERE {' AND '.join(conditions)} "
+            f"ORDER BY embedding <=> %s::vector LIMIT %s",
+            [literal] + params + [literal, number_of_results]
+        )
+
+    def ensure_partition_indexes(self, values):
+        """
+        Creates the partial HNSW index of each PARTITION_KEY value that has none yet.
+
+        The predicate matches what _filter_conditions() generates for
+        {PARTITION_KEY: value}, so the planner can pick the index.
+        """
+        with self.connection() as conn, conn.cursor() as cursor:
+            for value in sorted({str(value) for value in values}):
+                cursor.execute(
+                    f"CREATE INDEX IF NOT EXISTS {partition_index_name(value)} ON {self.table} "
+                    f"USING hnsw (embedding vector_cosine_ops) "
+                    f"WHERE metadata->>'tombstoned' IS NULL AND metadata->>%s = %s",
+                    (PARTITION_KEY, value)
+                )
+
+    @staticmethod
+    def _filter_conditions(filters):
+        """Turns {key: value or [values]} into SQL conditions on the json metadata column."""
+        # Rows tombstoned by ingest.py stay in the table but are never returned
+        conditions, params = ["metadata->>'tombstoned' IS NULL"], []
+        for key, value in filters.items():
+            if isinstance(value, (list, tuple, set)):
+                conditions.append("metadata->>%s = ANY(%s)")
+                params += [key, [str(item) for item in value]]
+            else:
+                conditions.append("metadata->>%s = %s")
+                params += [key, str(value)]
+        return conditions, params
+
+    def close(self):
+        self.pool.closeall()
+
+
+class PgFullTextRetriever:
+    """
+    Lexical retrieval backend sharing a PgVectorRetriever's connection pool.
+
+    Useful as the `lexical` half of hybrid_retrieval.HybridRetriever.
+    """
+
+    name = "pg_fulltext"
+
+    def __init__(self, pg_retriever):
+        self.pg_retriever = pg_retriever
+
+    def retrieve(self, query, number_of_results=3, filters=None):
+        return self.pg_retriever.full_text_search(query, number_of_results, filters)
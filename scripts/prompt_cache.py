@@ -0,0 +1,167 @@
+"""
+Classification Cache for valid_prompt
+Author: Ahmad
+Description: Remembers the Category A-E verdict for prompts that were already
+             classified, so repeat questions skip the Bedrock call entirely.
+
+Keys are built from the normalized prompt plus the model id, so
+"What is the max load of the FL250?" and "what is the max load of the fl250"
+share one entry. Two backends are provided:
+    MemoryLRUCache - in-process, least-recently-used eviction
+    DiskCache      - SQLite file, survives restarts and is shared by processes
+Both support a TTL and a maximum number of entries, and count hits/misses.
+
+Usage:
+    from bedrock_utils import set_classification_cache
+    from prompt_cache import MemoryLRUCache
+    set_classification_cache(MemoryLRUCache(max_entries=10000, ttl_seconds=86400))
+"""
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_TTL_SECONDS = 24 * 60 * 60  # Classifier prompt changes rarely; a day is safe
+
+
+def normalize_prompt(prompt):
+    """Lowercases, collapses whitespace and drops trailing punctuation."""
+    text = re.sub(r"\s+", " ", prompt.strip().lower())
+    return text.rstrip(" ?!.")
+
+
+def classification_key(prompt, model_id):
+    """Builds the cache key for a prompt classified by a given model."""
+    raw = f"{model_id}\0{normalize_prompt(prompt)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class MemoryLRUCache:
+    """
+    In-memory LRU cache with TTL.
+
+    Parameters:
+        max_entries: Entries kept before the least recently used is evicted
+        ttl_seconds: Age after which an entry is treated as missing (None = never)
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl_seconds is not None \
+                    and time.time() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return _stats(self.hits, self.misses, len(self))
+
+
+class DiskCache:
+    """
+    SQLite-backed cache with TTL and size-based eviction.
+
+    Parameters:
+        path: Database file (created if missing)
+        max_entries: Oldest entries beyond this count are deleted on write
+        ttl_seconds: Age after which an entry is treated as missing (None = never)
+    """
+
+    def __init__(self, path="prompt_cache.sqlite3", max_entries=DEFAULT_MAX_ENTRIES,
+                 ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS cache_stored_at ON cache (stored_at)")
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, stored_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl_seconds is not None \
+                    and time.time() - row[1] > self.ttl_seconds:
+                self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO cache (key, value, stored_at) VALUES (?, ?, ?)",
+                (key, value, time.time())
+            )
+            # Keep only the newest max_entries rows
+            self._db.execute(
+                "DELETE FROM cache WHERE key IN ("
+                " SELECT key FROM cache ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM cache")
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def stats(self):
+        return _stats(self.hits, self.misses, len(self))
+
+    def close(self):
+        self._db.close()
+
+
+def _stats(hits, misses, size):
+    lookups = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / lookups if lookups else 0.0,
+        "entries": size,
+    }
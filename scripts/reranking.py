@@ -0,0 +1,174 @@
+"""
+Retrieve-then-Rerank with Adaptive Top-k
+Author: Ahmad
+Description: Over-fetches candidates, rescores them locally and keeps only
+             as many chunks as the scores justify.
+
+Fixed top-3 retrieval sometimes misses the right chunk at rank 5 and
+sometimes sends two useless chunks along with a perfect one. A RerankStage
+fetches `candidates` chunks, rescores them with a reranker and then picks k:
+
+    "gap"        - stop at the first drop bigger than max_gap x top score
+    "cumulative" - stop once the kept chunks hold `mass` of the total score
+
+Either way at least min_k and at most max_k chunks are kept.
+
+Usage:
+    from bedrock_utils import set_rerank_stage
+    from reranking import RerankStage, LexicalOverlapReranker
+    set_rerank_stage(RerankStage(LexicalOverlapReranker()))
+"""
+import math
+
+from embedders import tokenize
+
+RERANK_CANDIDATES = 10  # Chunks fetched before reranking
+MIN_K = 1
+MAX_K = 5
+MAX_GAP = 0.25          # Score-gap cutoff, as a share of the top score
+CUMULATIVE_MASS = 0.5   # Cumulative cutoff, share of the summed scores
+CUTOFFS = ("gap", "cumulative")
+
+# Words that match nearly every chunk and say nothing about relevance
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it of on or the "
+    "to what when which with you your".split()
+)
+
+
+class LexicalOverlapReranker:
+    """
+    Scores chunks by how many query terms they contain.
+
+    Terms with digits (model codes such as "dt1000") count double. The
+    result is blended with the retriever's own score (scaled to the best
+    candidate) so that a tie on overlap is broken by semantic similarity.
+
+    Parameters:
+        retrieval_weight: Share of the final score taken from the retriever (0-1)
+    """
+
+    name = "lexical"
+
+    def __init__(self, retrieval_weight=0.3):
+        self.retrieval_weight = retrieval_weight
+
+    def score(self, query, chunks):
+        """Returns one score in [0, 1] per chunk."""
+        weights = {}
+        for term in tokenize(query):
+            if term not in STOPWORDS:
+                weights[term] = 2.0 if any(char.isdigit() for char in term) else 1.0
+        total = sum(weights.values())
+        top_retrieval = max((chunk.get('score') or 0.0 for chunk in chunks), default=0.0)
+
+        scores = []
+        for chunk in chunks:
+            terms = set(tokenize(chunk['content']['text']))
+            overlap = sum(weight for term, weight in weights.items() if term in terms) / total if total else 0.0
+            retrieval = (chunk.get('score') or 0.0) / top_retrieval if top_retrieval > 0 else 0.0
+            scores.append((1 - self.retrieval_weight) * overlap + self.retrieval_weight * retrieval)
+        return scores
+
+
+class CrossEncoderReranker:
+    """
+    Scores (query, chunk) pairs with a cross-encoder model.
+
+    `model` needs predict(list of (query, text) pairs) -> scores, the
+    interface of sentence_transformers.CrossEncoder. Raw scores are passed
+    through a logistic function so the cutoffs see values in (0, 1).
+    """
+
+    name = "cross-encoder"
+
+    def __init__(self, model, apply_sigmoid=True):
+        self.model = model
+        self.apply_sigmoid = apply_sigmoid
+
+    @classmethod
+    def from_pretrained(cls, model_name="cross-encoder/ms-marco-MiniLM-L-6-v2"):
+        """Loads a sentence-transformers cross-encoder (optional dependency)."""
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as error:
+            raise ImportError("CrossEncoderReranker.from_pretrained needs `pip install sentence-transformers`") from error
+        return cls(CrossEncoder(model_name))
+
+    def score(self, query, chunks):
+        raw = self.model.predict([(query, chunk['content']['text']) for chunk in chunks])
+        if not self.apply_sigmoid:
+            return [float(value) for value in raw]
+        return [1 / (1 + math.exp(-float(value))) for value in raw]
+
+
+def select_top_k(scores, cutoff="gap", min_k=MIN_K, max_k=MAX_K, max_gap=MAX_GAP, mass=CUMULATIVE_MASS):
+    """
+    Picks how many of the (descending) `scores` to keep.
+
+    Parameters:
+        scores: Rerank scores, best first
+        cutoff: One of CUTOFFS
+
+    Returns:
+        Number of results to keep
+    """
+    if cutoff not in CUTOFFS:
+        raise ValueError(f"Unknown cutoff: {cutoff!r} (expected one of {CUTOFFS})")
+    limit = min(max_k, len(scores))
+    if limit <= min_k:
+        return limit
+
+    if cutoff == "gap":
+        top = scores[0]
+        for k in range(max(1, min_k), limit):
+            if scores[k - 1] - scores[k] > max_gap * top:
+                return k
+        return limit
+
+    total = sum(max(score, 0.0) for score in scores[:limit])
+    kept = 0.0
+    for k in range(1, limit + 1):
+        kept += max(scores[k - 1], 0.0)
+        if k >= min_k and total > 0 and kept / total >= mass:
+            return k
+    return limit
+
+
+class RerankStage:
+    """
+    Reranker plus adaptive-k settings; plugged in with bedrock_utils.set_rerank_stage.
+
+    Parameters:
+        reranker: Object with score(query, chunks) -> [float]
+        candidates: Chunks to fetch before reranking
+        cutoff / min_k / max_k / max_gap / mass: See select_top_k
+    """
+
+    def __init__(self, reranker=None, candidates=RERANK_CANDIDATES, cutoff="gap",
+                 min_k=MIN_K, max_k=MAX_K, max_gap=MAX_GAP, mass=CUMULATIVE_MASS):
+        self.reranker = reranker or LexicalOverlapReranker()
+        self.candidates = candidates
+        self.cutoff = cutoff
+        self.min_k = min_k
+        self.max_k = max_k
+        self.max_gap = max_gap
+        self.mass = mass
+
+    def apply(self, query, chunks):
+        """
+        Reranks `chunks` and returns the kept ones, best first.
+
+        Each returned chunk is a copy whose 'score' is the rerank score;
+        the original score is kept as 'retrievalScore'.
+        """
+        if not chunks:
+            return []
+        scores = self.reranker.score(query, chunks)
+        ranked = sorted(zip(scores, range(len(chunks))), key=lambda pair: pair[0], reverse=True)
+        k = select_top_k([score for score, _ in ranked], self.cutoff,
+                         self.min_k, self.max_k, self.max_gap, self.mass)
+        return [
+            dict(chunks[i], score=score, retrievalScore=chunks[i].get('score'))
+            for score, i in ranked[:k]
+        ]
@@ -0,0 +1,485 @@
+"""
+Resilient Invocation Layer for the Bedrock clients
+Author: Ahmad
+Description: Keeps a traffic spike from turning into rejections and empty answers.
+
+ResilientClient wraps a boto3 client and every method call goes through:
+
+    1. Token bucket   - optional client-side rate limit (calls/second + burst)
+    2. Deadline       - each call gets a time budget; waiting for a token,
+                        the call itself and backoff sleeps all count against it
+    3. Retries        - throttling / transient errors, connection failures and
+                        read timeouts are retried with exponential backoff
+                        and full jitter
+    4. Hedging        - for selected methods (e.g. KB `retrieve`), a second
+                        identical request is sent once the first has taken
+                        longer than the method's recent p95; the first
+                        response to arrive wins
+
+call_async() does the same from asyncio code: the request (and an optional
+parse step such as reading the body) runs on the client's pool, every wait
+happens on the event loop.
+
+Failures still surface as botocore ClientError (a blown deadline raises
+DeadlineExceeded and a connection error that outlasts the retries raises
+ConnectionFailed, both ClientError subclasses), so the existing handlers in
+bedrock_utils keep working unchanged.
+
+A forked child gets a new thread pool (and locks) in every ResilientClient:
+the parent's worker threads don't exist there, and calls submitted to the
+old pool would wait out their whole deadline.
+
+FaultInjectingClient / FakeBedrockClient make all of this testable without
+AWS: they throttle a share of calls and add slow outliers on purpose.
+"""
+import asyncio
+import io
+import json
+import os
+import random
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from botocore.exceptions import (
+    ClientError,
+    ConnectionError as BotoConnectionError,
+    EndpointConnectionError,
+    HTTPClientError,
+    ReadTimeoutError,
+)
+
+RETRYABLE_ERROR_CODES = frozenset({
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceUnavailableException",
+    "ServiceQuotaExceededException",
+    "ModelNotReadyException",
+    "InternalServerException",
+})
+
+# Connection failures, dropped connections and read timeouts (botocore's own
+# retries are off, see bedrock_utils.SDK_RETRIES, so they are retried here)
+RETRYABLE_CONNECTION_ERRORS = (BotoConnectionError, HTTPClientError)
+_CALL_ERRORS = (ClientError,) + RETRYABLE_CONNECTION_ERRORS
+
+MAX_ATTEMPTS = 5
+BASE_DELAY = 0.2       # Seconds; doubled per attempt before jitter
+MAX_DELAY = 5.0
+DEFAULT_DEADLINE = 30.0
+HEDGE_MIN_SAMPLES = 20  # Latencies needed before the p95 is trusted
+HEDGE_PERCENTILE = 0.95
+LATENCY_SAMPLES = 200
+
+
+class DeadlineExceeded(ClientError):
+    """A call (including retries) did not finish within its deadline."""
+
+    def __init__(self, operation_name, seconds):
+        super().__init__(
+            {'Error': {'Code': 'DeadlineExceeded', 'Message': f"no response within {seconds:.1f}s"}},
+            operation_name
+        )
+
+
+class ConnectionFailed(ClientError):
+    """A connection error or read timeout that was still failing after the last retry."""
+
+    def __init__(self, operation_name, error):
+        super().__init__(
+            {'Error': {'Code': 'ConnectionFailed', 'Message': f"{type(error).__name__}: {error}"}},
+            operation_name
+        )
+
+
+def error_code(error):
+    return error.response.get('Error', {}).get('Code', '') if isinstance(error, ClientError) else ''
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, up to `burst` saved up.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        """Takes a token if one is available right now."""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def acquire(self, deadline=None):
+        """
+        Waits for a token.
+
+        Returns:
+            True once a token was taken, False if it would arrive after `deadline`
+            (a time.monotonic() value)
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait_seconds = (1 - self.tokens) / self.rate
+            if deadline is not None and now + wait_seconds > deadline:
+                return False
+            time.sleep(wait_seconds)
+
+    async def acquire_async(self, deadline=None):
+        """acquire() that waits on the event loop instead of sleeping the thread."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait_seconds = (1 - self.tokens) / self.rate
+            if deadline is not None and now + wait_seconds > deadline:
+                return False
+            await asyncio.sleep(wait_seconds)
+
+
+class ResilientClient:
+    """
+    Wraps a boto3 client; its methods keep their names and arguments.
+
+    Parameters:
+        client: boto3 client (or anything with the same methods)
+        rate / burst: Token bucket settings, calls per second (None = no limit)
+        max_attempts: Tries per call, including the first
+        base_delay / max_delay: Backoff bounds in seconds
+        deadline: Default seconds per call; `deadlines` overrides it per method
+        hedge_methods: Methods that may send a second request past their p95
+        max_workers: Threads used to enforce deadlines and run hedges
+    """
+
+    def __init__(self, client, rate=None, burst=None, max_attempts=MAX_ATTEMPTS,
+                 base_delay=BASE_DELAY, max_delay=MAX_DELAY, deadline=DEFAULT_DEADLINE,
+                 deadlines=None, hedge_methods=(), max_workers=32):
+        self.client = client
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.deadlines = dict(deadlines or {})
+        self.hedge_methods = frozenset(hedge_methods)
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="invoke")
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self._counters = {}
+        _live_clients.add(self)
+
+    def __getattr__(self, name):
+        # Only reached for names not set in __init__, i.e. the client's own
+        if name == 'client':
+            raise AttributeError(name)
+        attribute = getattr(self.client, name)
+        if not callable(attribute) or name.startswith('_'):
+            return attribute
+
+        def call(**kwargs):
+            return self.call(name, **kwargs)
+        call.__name__ = name
+        return call
+
+    # ----- bookkeeping -----
+
+    def _count(self, method, key, amount=1):
+        with self._lock:
+            counters = self._counters.setdefault(method, {
+                'calls': 0, 'retries': 0, 'throttled': 0, 'connection_errors': 0,
+                'deadline_exceeded': 0, 'failed': 0, 'hedges': 0, 'hedge_wins': 0,
+            })
+            counters[key] += amount
+
+    def _record_latency(self, method, seconds):
+        with self._lock:
+            self._latencies.setdefault(method, deque(maxlen=LATENCY_SAMPLES)).append(seconds)
+
+    def hedge_delay(self, method):
+        """Recent p95 latency of `method`, or None until enough samples exist."""
+        with self._lock:
+            samples = list(self._latencies.get(method, ()))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        samples.sort()
+        return samples[min(len(samples) - 1, int(HEDGE_PERCENTILE * len(samples)))]
+
+    def stats(self):
+        """Per-method counters plus the current hedge threshold."""
+        with self._lock:
+            result = {method: dict(counters) for method, counters in self._counters.items()}
+        for method, counters in result.items():
+            counters['hedge_after'] = self.hedge_delay(method)
+        return result
+
+    # ----- calls -----
+
+    def _timed(self, method, kwargs, parse=None):
+        start = time.monotonic()
+        response = getattr(self.client, method)(**kwargs)
+        self._record_latency(method, time.monotonic() - start)
+        return response if parse is None else parse(response)
+
+    def _attempt(self, method, kwargs, deadline):
+        """One try: wait for a token, then run the call (hedged if configured)."""
+        if self.bucket is not None and not self.bucket.acquire(deadline):
+            raise DeadlineExceeded(method, self.deadlines.get(method, self.deadline))
+
+        primary = self._executor.submit(self._timed, method, kwargs)
+        pending = {primary}
+        hedge_after = self.hedge_delay(method) if method in self.hedge_methods else None
+        if hedge_after is not None:
+            done, _ = wait(pending, timeout=min(hedge_after, max(0.0, deadline - time.monotonic())))
+            # A hedge also needs a token, but never waits for one
+            if not done and time.monotonic() < deadline and (self.bucket is None or self.bucket.try_acquire()):
+                pending.add(self._executor.submit(self._timed, method, kwargs))
+                self._count(method, 'hedges')
+
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        self._count(method, 'hedge_wins')
+                    return future.result()
+                error = future.exception()
+        if error is not None and not pending:
+            raise error
+        # Still running past the deadline; the thread finishes in the background
+        raise DeadlineExceeded(method, self.deadlines.get(method, self.deadline))
+
+    def call(self, method, deadline=None, **kwargs):
+        """
+        Runs client.<method>(**kwargs) with rate limiting, retries, deadline and hedging.
+
+        Parameters:
+            method: Client method name, e.g. "invoke_model"
+            deadline: Seconds for this call (default: per-method or client default)
+
+        Returns:
+            The client's response
+
+        Raises:
+            ClientError - the last error once retries are used up or not
+            retryable, DeadlineExceeded, or ConnectionFailed for a connection
+            error / read timeout on the last attempt
+        """
+        seconds = deadline or self.deadlines.get(method, self.deadline)
+        deadline_at = time.monotonic() + seconds
+        self._count(method, 'calls')
+
+        for attempt in range(self.max_attempts):
+            try:
+                return self._attempt(method, kwargs, deadline_at)
+            except _CALL_ERRORS as error:
+                time.sleep(self._retry_delay(method, attempt, deadline_at, seconds, error))
+
+    async def _attempt_async(self, method, kwargs, deadline, parse):
+        """_attempt() for call_async: the same steps, awaited instead of blocking."""
+        if self.bucket is not None and not await self.bucket.acquire_async(deadline):
+            raise DeadlineExceeded(method, self.deadlines.get(method, self.deadline))
+
+        loop = asyncio.get_running_loop()
+        primary = loop.run_in_executor(self._executor, self._timed, method, kwargs, parse)
+        pending = {primary}
+        hedge_after = self.hedge_delay(method) if method in self.hedge_methods else None
+        if hedge_after is not None:
+            done, _ = await asyncio.wait(pending, timeout=min(hedge_after, max(0.0, deadline - time.monotonic())))
+            if not done and time.monotonic() < deadline and (self.bucket is None or self.bucket.try_acquire()):
+                pending.add(loop.run_in_executor(self._executor, self._timed, method, kwargs, parse))
+                self._count(method, 'hedges')
+
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=max(0.0, deadline - time.monotonic()),
+                                               return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        self._count(method, 'hedge_wins')
+                    return future.result()
+                error = future.exception()
+        if error is not None and not pending:
+            raise error
+        raise DeadlineExceeded(method, self.deadlines.get(method, self.deadline))
+
+    async def call_async(self, method, deadline=None, parse=None, **kwargs):
+        """
+        asyncio variant of call(): same rate limit, retries, deadline and hedging,
+        but all waiting happens on the event loop; only the request runs on the pool.
+
+        Parameters:
+            method / deadline: As for call()
+            parse: Optional function applied to the response on the pool thread
+                   (e.g. reading a streaming body); its errors are retried too
+
+        Returns:
+            The client's response, or parse(response)
+        """
+        seconds = deadline or self.deadlines.get(method, self.deadline)
+        deadline_at = time.monotonic() + seconds
+        self._count(method, 'calls')
+
+        for attempt in range(self.max_attempts):
+            try:
+                return await self._attempt_async(method, kwargs, deadline_at, parse)
+            except _CALL_ERRORS as error:
+                await asyncio.sleep(self._retry_delay(method, attempt, deadline_at, seconds, error))
+
+    def _retry_delay(self, method, attempt, deadline_at, seconds, error):
+        """
+        Seconds to back off after `error` before the next attempt. Raises instead
+        when the error is not retryable, retries are used up or the backoff would
+        pass the deadline.
+        """
+        if isinstance(error, DeadlineExceeded):
+            self._count(method, 'deadline_exceeded')
+            raise error
+        last_attempt = attempt == self.max_attempts - 1
+        if isinstance(error, ClientError):
+            code = error_code(error)
+            if code in ("ThrottlingException", "TooManyRequestsException"):
+                self._count(method, 'throttled')
+            if code not in RETRYABLE_ERROR_CODES or last_attempt:
+                self._count(method, 'failed')
+                raise error
+        else:
+            self._count(method, 'connection_errors')
+            if last_attempt:
+                self._count(method, 'failed')
+                raise ConnectionFailed(method, error) from error
+        # Full jitter: anywhere between 0 and the exponential cap
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if time.monotonic() + delay >= deadline_at:
+            self._count(method, 'deadline_exceeded')
+            raise DeadlineExceeded(method, seconds) from error
+        self._count(method, 'retries')
+        return delay
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def _after_fork(self):
+        # The pool's threads and any lock holders stayed behind in the parent
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="invoke")
+        self._lock = threading.Lock()
+        if self.bucket is not None:
+            self.bucket._lock = threading.Lock()
+
+
+_live_clients = weakref.WeakSet()  # Every ResilientClient not yet garbage collected
+
+
+def _reset_after_fork():
+    for client in list(_live_clients):
+        client._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class FakeBedrockClient:
+    """
+    Minimal stand-in for the bedrock-runtime / bedrock-agent-runtime clients.
+
+    invoke_model answers "Category E" to classification bodies and a fixed
+    sentence otherwise; retrieve returns `chunks` copies of one chunk.
+    `latency` seconds are spent per call.
+    """
+
+    def __init__(self, latency=0.05, chunks=3):
+        self.latency = latency
+        self.chunks = chunks
+
+    def invoke_model(self, modelId, body, **kwargs):
+        time.sleep(self.latency)
+        max_tokens = json.loads(body).get('max_tokens')
+        text = "Category E" if max_tokens == 10 else "The machine is rated for 100 tons."
+        payload = {'content': [{'text': text}], 'usage': {'input_tokens': 100, 'output_tokens': 10}}
+        return {'body': io.BytesIO(json.dumps(payload).encode())}
+
+    def retrieve(self, knowledgeBaseId, retrievalQuery, retrievalConfiguration=None, **kwargs):
+        time.sleep(self.latency)
+        chunk = {
+            'content': {'text': f"Spec sheet text for {retrievalQuery['text']}"},
+            'location': {'type': 'S3', 's3Location': {'uri': 's3://spec-sheets/fake-spec-sheet.pdf'}},
+            'score': 0.8,
+        }
+        return {'retrievalResults': [dict(chunk) for _ in range(self.chunks)]}
+
+
+class FaultInjectingClient:
+    """
+    Wraps a client and injects failures and slow calls.
+
+    Parameters:
+        client: Client to forward successful calls to
+        throttle_rate: Share of calls failing with ThrottlingException
+        error_rate: Share of calls failing with ServiceUnavailableException
+        connection_error_rate: Share of calls failing with a botocore
+                               EndpointConnectionError / ReadTimeoutError (alternating)
+        slow_rate / slow_seconds: Share of calls delayed by slow_seconds extra
+        seed: Random seed for repeatable runs
+    """
+
+    def __init__(self, client, throttle_rate=0.0, error_rate=0.0, slow_rate=0.0, slow_seconds=1.0, seed=None,
+                 connection_error_rate=0.0):
+        self.client = client
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.connection_error_rate = connection_error_rate
+        self.slow_rate = slow_rate
+        self.slow_seconds = slow_seconds
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attribute = getattr(self.client, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(**kwargs):
+            with self._lock:
+                self.calls += 1
+                roll, slow = self._random.random(), self._random.random()
+            if roll < self.throttle_rate:
+                raise ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'}}, name)
+            if roll < self.throttle_rate + self.error_rate:
+                raise ClientError({'Error': {'Code': 'ServiceUnavailableException', 'Message': 'Try again'}}, name)
+            if roll < self.throttle_rate + self.error_rate + self.connection_error_rate:
+                error = EndpointConnectionError if self.calls % 2 else ReadTimeoutError
+                raise error(endpoint_url="https://bedrock.fake")
+            if slow < self.slow_rate:
+                time.sleep(self.slow_seconds)
+            return attribute(**kwargs)
+        return call
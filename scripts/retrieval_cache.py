@@ -0,0 +1,208 @@
+"""
+Retrieval Cache for query_knowledge_base
+Author: Ahmad
+Description: Reuses Knowledge Base search results until the KB content changes.
+
+The spec-sheet corpus only changes when files are uploaded and the data
+source is re-synced, so identical searches return identical chunks in
+between. Entries are keyed by (KB content version, kb_id, query text,
+retrieval config); bumping the version makes every older entry unreachable
+at once, and they age out of the backend through its normal eviction.
+
+While the version is unknown (None) nothing is cached or served: entries
+stored then could never be told apart from a later sync's.
+
+The version is shared between processes through a small file
+(.kb_version): upload_to_s3.py and ingest.py publish to it when they change
+the corpus, and every cache built without an explicit kb_version follows it,
+so a running chat process drops its entries without being restarted. An
+S3 upload publishes "unknown" because the KB only changes once the data
+source is re-synced; after the sync, publish the new version with
+`python scripts/retrieval_cache.py`.
+
+Any prompt_cache backend works: MemoryLRUCache for bounded memory, or
+DiskCache so a warm cache survives restarts.
+
+Usage:
+    from bedrock_utils import set_retrieval_cache
+    from prompt_cache import DiskCache
+    from retrieval_cache import RetrievalCache
+
+    set_retrieval_cache(RetrievalCache(DiskCache("retrieval_cache.sqlite3")))
+
+    python scripts/retrieval_cache.py  # after a sync: publish fetch_kb_version(KB_ID)
+"""
+import argparse
+import hashlib
+import json
+import os
+
+from botocore.exceptions import ClientError
+
+from prompt_cache import MemoryLRUCache
+
+KB_VERSION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".kb_version")
+
+
+def publish_kb_version(kb_version, path=KB_VERSION_FILE):
+    """
+    Records the current KB content version for every cache following `path`.
+
+    Parameters:
+        kb_version: New version string, or None while it is unknown (caching off)
+        path: Version file shared with the caches
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as handle:
+        json.dump({'kb_version': None if kb_version is None else str(kb_version)}, handle)
+    os.replace(tmp_path, path)  # Readers never see a half-written file
+
+
+def read_kb_version(path=KB_VERSION_FILE):
+    """Returns the version published to `path`, or None if there is none."""
+    try:
+        with open(path, encoding="utf-8") as handle:
+            return json.load(handle).get('kb_version')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class KbVersion:
+    """
+    The KB content version a cache keys its entries by.
+
+    Parameters:
+        kb_version: Fixed version string; None follows the version file instead
+        path: Version file to follow (re-read whenever it changes on disk)
+    """
+
+    def __init__(self, kb_version=None, path=KB_VERSION_FILE):
+        self.path = path if kb_version is None else None
+        self.value = None if kb_version is None else str(kb_version)
+        self._signature = None
+
+    def get(self):
+        if self.path is not None:
+            try:
+                stat = os.stat(self.path)
+                # publish_kb_version replaces the file, so the inode changes even within one mtime tick
+                signature = (stat.st_ino, stat.st_mtime_ns)
+            except OSError:
+                signature = None
+            if signature != self._signature:
+                self._signature = signature
+                self.value = read_kb_version(self.path) if signature is not None else None
+        return self.value
+
+    def set(self, kb_version):
+        """Pins an explicit version (None = unknown); the version file is no longer followed."""
+        self.path = None
+        self.value = None if kb_version is None else str(kb_version)
+
+
+class RetrievalCache:
+    """
+    Version-tagged cache of retrievalResults lists.
+
+    Parameters:
+        backend: Object with get(key) / set(key, value) / stats(), storing strings
+                 (defaults to an in-memory LRU of 2000 entries with a one-day TTL)
+        kb_version: Identifier of the current KB content (any string); None follows
+                    the published version in `version_file` (caching off until one exists)
+        version_file: Version file published by upload_to_s3.py / ingest.py
+    """
+
+    def __init__(self, backend=None, kb_version=None, version_file=KB_VERSION_FILE):
+        self.backend = backend if backend is not None else MemoryLRUCache(max_entries=2000)
+        self._version = KbVersion(kb_version, version_file)
+
+    @property
+    def kb_version(self):
+        return self._version.get()
+
+    def set_kb_version(self, kb_version):
+        """Switches to a new KB content version; all older entries stop matching. None turns caching off."""
+        if kb_version is None:
+            print("KB version unknown: retrieval cache off until the next set_kb_version()")
+        self._version.set(kb_version)
+
+    def _key(self, kb_version, kb_id, query, retrieval_config):
+        raw = json.dumps(
+            [kb_version, kb_id, query.strip(), retrieval_config],
+            sort_keys=True
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, kb_id, query, retrieval_config):
+        """Returns the cached retrievalResults list, or None (always None while the version is unknown)."""
+        kb_version = self.kb_version
+        if kb_version is None:
+            return None
+        value = self.backend.get(self._key(kb_version, kb_id, query, retrieval_config))
+        return json.loads(value) if value is not None else None
+
+    def set(self, kb_id, query, retrieval_config, results):
+        kb_version = self.kb_version
+        if kb_version is None:
+            return
+        # Stored as JSON so memory and disk backends behave the same and
+        # callers can't mutate a cached list in place
+        self.backend.set(
+            self._key(kb_version, kb_id, query, retrieval_config),
+            json.dumps(results, default=str)
+        )
+
+    def stats(self):
+        return dict(self.backend.stats(), kb_version=self.kb_version)
+
+
+def fetch_kb_version(kb_id, region=None):
+    """
+    Derives a KB content version from the latest completed ingestion jobs.
+
+    Every data-source sync creates a new ingestion job, so the newest
+    completed job per data source identifies the indexed content.
+
+    Returns:
+        Version string, or None if it could not be determined
+    """
+    import boto3  # Only needed here; importing the cache stays cheap
+
+    from bedrock_utils import AWS_REGION
+
+    bedrock_agent = boto3.client(service_name='bedrock-agent', region_name=region or AWS_REGION)
+    try:
+        parts = []
+        data_sources = bedrock_agent.list_data_sources(knowledgeBaseId=kb_id)
+        for data_source in data_sources['dataSourceSummaries']:
+            jobs = bedrock_agent.list_ingestion_jobs(
+                knowledgeBaseId=kb_id,
+                dataSourceId=data_source['dataSourceId'],
+                filters=[{'attribute': 'STATUS', 'operator': 'EQ', 'values': ['COMPLETE']}],
+                sortBy={'attribute': 'STARTED_AT', 'order': 'DESCENDING'},
+                maxResults=1
+            )
+            for job in jobs['ingestionJobSummaries']:
+                parts.append(f"{data_source['dataSourceId']}:{job['ingestionJobId']}")
+        return "|".join(sorted(parts)) or None
+
+    except ClientError as error:
+        print(f"Error reading KB ingestion jobs: {error}")
+        return None
+
+
+def main():
+    from bedrock_utils import KB_ID
+
+    parser = argparse.ArgumentParser(description="Publish the current KB content version to the caches")
+    parser.add_argument('--kb-id', default=KB_ID)
+    parser.add_argument('--version-file', default=KB_VERSION_FILE)
+    args = parser.parse_args()
+
+    kb_version = fetch_kb_version(args.kb_id)
+    publish_kb_version(kb_version, args.version_file)
+    print(f"Published KB version: {kb_version if kb_version is not None else 'unknown (caching off)'}")
+
+
+if __name__ == "__main__":
+    main()
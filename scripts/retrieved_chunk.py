@@ -0,0 +1,87 @@
+"""
+Compact Retrieved Chunks
+Author: Ahmad
+Description: Slotted view of one retrievalResults entry for prompt building
+             and source citations.
+
+A RetrievedChunk keeps a reference to the result dict it wraps (nothing is
+copied) and reads from it only what is asked for:
+
+    text    - content.text, looked up on first use
+    score   - retrieval score, 0.0 when missing
+    source  - file name of the S3 location ("bulldozer-bd850-spec-sheet.pdf"),
+              None without one; names are parsed once per URI per process
+
+get() and [] read the wrapped dict, so code written for plain
+retrievalResults (caches, rerankers) accepts a RetrievedChunk as well.
+
+Usage:
+    from retrieved_chunk import as_chunks
+    for chunk in as_chunks(query_knowledge_base(question)):
+        print(chunk.score, chunk.source, chunk.text[:80])
+"""
+from functools import lru_cache
+
+_UNPARSED = object()  # `source` not looked up yet (None is a valid result)
+
+
+@lru_cache(maxsize=4096)
+def source_name(uri):
+    """File name of an S3 URI: "s3://spec-sheets/a/b.pdf" -> "b.pdf"."""
+    return uri.rpartition('/')[2]
+
+
+class RetrievedChunk:
+    """
+    One retrieved chunk.
+
+    Parameters:
+        result: A retrievalResults entry ({'content', 'location', 'score', ...})
+    """
+
+    __slots__ = ("result", "score", "_text", "_source")
+
+    def __init__(self, result):
+        self.result = result
+        self.score = result.get('score') or 0.0
+        self._text = None
+        self._source = _UNPARSED
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = self.result['content']['text']
+        return self._text
+
+    @property
+    def source(self):
+        if self._source is _UNPARSED:
+            self._source = result_source(self.result)
+        return self._source
+
+    def get(self, key, default=None):
+        return self.result.get(key, default)
+
+    def __getitem__(self, key):
+        return self.result[key]
+
+    def __repr__(self):
+        return f"RetrievedChunk(source={self.source!r}, score={self.score!r}, chars={len(self.text)})"
+
+
+def result_source(result):
+    """File name cited for a retrievalResults entry, None without an S3 location."""
+    try:
+        return source_name(result['location']['s3Location']['uri'])
+    except (KeyError, TypeError, AttributeError):  # No location, or no URI in it
+        return None
+
+
+def chunk_source(chunk):
+    """Source file name of a RetrievedChunk or a plain retrievalResults entry (nothing is wrapped)."""
+    return chunk.source if isinstance(chunk, RetrievedChunk) else result_source(chunk)
+
+
+def as_chunks(results):
+    """Wraps retrievalResults entries as RetrievedChunks (entries already wrapped are kept)."""
+    return [result if isinstance(result, RetrievedChunk) else RetrievedChunk(result) for result in results]
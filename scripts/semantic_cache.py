@@ -0,0 +1,171 @@
+"""
+Semantic Answer Cache for the RAG pipeline
+Author: Ahmad
+Description: Serves paraphrased questions from earlier answers, skipping
+             validation, retrieval and generation.
+
+Each entry stores (query embedding, model codes, answer, sources).
+Embeddings are kept L2-normalized in one contiguous float32 matrix, so a
+lookup is a single matrix-vector product followed by argmax over all
+entries. Questions that differ only in the model code ("weight of the
+DT1000" vs "weight of the DT850") embed almost identically, so an entry
+only matches a question naming exactly the same models.
+
+Entries belong to the KB content version of retrieval_cache: the cache
+follows the version published by upload_to_s3.py / ingest.py, drops every
+entry when it changes, and caches nothing while it is unknown.
+
+Usage:
+    from chat import set_answer_cache
+    from semantic_cache import SemanticCache
+    set_answer_cache(SemanticCache(threshold=0.92))
+"""
+import threading
+import time
+
+import numpy as np
+
+from retrieval_cache import KB_VERSION_FILE, KbVersion
+
+DEFAULT_THRESHOLD = 0.92       # Cosine similarity needed to reuse an answer
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_TTL_SECONDS = 60 * 60  # Answers older than an hour are not reused
+
+
+class SemanticCache:
+    """
+    Cosine-similarity cache of RAG answers.
+
+    Parameters:
+        embedder: Callable text -> vector (list/array), or None on failure.
+                  Defaults to bedrock_utils.embed_text (Titan).
+        threshold: Minimum cosine similarity for a hit (0.0-1.0)
+        max_entries: Capacity; the least recently used entry is replaced when full
+        ttl_seconds: Age after which an entry no longer matches (None = never)
+        kb_version: Fixed KB content version; None follows `version_file`
+        version_file: Version file published by upload_to_s3.py / ingest.py
+    """
+
+    def __init__(self, embedder=None, threshold=DEFAULT_THRESHOLD,
+                 max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 kb_version=None, version_file=KB_VERSION_FILE):
+        if embedder is None:
+            from bedrock_utils import embed_text
+            embedder = embed_text
+        self.embedder = embedder
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._matrix = None  # (max_entries, dim) float32, allocated on first add
+        self._version = KbVersion(kb_version, version_file)
+        self._entries_version = None  # KB version the current entries were answered from
+        self._reset()
+
+    def _reset(self):
+        self._size = 0
+        self._stored_at = np.zeros(self.max_entries, dtype=np.float64)
+        self._last_used = np.zeros(self.max_entries, dtype=np.float64)
+        self._models = [None] * self.max_entries
+        self._answers = [None] * self.max_entries
+        self._sources = [None] * self.max_entries
+
+    def _current_version(self):
+        """The KB version entries may be served for (None = off); drops entries of an older one. Needs the lock."""
+        kb_version = self._version.get()
+        if kb_version is not None and kb_version != self._entries_version:
+            self._reset()
+            self._entries_version = kb_version
+        return kb_version
+
+    def set_kb_version(self, kb_version):
+        """Pins the KB content version (None turns the cache off); entries of another version are dropped."""
+        self._version.set(kb_version)
+
+    def embed(self, text):
+        """Returns the normalized float32 embedding of `text`, or None."""
+        vector = self.embedder(text)
+        if vector is None:
+            return None
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def lookup(self, embedding, models=frozenset()):
+        """
+        Finds the most similar cached answer for the same machine models.
+
+        Parameters:
+            embedding: Normalized query vector from embed()
+            models: spec_corpus.model_codes() of the question
+
+        Returns:
+            Tuple (answer, sources, similarity) for a hit, None for a miss
+        """
+        with self._lock:
+            if embedding is None or self._current_version() is None or self._size == 0:
+                self.misses += 1
+                return None
+
+            similarities = self._matrix[:self._size] @ embedding
+            other_models = np.fromiter((entry != models for entry in self._models[:self._size]),
+                                       dtype=bool, count=self._size)
+            similarities[other_models] = -1.0
+            if self.ttl_seconds is not None:
+                expired = self._stored_at[:self._size] < time.time() - self.ttl_seconds
+                similarities[expired] = -1.0
+
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._last_used[best] = time.time()
+            return self._answers[best], self._sources[best], float(similarities[best])
+
+    def add(self, embedding, answer, sources, models=frozenset()):
+        """Stores an answer and its source chunks under a query embedding and its spec_corpus.model_codes()."""
+        if embedding is None:
+            return
+        # Only the citation location is needed to rebuild the sources footer
+        sources = [{'location': chunk.get('location')} for chunk in sources]
+
+        with self._lock:
+            if self._current_version() is None:
+                return
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, embedding.shape[0]), dtype=np.float32)
+
+            if self._size < self.max_entries:
+                slot = self._size
+                self._size += 1
+            else:
+                slot = int(np.argmin(self._last_used))  # Evict least recently used
+
+            now = time.time()
+            self._matrix[slot] = embedding
+            self._stored_at[slot] = now
+            self._last_used[slot] = now
+            self._models[slot] = frozenset(models)
+            self._answers[slot] = answer
+            self._sources[slot] = sources
+
+    def invalidate(self):
+        """Drops every entry (a new KB version does this on its own)."""
+        with self._lock:
+            self._reset()
+
+    def __len__(self):
+        return self._size
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": self._size,
+        }
@@ -0,0 +1,178 @@
+"""
+Spec-Sheet Corpus Loader
+Author: Ahmad
+Description: Reads the documents in spec-sheets/ (PDF, txt, md), splits them
+             into overlapping chunks and converts chunks into the same
+             retrievalResults shape that bedrock_kb.retrieve() returns.
+
+Used by the local retrieval engines so they can run without AWS.
+PDF text extraction needs the optional `pypdf` package.
+
+Every chunk is tagged for metadata filtering (see query_knowledge_base):
+    machine_model - model code the document is about ("BD850"), or
+                    "general" for documents about no single machine
+    doc_type      - spec_sheet, manual, safety, software or document
+    source_file   - key of the document, e.g. "bulldozer-bd850-spec-sheet.pdf"
+"""
+import hashlib
+import os
+import re
+from pathlib import Path
+
+from model_routing import MODEL_CODE_PATTERN
+
+SPEC_SHEETS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "spec-sheets")
+CORPUS_EXTENSIONS = {'.pdf', '.txt', '.md'}
+SOURCE_URI_PREFIX = "s3://spec-sheets/"  # Mirrors the keys upload_to_s3.py creates
+SOURCE_URI_KEY = "x-amz-bedrock-kb-source-uri"  # Where Bedrock KB records the S3 source
+
+CHUNK_SIZE = 1000    # Characters per chunk (~250 tokens)
+CHUNK_OVERLAP = 150  # Characters repeated between neighbouring chunks
+
+GENERAL_MODEL = "general"  # machine_model of documents about no single machine
+# First rule matching the file name wins
+DOC_TYPE_RULES = [
+    (re.compile(r"spec[-_ ]?sheet", re.IGNORECASE), "spec_sheet"),
+    (re.compile(r"manual", re.IGNORECASE), "manual"),
+    (re.compile(r"safety", re.IGNORECASE), "safety"),
+    (re.compile(r"software", re.IGNORECASE), "software"),
+]
+MODEL_LINE = re.compile(r"^(?:[-*]\s*)?\**Model\**:\s*(.+)$")
+
+
+def read_pages(file_path):
+    """
+    Returns the text of a document as a list of pages.
+
+    Text and Markdown files count as a single page.
+    """
+    file_path = Path(file_path)
+    if file_path.suffix.lower() == '.pdf':
+        from pypdf import PdfReader
+        return [page.extract_text() or "" for page in PdfReader(str(file_path)).pages]
+    return [file_path.read_text(encoding='utf-8-sig', errors='replace')]
+
+
+def chunk_text(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """
+    Splits text into chunks of about chunk_size characters.
+
+    Chunks end at a paragraph or sentence break where possible, and each
+    chunk repeats the last `overlap` characters of the previous one.
+    """
+    text = re.sub(r"[ \t]+", " ", text).strip()
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + chunk_size)
+        if end < len(text):
+            # Prefer a paragraph break, then a sentence end, in the second half
+            window = text[start + chunk_size // 2:end]
+            for separator in ("\n\n", ". ", "\n"):
+                cut = window.rfind(separator)
+                if cut != -1:
+                    end = start + chunk_size // 2 + cut + len(separator)
+                    break
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(start + 1, end - overlap)
+    return chunks
+
+
+def normalize_model(code):
+    """Canonical form of a model code: "dt-1000" -> "DT1000"."""
+    return code.upper().replace("-", "")
+
+
+def model_codes(text):
+    """The normalized model codes named in `text`, e.g. frozenset({"DT1000"})."""
+    return frozenset(normalize_model(code) for code in MODEL_CODE_PATTERN.findall(text))
+
+
+def document_model(lines):
+    """
+    The machine model a document is about: the model code in its title line
+    (spec sheets) or in a "Model:" line (manuals). None for other documents.
+    """
+    codes = MODEL_CODE_PATTERN.findall(lines[0]) if lines else []
+    for line in lines:
+        if codes:
+            break
+        match = MODEL_LINE.match(line)
+        if match:
+            codes = MODEL_CODE_PATTERN.findall(match.group(1))
+    return normalize_model(codes[0]) if codes else None
+
+
+def document_tags(source_file, pages):
+    """Filter metadata for a document: {'machine_model', 'doc_type', 'source_file'}."""
+    lines = [line.strip() for page in pages for line in page.splitlines() if line.strip()]
+    doc_type = next((name for pattern, name in DOC_TYPE_RULES if pattern.search(source_file)), "document")
+    return {
+        'machine_model': document_model(lines) or GENERAL_MODEL,
+        'doc_type': doc_type,
+        'source_file': source_file,
+    }
+
+
+def find_documents(folder=SPEC_SHEETS_FOLDER):
+    """Returns the corpus files under `folder`, sorted by path."""
+    return sorted(
+        path for path in Path(folder).rglob('*')
+        if path.is_file() and path.suffix.lower() in CORPUS_EXTENSIONS
+    )
+
+
+def document_chunks(file_path, folder=SPEC_SHEETS_FOLDER, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """
+    Yields the chunks of one document as dicts:
+        {'id', 'text', 'metadata': {SOURCE_URI_KEY, 'page', *document_tags}}
+    """
+    relative_key = Path(file_path).relative_to(folder).as_posix()
+    pages = read_pages(file_path)
+    tags = document_tags(relative_key, pages)
+    for page_number, page_text in enumerate(pages, 1):
+        for index, text in enumerate(chunk_text(page_text, chunk_size, overlap)):
+            chunk_id = hashlib.sha1(f"{relative_key}:{page_number}:{index}".encode()).hexdigest()
+            yield {
+                'id': chunk_id,
+                'text': text,
+                'metadata': dict(tags, **{
+                    SOURCE_URI_KEY: SOURCE_URI_PREFIX + relative_key,
+                    'page': page_number,
+                }),
+            }
+
+
+def load_chunks(folder=SPEC_SHEETS_FOLDER, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """Chunks every document in the corpus folder. Returns a list of chunk dicts."""
+    chunks = []
+    for file_path in find_documents(folder):
+        chunks.extend(document_chunks(file_path, folder, chunk_size, overlap))
+    return chunks
+
+
+def to_retrieval_result(chunk_text, metadata, score):
+    """Builds one entry shaped like bedrock_kb.retrieve()['retrievalResults']."""
+    metadata = metadata or {}
+    result = {
+        'content': {'text': chunk_text},
+        'metadata': metadata,
+        'score': score,
+    }
+    source_uri = metadata.get(SOURCE_URI_KEY)
+    if source_uri:
+        result['location'] = {'type': 'S3', 's3Location': {'uri': source_uri}}
+    return result
+
+
+def matches_filters(metadata, filters):
+    """True if metadata satisfies every {key: value or [values]} filter."""
+    for key, value in filters.items():
+        allowed = value if isinstance(value, (list, tuple, set)) else [value]
+        if str(metadata.get(key)) not in {str(item) for item in allowed}:
+            return False
+    return True
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Spec-Sheet Lookup Index
+Author: Ahmad
+Description: Answers exact spec questions ("operating weight of the BD850",
+             "MC750 maximum lifting capacity") from a table extracted from
+             spec-sheets/, without retrieval or a model call.
+
+Extraction reads every document (see spec_corpus.py) and keeps the
+"Attribute: value" lines of each machine as rows of
+
+    (model, attribute, section, value, unit, text, source_uri, headline)
+
+e.g. ("BD850", "Operating Weight", "WEIGHTS", 87100.0, "kg",
+"87,100 kg (192,000 lb)", "s3://spec-sheets/bulldozer-bd850-spec-sheet.pdf", False).
+`headline` marks the key figures printed under the title of a sheet.
+
+A lookup only answers when the question names exactly one indexed model and
+every other word of it is explained by one attribute (its name, section or
+a synonym like "heavy" -> weight). Anything else - two machines, "why",
+an attribute that matches several different values - returns None and the
+question goes through the normal RAG pipeline. A lookup is a few set
+operations over one model's rows (microseconds).
+
+The table is saved as JSON next to the repo (.spec_index.json) and rebuilt
+when a document in spec-sheets/ is newer. PDF extraction needs `pypdf`.
+
+Usage:
+    from chat import set_spec_index
+    from spec_index import SpecIndex
+    set_spec_index(SpecIndex.load_or_build())
+
+    python scripts/spec_index.py build
+    python scripts/spec_index.py query "What is the operating weight of the BD850?"
+    python scripts/spec_index.py bench
+"""
+import argparse
+import json
+import os
+import re
+import time
+from collections import namedtuple
+from pathlib import Path
+
+from model_routing import MODEL_CODE_PATTERN
+from spec_corpus import (
+    SOURCE_URI_KEY,
+    SOURCE_URI_PREFIX,
+    SPEC_SHEETS_FOLDER,
+    document_model,
+    find_documents,
+    normalize_model,
+    read_pages
+)
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".spec_index.json")
+INDEX_VERSION = 1
+
+SpecRow = namedtuple("SpecRow", "model attribute section value unit text source_uri headline")
+
+# "Operating Weight: 87,100 kg (192,000 lb)" and "- **Weight**: 250 kg"
+SPEC_LINE = re.compile(r"^(?:[-*]\s*)?\**([A-Za-z](?:[^:(]|\([^)]*\)){1,60}?)\**:\s*([-+±]?\d.*)$")
+# Key figures under the title: "Operating Weight: 87,100 kg / 192,000 lb Engine Power: 634 kW / 850 hp"
+HEADLINE_PAIR = re.compile(r"([A-Z][a-z]+(?: [A-Z][a-z]+)*):\s*(\d.+?)(?=\s[A-Z][a-z]+(?: [A-Z][a-z]+)*:|$)")
+# "WEIGHTS", "DIMENSIONS (with SU Blade ...)", "### Hardware Specifications"
+SECTION_LINE = re.compile(r"^(?:([A-Z][A-Z &/-]{2,40}?)(?:\s*\(.*\))?|#+\s*(.{3,40}))$")
+VALUE = re.compile(r"([-+±]?\d[\d,]*(?:\.\d+)?)\s*(metric tons|short tons|[^\s\d(),/;]+)?")
+WORD = re.compile(r"[a-z0-9]+")
+
+# pypdf reads the sheets' UTF-8 symbols as Latin-1 ("mÂ³", "â€“")
+MOJIBAKE = {"Â": "", "â€“": "–", "â€”": "—"}
+
+# Words of an attribute that a question may leave out ("lift height" = "Maximum Lift Height")
+OPTIONAL_WORDS = {"net", "gross", "overall", "total", "maximum", "standard", "main", "number", "machine", "vehicle"}
+# Question words that never need explaining
+QUESTION_WORDS = {
+    "a", "an", "the", "of", "for", "on", "in", "is", "are", "what", "whats", "s", "how", "much", "many",
+    "does", "do", "have", "has", "its", "it", "can", "me", "tell", "give", "about", "spec", "specs",
+    "specification", "rated", "value", "machine", "model",
+}
+# Query word -> attribute words it can stand for
+SYNONYMS = {
+    "heavy": {"weight", "operating"}, "weigh": {"weight", "operating"},
+    "hp": {"power"}, "horsepower": {"power"}, "kw": {"power"},
+    "lift": {"lifting", "capacity"}, "max": {"maximum"}, "top": {"maximum"}, "highest": {"maximum"},
+    "fast": {"maximum", "speed"}, "speed": {"maximum"},
+    "fuel": {"tank"}, "long": {"length"}, "tall": {"height"}, "high": {"height"}, "wide": {"width"},
+    "payload": {"capacity"}, "boom": {"length"}, "weight": {"capacity"},
+}
+
+
+def _fix_text(text):
+    for broken, fixed in MOJIBAKE.items():
+        text = text.replace(broken, fixed)
+    return text
+
+
+def _stem(word):
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def terms(text, skip=()):
+    """Lower-case, lightly singularized words of `text`, leaving out the words in `skip`."""
+    return [_stem(word) for word in WORD.findall(text.lower()) if word not in skip]
+
+
+def parse_value(text):
+    """First number and unit of a value as written: "87,100 kg (192,000 lb)" -> (87100.0, "kg")."""
+    match = VALUE.match(text.strip())
+    if not match:
+        return None, ""
+    number = match.group(1).replace(",", "").replace("±", "")
+    try:
+        return float(number), match.group(2) or ""
+    except ValueError:
+        return None, match.group(2) or ""
+
+
+# ----- extraction -----
+
+def extract_rows(file_path, folder=SPEC_SHEETS_FOLDER):
+    """
+    Extracts the spec rows of one document.
+
+    Returns:
+        Tuple (model, title, rows) - model None and no rows for documents
+        that are not about one machine
+    """
+    text = _fix_text("\n".join(read_pages(file_path)))
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    model = document_model(lines)
+    if model is None:
+        return None, "", []
+    source_uri = SOURCE_URI_PREFIX + Path(file_path).relative_to(folder).as_posix()
+
+    # Spec sheets open with the title and key figures, up to the first sentence
+    header = []
+    if MODEL_CODE_PATTERN.search(lines[0]):
+        for line in lines:
+            if line.startswith("The "):
+                break
+            header.append(line)
+    header_text = " ".join(header)
+    pairs = list(HEADLINE_PAIR.finditer(header_text))
+    title = header_text[:pairs[0].start()].strip() if pairs else header_text or lines[0].lstrip("# ")
+    rows = []
+    for pair in pairs:
+        value, unit = parse_value(pair.group(2))
+        rows.append(SpecRow(model, pair.group(1), "", value, unit, pair.group(2).strip(), source_uri, True))
+
+    section = ""
+    for line in lines[len(header):]:
+        match = SPEC_LINE.match(line)
+        if match:
+            attribute, value_text = match.group(1).strip(), match.group(2).strip()
+            value, unit = parse_value(value_text)
+            rows.append(SpecRow(model, attribute, section, value, unit, value_text, source_uri, False))
+            continue
+        match = SECTION_LINE.match(line)
+        if match:
+            section = (match.group(1) or match.group(2)).strip()
+    return model, title, rows
+
+
+def extract_specs(folder=SPEC_SHEETS_FOLDER):
+    """Rows and titles of every machine in the corpus. Returns (rows, {model: title})."""
+    rows, titles = [], {}
+    for file_path in find_documents(folder):
+        model, title, document_rows = extract_rows(file_path, folder)
+        if model is not None and document_rows:
+            rows.extend(document_rows)
+            titles[model] = title
+    return rows, titles
+
+
+# ----- lookup -----
+
+class SpecIndex:
+    """
+    In-memory spec table, grouped by model for lookups.
+
+    Parameters:
+        rows: SpecRow list (see extract_specs)
+        titles: Model -> document title, whose words ("bulldozer") need no explaining
+    """
+
+    def __init__(self, rows, titles=None):
+        self.rows = rows
+        self.titles = titles or {}
+        self._by_model = {}  # model -> [(required, words, row)]
+        for row in rows:
+            qualifier = re.findall(r"\(([^)]*)\)", row.attribute)
+            name = re.sub(r"\([^)]*\)", " ", row.attribute)
+            required = frozenset(terms(name)) - OPTIONAL_WORDS
+            words = frozenset(terms(row.attribute) + terms(row.section) + terms(" ".join(qualifier)))
+            self._by_model.setdefault(row.model, []).append((required, words, row))
+        self._title_words = {model: frozenset(terms(title)) for model, title in self.titles.items()}
+
+    @property
+    def models(self):
+        return sorted(self._by_model)
+
+    def lookup(self, question):
+        """
+        Returns the SpecRow that answers `question`, or None if it is not an
+        exact spec lookup (or the answer would be ambiguous).
+        """
+        codes = {normalize_model(code) for code in MODEL_CODE_PATTERN.findall(question)}
+        if len(codes) != 1:
+            return None
+        model = codes.pop()
+        candidates = self._by_model.get(model)
+        if not candidates:
+            return None
+
+        title_words = self._title_words.get(model, frozenset())
+        question_terms = [term for term in terms(MODEL_CODE_PATTERN.sub(" ", question), QUESTION_WORDS)
+                          if term not in title_words]
+        if not question_terms:
+            return None
+        expanded = {term: {term} | SYNONYMS.get(term, set()) for term in question_terms}
+        offered = set().union(*expanded.values())
+
+        best, best_score = [], None
+        for required, words, row in candidates:
+            if not required <= offered:
+                continue
+            if not all(expansion & words for expansion in expanded.values()):
+                continue  # A word of the question this attribute doesn't explain
+            score = (len(words & offered), row.headline, -len(required - offered))
+            if best_score is None or score > best_score:
+                best, best_score = [row], score
+            elif score == best_score:
+                best.append(row)
+        if not best or len({(row.value, row.unit) for row in best}) > 1:
+            return None
+        return best[0]
+
+    def answer(self, question):
+        """
+        Returns (answer text, sources) for an exact spec lookup, else None.
+
+        `sources` uses the retrievalResults shape, so chat.format_sources works.
+        """
+        row = self.lookup(question)
+        if row is None:
+            return None
+        source = {
+            'content': {'text': f"{row.attribute}: {row.text}"},
+            'metadata': {SOURCE_URI_KEY: row.source_uri},
+            'location': {'type': 'S3', 's3Location': {'uri': row.source_uri}},
+            'score': 1.0,
+        }
+        label = f"{row.section.title()} - {row.attribute}" if row.section else row.attribute
+        return f"{row.model} {label}: {row.text}", [source]
+
+    # ----- persistence -----
+
+    def save(self, path=DEFAULT_INDEX_PATH):
+        with open(path, 'w', encoding='utf-8') as index_file:
+            json.dump({'version': INDEX_VERSION, 'titles': self.titles, 'rows': [list(row) for row in self.rows]},
+                      index_file, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path=DEFAULT_INDEX_PATH):
+        with open(path, encoding='utf-8') as index_file:
+            data = json.load(index_file)
+        if data.get('version') != INDEX_VERSION:
+            raise ValueError(f"{path} has index version {data.get('version')}, expected {INDEX_VERSION}")
+        return cls([SpecRow(*row) for row in data['rows']], data['titles'])
+
+    @classmethod
+    def build(cls, folder=SPEC_SHEETS_FOLDER):
+        rows, titles = extract_specs(folder)
+        return cls(rows, titles)
+
+    @classmethod
+    def load_or_build(cls, path=DEFAULT_INDEX_PATH, folder=SPEC_SHEETS_FOLDER):
+        """
+        Loads the saved index, rebuilding (and saving) it when it is missing,
+        outdated or older than a document in `folder`.
+
+        Returns:
+            SpecIndex, or None if it could not be built (e.g. pypdf missing)
+        """
+        try:
+            newest = max((os.path.getmtime(document) for document in find_documents(folder)), default=0)
+            if os.path.exists(path) and os.path.getmtime(path) >= newest:
+                return cls.load(path)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Rebuilding spec index: {e}")
+        try:
+            index = cls.build(folder)
+        except Exception as e:
+            print(f"Error building spec index: {e}")
+            return None
+        try:
+            index.save(path)
+        except OSError as e:
+            print(f"Could not save spec index: {e}")
+        return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Spec-sheet lookup index")
+    parser.add_argument('command', choices=("build", "query", "bench"))
+    parser.add_argument('question', nargs='?')
+    parser.add_argument('--index', default=DEFAULT_INDEX_PATH)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.perf_counter()
+        index = SpecIndex.build()
+        index.save(args.index)
+        print(f"{len(index.rows)} rows for {len(index.models)} models ({', '.join(index.models)}) "
+              f"in {time.perf_counter() - start:.2f}s -> {args.index}")
+        return
+
+    index = SpecIndex.load_or_build(args.index)
+    if args.command == "query":
+        result = index.answer(args.question or "")
+        print(result[0] if result else "Not an exact spec lookup (would go to RAG)")
+        return
+
+    from benchmark_hybrid import LABELLED_QUESTIONS
+    questions = [question for question, _ in LABELLED_QUESTIONS]
+    answered = 0
+    for question in questions:
+        result = index.answer(question)
+        answered += result is not None
+        print(f"{'index' if result else 'RAG  '}  {question}  ->  {result[0] if result else ''}")
+    repeats = 2000
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for question in questions:
+            index.answer(question)
+    per_call = 1e6 * (time.perf_counter() - start) / (repeats * len(questions))
+    print(f"\n{answered}/{len(questions)} answered from the index, {per_call:.1f} us per lookup")
+
+
+if __name__ == "__main__":
+    main()
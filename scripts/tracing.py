@@ -0,0 +1,366 @@
+"""
+Request-Level Tracing for the RAG pipeline
+Author: Ahmad
+Description: Per-stage spans for each chat turn, exportable as
+             OpenTelemetry (OTLP/JSON) or Prometheus histograms.
+
+A chat turn becomes a tree of spans:
+
+    chat_turn
+      validate        model_id, request_bytes, input/output tokens, cache_hit
+      retrieve        backend, results, cache_hit
+        rerank        candidates, kept
+      build_prompt    chunks_used, prompt_chars, prompt_tokens
+      generate        model_id, route, input/output tokens, time_to_first_token
+
+Tracing is off until enable() is called. While it is off, @traced
+functions pay one global lookup and annotate() returns immediately.
+
+Usage:
+    import tracing
+    tracer = tracing.enable()
+    ...                                  # run chat turns
+    print(tracer.breakdown())            # stage timings of the last turn
+    tracer.write_otlp_json("trace.json")
+    print(tracer.to_prometheus())
+"""
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from collections import deque
+
+SERVICE_NAME = "heavy-machinery-rag"
+MAX_SPANS = 10000  # Finished spans kept for export (oldest dropped first)
+
+# Histogram bucket upper bounds, seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_tracer = None
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed stage. Attributes are plain str/int/float/bool values."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name, trace_id, parent_id):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = {}
+        self.error = None
+
+    @property
+    def duration(self):
+        """Seconds, or None while the span is still open."""
+        return (self.end_ns - self.start_ns) / 1e9 if self.end_ns is not None else None
+
+
+class Tracer:
+    """
+    Collects finished spans and per-stage histograms.
+
+    Parameters:
+        service_name: Reported as the OTel resource service.name
+        max_spans: Finished spans kept in memory
+        buckets: Duration histogram bounds in seconds
+    """
+
+    def __init__(self, service_name=SERVICE_NAME, max_spans=MAX_SPANS, buckets=DURATION_BUCKETS):
+        self.service_name = service_name
+        self.buckets = tuple(buckets)
+        self.spans = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+        self._histograms = {}   # stage -> [bucket counts..., +Inf count, sum]
+        self._counters = {}     # (metric, stage) -> total
+
+    def start(self, name):
+        parent = _current_span.get()
+        trace_id = parent.trace_id if parent is not None else os.urandom(16).hex()
+        span = Span(name, trace_id, parent.span_id if parent is not None else None)
+        return span, _current_span.set(span)
+
+    def finish(self, span, token):
+        """Records a finished span; `token` (None = nothing to reset) restores the previous current span."""
+        span.end_ns = time.time_ns()
+        if token is not None:
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # Finished in another context; the span is still valid
+                pass
+        duration = span.duration
+        with self._lock:
+            self.spans.append(span)
+            histogram = self._histograms.get(span.name)
+            if histogram is None:
+                histogram = self._histograms[span.name] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if duration <= bound:
+                    histogram[i] += 1
+                    break
+            else:
+                histogram[len(self.buckets)] += 1
+            histogram[-1] += duration
+            for key in ("input_tokens", "output_tokens"):
+                value = span.attributes.get(key)
+                if value:
+                    self._count("rag_tokens_total", span.name, value, key.split("_")[0])
+            if span.attributes.get("cache_hit"):
+                self._count("rag_cache_hits_total", span.name, 1)
+            if span.error:
+                self._count("rag_errors_total", span.name, 1)
+
+    def _count(self, metric, stage, amount, direction=None):
+        key = (metric, stage, direction)
+        self._counters[key] = self._counters.get(key, 0) + amount
+
+    # ----- views -----
+
+    def trace(self, trace_id=None):
+        """Spans of one trace (default: the most recent), in start order."""
+        with self._lock:
+            spans = list(self.spans)
+        if not spans:
+            return []
+        trace_id = trace_id or spans[-1].trace_id
+        return sorted((span for span in spans if span.trace_id == trace_id), key=lambda span: span.start_ns)
+
+    def breakdown(self, trace_id=None):
+        """One line with each stage's duration for a trace, e.g. for the chat loop."""
+        parts = []
+        for span in self.trace(trace_id):
+            label = f"{span.name} {1000 * span.duration:.0f}ms"
+            if span.attributes.get("cache_hit"):
+                label += " (cached)"
+            parts.append(label)
+        return " | ".join(parts)
+
+    # ----- exporters -----
+
+    def to_otlp(self):
+        """Finished spans as an OTLP/JSON ExportTraceServiceRequest dict."""
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+                "scopeSpans": [{
+                    "scope": {"name": "bedrock_rag.tracing"},
+                    "spans": [_otlp_span(span) for span in spans],
+                }],
+            }]
+        }
+
+    def write_otlp_json(self, path):
+        """Writes to_otlp() to `path` (loadable by an OTel collector's file receiver)."""
+        with open(path, 'w', encoding='utf-8') as trace_file:
+            json.dump(self.to_otlp(), trace_file)
+
+    def to_prometheus(self):
+        """Stage duration histograms and token / cache-hit / error counters, Prometheus text format."""
+        lines = [
+            "# HELP rag_stage_duration_seconds Duration of each RAG pipeline stage",
+            "# TYPE rag_stage_duration_seconds histogram",
+        ]
+        with self._lock:
+            histograms = {stage: list(values) for stage, values in self._histograms.items()}
+            counters = dict(self._counters)
+        for stage, values in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f'rag_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            cumulative += values[len(self.buckets)]
+            lines.append(f'rag_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {cumulative}')
+            lines.append(f'rag_stage_duration_seconds_sum{{stage="{stage}"}} {values[-1]:.6f}')
+            lines.append(f'rag_stage_duration_seconds_count{{stage="{stage}"}} {cumulative}')
+
+        metric_names = sorted({metric for metric, _, _ in counters})
+        for metric in metric_names:
+            lines.append(f"# TYPE {metric} counter")
+            for (name, stage, direction), value in sorted(counters.items(), key=str):
+                if name != metric:
+                    continue
+                labels = f'stage="{stage}"' + (f',direction="{direction}"' if direction else "")
+                lines.append(f"{metric}{{{labels}}} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _otlp_attribute(key, value):
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}  # OTLP/JSON encodes 64-bit ints as strings
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+def _otlp_span(span):
+    result = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": 1,  # SPAN_KIND_INTERNAL
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": [_otlp_attribute(key, value) for key, value in span.attributes.items()],
+        "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+    }
+    if span.parent_id:
+        result["parentSpanId"] = span.parent_id
+    return result
+
+
+# ----- module-level switch and helpers -----
+
+def enable(tracer=None):
+    """Turns tracing on (with a new Tracer unless one is given) and returns the tracer."""
+    global _tracer
+    _tracer = tracer or Tracer()
+    return _tracer
+
+
+def disable():
+    global _tracer
+    _tracer = None
+
+
+def get_tracer():
+    return _tracer
+
+
+def annotate(**attributes):
+    """Adds attributes to the current span; does nothing while tracing is off."""
+    if _tracer is None:
+        return
+    span = _current_span.get()
+    if span is not None:
+        span.attributes.update(attributes)
+
+
+class _SpanContext:
+    """`with span(name):` block; a shared no-op instance is used while tracing is off."""
+
+    __slots__ = ("name", "attributes", "span", "token")
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+        self.span = None
+        self.token = None
+
+    def __enter__(self):
+        tracer = _tracer
+        if tracer is not None and self.name is not None:
+            self.span, self.token = tracer.start(self.name)
+            self.span.attributes.update(self.attributes)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if self.span is not None:
+            if exc is not None:
+                self.span.error = f"{exc_type.__name__}: {exc}"
+            tracer = _tracer
+            if tracer is not None:
+                tracer.finish(self.span, self.token)
+        return False
+
+
+_NO_SPAN = _SpanContext(None, {})
+
+
+def span(name, **attributes):
+    """Context manager timing one stage."""
+    if _tracer is None:
+        return _NO_SPAN
+    return _SpanContext(name, attributes)
+
+
+def _traced_generator(name, generator):
+    """
+    Runs `generator` inside a span that is current only while its body runs.
+
+    Between pieces the caller's own span is current again, so spans the
+    caller opens while consuming the stream are not parented under this one.
+    The span itself stays open until the generator is exhausted or closed.
+    """
+    tracer = _tracer
+    current, token = tracer.start(name)
+    _current_span.reset(token)  # Parented under the caller's span, but not left current
+    advance, value = generator.send, None
+    try:
+        while True:
+            token = _current_span.set(current)
+            try:
+                piece = advance(value)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                _current_span.reset(token)
+            try:
+                value = yield piece
+                advance = generator.send
+            except GeneratorExit:
+                token = _current_span.set(current)
+                try:
+                    generator.close()
+                finally:
+                    _current_span.reset(token)
+                raise
+            except BaseException as error:  # Thrown in by the caller: passed on to the generator
+                advance, value = generator.throw, error
+    except GeneratorExit:
+        raise
+    except BaseException as error:
+        current.error = f"{type(error).__name__}: {error}"
+        raise
+    finally:
+        tracer.finish(current, None)
+
+
+def traced(name):
+    """
+    Decorator recording each call of a function, generator or coroutine function as a span.
+
+    Generator spans stay open until the generator is exhausted or closed,
+    so a streamed generation is timed end to end.
+    """
+    def decorator(func):
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                if _tracer is None:
+                    yield from func(*args, **kwargs)
+                    return
+                return (yield from _traced_generator(name, func(*args, **kwargs)))
+            return generator_wrapper
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def coroutine_wrapper(*args, **kwargs):
+                if _tracer is None:
+                    return await func(*args, **kwargs)
+                with span(name):
+                    return await func(*args, **kwargs)
+            return coroutine_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -5,6 +5,19 @@ This script maintains the folder structure in S3 and supports various file types
 
 Usage:
     python scripts/upload_to_s3.py
+    python scripts/upload_to_s3.py --parallel --workers 16   # only new/changed files, reports removed ones
+    python scripts/upload_to_s3.py --parallel --delete       # ... and deletes removed ones from S3
+
+Every document also gets a Bedrock KB metadata sidecar, <key>.metadata.json,
+with the machine_model / doc_type / source_file tags of spec_corpus.py, so
+Knowledge Base searches can be filtered by machine. In --parallel mode the
+sidecars are their own step: any file whose manifest entry doesn't record a
+sidecar gets one, uploaded this run or not.
+
+Uploads and deletions publish an unknown KB version
+(retrieval_cache.publish_kb_version), which turns the retrieval and answer
+caches off until the data source is re-synced and the new version is
+published with `python scripts/retrieval_cache.py`.
 
 Make sure to:
 1. Update the bucket_name variable below with your S3 bucket name
@@ -14,28 +27,60 @@ Make sure to:
 
 import os
 import sys
+import json
+import time
 import boto3
+import hashlib
+import argparse
 import mimetypes
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError, NoCredentialsError
 
+from retrieval_cache import publish_kb_version
+
 # Configuration
 BUCKET_NAME = "your-bucket-name-here"  # TODO: Update this with your actual S3 bucket name
 LOCAL_FOLDER = "spec-sheets"  # Local folder containing files to upload
 S3_PREFIX = ""  # Optional: prefix for S3 keys (e.g., "documents/")
 
+# Parallel / incremental upload settings (--parallel)
+MANIFEST_FILE = ".upload_manifest.json"  # Content hashes of what was last uploaded
+UPLOAD_WORKERS = 8  # Files uploaded at the same time
+
+# Spec sheets are mostly well under 16 MB; only large scans go multipart, and
+# those are split into 16 MB parts sent 4 at a time
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=16 * 1024 * 1024,
+    multipart_chunksize=16 * 1024 * 1024,
+    max_concurrency=4,
+    use_threads=True
+)
+
+# Bedrock KB reads the filterable attributes of <key> from <key>.metadata.json
+METADATA_SUFFIX = ".metadata.json"
+
 # Supported file types for Bedrock Knowledge Base
 SUPPORTED_EXTENSIONS = {
     '.pdf', '.txt', '.md', '.html', '.csv', '.doc', '.docx',
     '.xls', '.xlsx', '.ppt', '.pptx'
 }
 
-def get_s3_client():
+def get_s3_client(endpoint_url=None, max_pool_connections=10):
     """
     Create and return an S3 client.
+    
+    endpoint_url points the client at an S3-compatible stand-in (e.g. MinIO
+    or moto_server) instead of AWS.
     """
     try:
-        s3_client = boto3.client('s3')
+        s3_client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url,
+            config=Config(max_pool_connections=max_pool_connections)
+        )
         # Test the credentials by listing buckets
         s3_client.list_buckets()
         return s3_client
@@ -76,32 +121,67 @@ def get_content_type(file_path):
         content_type = 'application/octet-stream'
     return content_type
 
-def upload_file(s3_client, local_file_path, bucket_name, s3_key):
+def upload_file(s3_client, local_file_path, bucket_name, s3_key, sha256=None, transfer_config=None,
+                metadata=True):
     """
     Upload a single file to S3.
+    
+    When sha256 is given it is stored as object metadata, so later
+    incremental runs can tell unchanged objects apart without the manifest.
+    With metadata the document's sidecar is uploaded right after it.
     """
     try:
         content_type = get_content_type(local_file_path)
+        extra_args = {
+            'ContentType': content_type,
+            'ServerSideEncryption': 'AES256'
+        }
+        if sha256:
+            extra_args['Metadata'] = {'sha256': sha256}
         
         with open(local_file_path, 'rb') as file:
             s3_client.upload_fileobj(
                 file,
                 bucket_name,
                 s3_key,
-                ExtraArgs={
-                    'ContentType': content_type,
-                    'ServerSideEncryption': 'AES256'
-                }
+                ExtraArgs=extra_args,
+                Config=transfer_config
             )
         
         file_size = os.path.getsize(local_file_path)
         print(f"  ✓ Uploaded: {s3_key} ({file_size:,} bytes)")
+        if metadata:
+            upload_metadata(s3_client, local_file_path, bucket_name, s3_key)
         return True
         
     except Exception as e:
         print(f"  ✗ Failed to upload {s3_key}: {e}")
         return False
 
+def upload_metadata(s3_client, local_file_path, bucket_name, s3_key):
+    """
+    Upload the metadata sidecar of a document (<key>.metadata.json).
+    
+    The attributes are the tags ingest.py gives the same document, so
+    filtered searches work the same on Bedrock and on pgvector. File types
+    spec_corpus can't read are tagged from their name only.
+    """
+    try:
+        from spec_corpus import CORPUS_EXTENSIONS, document_tags, read_pages
+        pages = read_pages(local_file_path) if Path(local_file_path).suffix.lower() in CORPUS_EXTENSIONS else []
+        body = json.dumps({'metadataAttributes': document_tags(s3_key, pages)}).encode('utf-8')
+        s3_client.put_object(
+            Bucket=bucket_name,
+            Key=s3_key + METADATA_SUFFIX,
+            Body=body,
+            ContentType='application/json',
+            ServerSideEncryption='AES256'
+        )
+        return True
+    except Exception as e:
+        print(f"  ⚠ No metadata sidecar for {s3_key} (not filterable by machine): {e}")
+        return False
+
 def get_files_to_upload(local_folder):
     """
     Get a list of files to upload from the local folder.
@@ -136,6 +216,329 @@ def get_files_to_upload(local_folder):
     
     return files_to_upload
 
+def file_sha256(file_path):
+    """
+    Compute the SHA-256 of a file, reading it in 1 MB blocks.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_manifest(manifest_path):
+    """
+    Load the upload manifest: {s3_key: {"sha256", "size", "mtime"}}.
+    """
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, encoding='utf-8') as manifest_file:
+        return json.load(manifest_file)
+
+def save_manifest(manifest_path, manifest):
+    """
+    Write the manifest atomically so an interrupted run never corrupts it.
+    """
+    temp_path = f"{manifest_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+    os.replace(temp_path, manifest_path)
+
+def list_remote_etags(s3_client, bucket_name, prefix=""):
+    """
+    Return {s3_key: etag} for every object under prefix (1000 keys per request).
+    """
+    etags = {}
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            etags[obj['Key']] = obj['ETag'].strip('"')
+    return etags
+
+def remote_sha256(s3_client, bucket_name, s3_key):
+    """
+    Return the sha256 metadata of an existing object, or None if it is missing.
+    """
+    try:
+        response = s3_client.head_object(Bucket=bucket_name, Key=s3_key)
+        return response.get('Metadata', {}).get('sha256')
+    except ClientError:
+        return None
+
+def file_md5(file_path):
+    """
+    Compute the MD5 of a file (the ETag of a single-part S3 upload).
+    """
+    digest = hashlib.md5()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def plan_incremental_upload(s3_client, files_to_upload, bucket_name, manifest, workers=UPLOAD_WORKERS):
+    """
+    Work out which files are new or changed since the last upload.
+    
+    Files whose size and modification time match the manifest are skipped
+    without being read. Everything else is hashed and compared with the
+    manifest. Files missing from the manifest (lost manifest, uploads from
+    another machine) are checked against S3: absent keys are new, and
+    existing objects are unchanged if their ETag matches the file's MD5 or
+    their sha256 metadata matches the file's hash.
+    
+    Returns:
+        (changed, unchanged) - lists of (local_file, s3_key, sha256, stat)
+    """
+    remote_etags = {}
+    if any(s3_key not in manifest for _, s3_key in files_to_upload):
+        remote_etags = list_remote_etags(s3_client, bucket_name, S3_PREFIX)
+    
+    def check(item):
+        local_file, s3_key = item
+        stat = os.stat(local_file)
+        entry = manifest.get(s3_key)
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            return local_file, s3_key, entry['sha256'], stat, False
+        
+        sha256 = file_sha256(local_file)
+        if entry:
+            return local_file, s3_key, sha256, stat, entry['sha256'] != sha256
+        
+        etag = remote_etags.get(s3_key)
+        if etag is None:
+            return local_file, s3_key, sha256, stat, True
+        if etag == file_md5(local_file) or remote_sha256(s3_client, bucket_name, s3_key) == sha256:
+            return local_file, s3_key, sha256, stat, False
+        return local_file, s3_key, sha256, stat, True
+    
+    changed, unchanged = [], []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for local_file, s3_key, sha256, stat, is_changed in pool.map(check, files_to_upload):
+            (changed if is_changed else unchanged).append((local_file, s3_key, sha256, stat))
+    return changed, unchanged
+
+def upload_files_parallel(s3_client, changed, bucket_name, manifest, workers=UPLOAD_WORKERS):
+    """
+    Upload the planned files on a worker pool and record them in the manifest.
+    
+    Returns:
+        (uploaded_keys, failed_keys)
+    """
+    def upload(item):
+        local_file, s3_key, sha256, stat = item
+        # Sidecars are written by upload_missing_sidecars once the documents are in
+        ok = upload_file(s3_client, local_file, bucket_name, s3_key, sha256, TRANSFER_CONFIG, metadata=False)
+        return item, ok
+    
+    uploaded_keys, failed_keys = [], []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for (local_file, s3_key, sha256, stat), ok in pool.map(upload, changed):
+            if ok:
+                manifest[s3_key] = {'sha256': sha256, 'size': stat.st_size, 'mtime': stat.st_mtime}
+                uploaded_keys.append(s3_key)
+            else:
+                failed_keys.append(s3_key)
+    return uploaded_keys, failed_keys
+
+def upload_missing_sidecars(s3_client, files, bucket_name, manifest, workers=UPLOAD_WORKERS):
+    """
+    Upload the metadata sidecar of every file whose manifest entry lacks one.
+    
+    A new manifest entry (new or changed document) never records a sidecar,
+    so changed documents get fresh tags, and documents uploaded before
+    sidecars existed are backfilled once. Failed sidecars are retried on
+    the next run.
+    
+    Returns:
+        List of keys whose sidecar was uploaded
+    """
+    def upload(item):
+        local_file, s3_key = item
+        return s3_key, upload_metadata(s3_client, local_file, bucket_name, s3_key)
+    
+    uploaded_keys = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for s3_key, ok in pool.map(upload, files):
+            if ok:
+                manifest[s3_key]['sidecar'] = True
+                uploaded_keys.append(s3_key)
+    return uploaded_keys
+
+def delete_removed_objects(s3_client, bucket_name, s3_keys):
+    """
+    Delete documents together with their metadata sidecars (<key>.metadata.json).
+    
+    A key only counts as deleted when S3 reported no error for either object.
+    
+    Returns:
+        (deleted_keys, failed_keys)
+    """
+    deleted_keys, failed_keys = [], []
+    # delete_objects takes up to 1000 objects, i.e. 500 documents with sidecars
+    for start in range(0, len(s3_keys), 500):
+        batch = s3_keys[start:start + 500]
+        objects = [{'Key': key} for s3_key in batch for key in (s3_key, s3_key + METADATA_SUFFIX)]
+        try:
+            response = s3_client.delete_objects(Bucket=bucket_name, Delete={'Objects': objects, 'Quiet': True})
+        except ClientError as e:
+            print(f"  ✗ Failed to delete {len(batch)} removed file(s): {e}")
+            failed_keys.extend(batch)
+            continue
+        errors = {error['Key'] for error in response.get('Errors', [])}
+        for s3_key in batch:
+            if s3_key in errors or s3_key + METADATA_SUFFIX in errors:
+                print(f"  ✗ Failed to delete {s3_key}")
+                failed_keys.append(s3_key)
+            else:
+                print(f"  ✓ Deleted: {s3_key}")
+                deleted_keys.append(s3_key)
+    return deleted_keys, failed_keys
+
+def sync_incremental(s3_client, files_to_upload, bucket_name, manifest_path=MANIFEST_FILE,
+                     workers=UPLOAD_WORKERS, confirm=None, delete=False):
+    """
+    Upload only new or changed files in parallel, upload missing metadata
+    sidecars, and update the manifest. With delete the objects of files that
+    were removed locally are deleted as well; otherwise they are only reported.
+    
+    confirm is an optional callable(changed, removed, sidecars) -> bool asked
+    before uploading or deleting anything (removed is [] without delete).
+    
+    A removed file stays in the manifest until its object and sidecar are
+    actually deleted from S3, so a run without delete, or a declined or
+    failed one, reports it again next time. With no local files at all
+    nothing is deleted (a wrong folder must not empty the bucket).
+    
+    Returns:
+        Dict with 'uploaded', 'failed', 'unchanged', 'sidecars' (sidecar
+        uploaded), 'removed' (deleted from S3) and 'pending_removal' (removed
+        locally, still in S3) key lists, plus 'plan_seconds' and 'upload_seconds'
+    """
+    manifest = load_manifest(manifest_path)
+    
+    start = time.perf_counter()
+    changed, unchanged = plan_incremental_upload(s3_client, files_to_upload, bucket_name, manifest, workers)
+    plan_seconds = time.perf_counter() - start
+    
+    # Keys that were uploaded before but no longer exist locally
+    local_keys = {s3_key for _, s3_key in files_to_upload}
+    removed = sorted(key for key in manifest if key not in local_keys) if files_to_upload and delete else []
+    
+    # Files that were unchanged but not yet in the manifest (e.g. matched by
+    # S3 metadata) are recorded so the next run doesn't hash them again
+    for local_file, s3_key, sha256, stat in unchanged:
+        manifest[s3_key] = dict(manifest.get(s3_key, {}), sha256=sha256, size=stat.st_size, mtime=stat.st_mtime)
+    changed_keys = {s3_key for _, s3_key, _, _ in changed}
+    sidecars = [(local_file, s3_key) for local_file, s3_key in files_to_upload
+                if s3_key in changed_keys or not manifest[s3_key].get('sidecar')]
+    
+    uploaded, failed, written, deleted = [], [], [], []
+    start = time.perf_counter()
+    if (changed or removed or sidecars) and (confirm is None or confirm(changed, removed, sidecars)):
+        if changed:
+            uploaded, failed = upload_files_parallel(s3_client, changed, bucket_name, manifest, workers)
+        failed_keys = set(failed)
+        sidecars = [item for item in sidecars if item[1] not in failed_keys]
+        if sidecars:
+            written = upload_missing_sidecars(s3_client, sidecars, bucket_name, manifest, workers)
+        if removed:
+            deleted, _ = delete_removed_objects(s3_client, bucket_name, removed)
+    upload_seconds = time.perf_counter() - start
+    
+    for key in deleted:
+        del manifest[key]
+    save_manifest(manifest_path, manifest)
+    
+    return {
+        'uploaded': sorted(uploaded),
+        'failed': sorted(failed),
+        'unchanged': sorted(s3_key for _, s3_key, _, _ in unchanged),
+        'sidecars': sorted(written),
+        'removed': sorted(deleted),
+        'pending_removal': sorted(key for key in manifest if key not in local_keys),
+        'plan_seconds': plan_seconds,
+        'upload_seconds': upload_seconds,
+    }
+
+def main_incremental(args):
+    """
+    --parallel mode: upload only new/changed files on a worker pool.
+    """
+    print("AWS S3 Incremental Upload for Bedrock Knowledge Base")
+    print("=" * 55)
+    
+    if args.bucket == "your-bucket-name-here":
+        print("Error: Please update the BUCKET_NAME variable in this script or pass --bucket.")
+        sys.exit(1)
+    
+    s3_client = get_s3_client(args.endpoint_url, max_pool_connections=args.workers * TRANSFER_CONFIG.max_concurrency)
+    if not check_bucket_exists(s3_client, args.bucket):
+        sys.exit(1)
+    
+    print(f"Scanning local folder '{args.folder}'...")
+    files_to_upload = get_files_to_upload(args.folder)
+    
+    if not files_to_upload and args.delete:
+        print(f"No supported files found in '{args.folder}'; nothing will be deleted from '{args.bucket}'.")
+    
+    def confirm(changed, removed, sidecars):
+        if args.yes:
+            return True
+        response = input(f"\n{len(changed)} new/changed file(s) to upload, {len(sidecars)} metadata sidecar(s) "
+                         f"to write, {len(removed)} removed file(s) to delete. Apply to '{args.bucket}'? (y/N): ")
+        return response.lower() in ['y', 'yes']
+    
+    result = sync_incremental(s3_client, files_to_upload, args.bucket, args.manifest, args.workers, confirm,
+                              delete=args.delete)
+    
+    print(f"\nIncremental Upload Summary:")
+    print(f"  ✓ Uploaded:  {len(result['uploaded'])} ({result['upload_seconds']:.1f}s)")
+    print(f"  = Unchanged: {len(result['unchanged'])} (checked in {result['plan_seconds']:.1f}s)")
+    print(f"  + Sidecars:  {len(result['sidecars'])} metadata file(s) written")
+    print(f"  - Deleted:   {len(result['removed'])} removed locally")
+    print(f"  ! Pending:   {len(result['pending_removal'])} removed locally, still in S3")
+    print(f"  ✗ Failed:    {len(result['failed'])}")
+    
+    changed_keys = {'changed': result['uploaded'], 'removed': result['removed'],
+                    'metadata': result['sidecars'], 'pending_removal': result['pending_removal']}
+    if args.changed_keys_out:
+        with open(args.changed_keys_out, 'w', encoding='utf-8') as out_file:
+            json.dump(changed_keys, out_file, indent=1)
+        print(f"\n📝 Changed keys written to {args.changed_keys_out}")
+    
+    if result['uploaded'] or result['removed'] or result['sidecars']:
+        # Cached answers would outlive the sync; caching is off until its version is published
+        publish_kb_version(None)
+        print(f"\n📝 Re-ingest only these keys:")
+        for key in result['uploaded']:
+            print(f"  + {key}")
+        for key in sorted(set(result['sidecars']) - set(result['uploaded'])):
+            print(f"  ~ {key} (metadata)")
+        for key in result['removed']:
+            print(f"  - {key}")
+    else:
+        print("\nNothing changed - no Knowledge Base sync needed.")
+    if result['pending_removal']:
+        hint = "" if args.delete else ", run with --delete to remove them"
+        print(f"\n⚠ Removed locally but still in S3 (reported again next run{hint}):")
+        for key in result['pending_removal']:
+            print(f"  ? {key}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Upload spec sheets to S3 for the Bedrock Knowledge Base")
+    parser.add_argument('--parallel', action='store_true',
+                        help="Upload only new/changed files, several at a time")
+    parser.add_argument('--workers', type=int, default=UPLOAD_WORKERS)
+    parser.add_argument('--bucket', default=BUCKET_NAME)
+    parser.add_argument('--folder', default=LOCAL_FOLDER)
+    parser.add_argument('--manifest', default=MANIFEST_FILE)
+    parser.add_argument('--endpoint-url', help="S3-compatible endpoint (e.g. a local stand-in)")
+    parser.add_argument('--changed-keys-out', help="Write changed/removed keys to this JSON file")
+    parser.add_argument('--delete', action='store_true',
+                        help="With --parallel, delete objects of files removed from --folder")
+    parser.add_argument('--yes', action='store_true', help="Don't ask for confirmation")
+    return parser.parse_args()
+
 def main():
     """
     Main function to upload files to S3.
@@ -196,14 +599,20 @@ def main():
     print(f"  📁 Bucket: s3://{BUCKET_NAME}/")
     
     if successful_uploads > 0:
+        publish_kb_version(None)
         print(f"\n📝 Next steps:")
         print(f"  1. Go to the AWS Bedrock console")
         print(f"  2. Navigate to your Knowledge Base")
         print(f"  3. Sync the data source to ingest the uploaded documents")
         print(f"  4. Wait for the sync to complete before querying")
+        print(f"  5. Run scripts/retrieval_cache.py to turn the caches back on")
     
     if failed_uploads > 0:
         print(f"\n⚠ Some uploads failed. Please check the error messages above.")
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    if args.parallel:
+        main_incremental(args)
+    else:
+        main()
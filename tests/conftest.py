@@ -0,0 +1,13 @@
+"""
+Shared test setup: the modules in scripts/ (and chat.py at the repo root)
+are imported flat, the same way the CLI scripts and chat_server.py do.
+"""
+import os
+import sys
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+for path in (os.path.join(REPO_ROOT, "scripts"), REPO_ROOT):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+os.environ.setdefault('AWS_DEFAULT_REGION', "us-east-1")
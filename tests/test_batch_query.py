@@ -0,0 +1,123 @@
+import json
+
+import pytest
+from botocore.exceptions import ClientError
+
+import batch_query
+import bedrock_utils
+from bedrock_fake import SYNTHETIC_ANSWER, ReplayClient
+
+QUESTIONS = [
+    {"request_id": "r1", "body": "What is the rated load of the BD850?"},
+    {"request_id": "r2", "body": "What is the bucket capacity of the EX200?"},
+    {"request_id": "r3", "body": "What is the rated load of the BD850?"},
+]
+
+
+@pytest.fixture
+def offline(monkeypatch):
+    failing = set()
+
+    def generate_response(prompt):
+        if any(question in prompt for question in failing):
+            raise TimeoutError("generation timed out")
+        return "Rated for 100 tons."
+
+    monkeypatch.setattr(batch_query, "valid_prompt", lambda prompt: True)
+    monkeypatch.setattr(batch_query, "query_knowledge_base", lambda prompt: [
+        {'content': {'text': "Spec text."}, 'location': {'s3Location': {'uri': "s3://b/bd850.pdf"}}, 'score': 1.0}
+    ])
+    monkeypatch.setattr(batch_query, "generate_response", generate_response)
+    return failing
+
+
+def write_questions(path):
+    path.write_text("".join(json.dumps(row) + "\n" for row in QUESTIONS))
+
+
+def read_results(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_every_row_is_answered(tmp_path, offline):
+    questions, results = tmp_path / "questions.jsonl", tmp_path / "results.jsonl"
+    write_questions(questions)
+    summary = batch_query.run_batch(str(questions), str(results))
+    assert summary["unique_prompts"] == 2
+    assert sorted(row["id"] for row in read_results(results)) == ["r1", "r2", "r3"]
+
+
+def test_resume_replaces_error_rows(tmp_path, offline):
+    questions, results = tmp_path / "questions.jsonl", tmp_path / "results.jsonl"
+    write_questions(questions)
+    offline.add(QUESTIONS[1]["body"])
+    batch_query.run_batch(str(questions), str(results))
+    assert [row["id"] for row in read_results(results) if "error" in row] == ["r2"]
+
+    offline.clear()
+    summary = batch_query.run_batch(str(questions), str(results))
+    rows = read_results(results)
+    assert summary["rows_skipped"] == 2
+    assert sorted(row["id"] for row in rows) == ["r1", "r2", "r3"]
+    assert not any("error" in row for row in rows)
+
+
+def test_resume_drops_a_cut_off_line(tmp_path, offline):
+    questions, results = tmp_path / "questions.jsonl", tmp_path / "results.jsonl"
+    write_questions(questions)
+    batch_query.run_batch(str(questions), str(results))
+    with open(results, "a", encoding="utf-8") as output_file:
+        output_file.write('{"id": "r2", "answ')
+
+    assert batch_query.load_completed(str(results)) == {"r1", "r2", "r3"}
+    assert len(read_results(results)) == 3
+
+
+class ThrottledRuntime:
+    """bedrock-runtime stand-in that is throttled until `healthy` is set."""
+
+    def __init__(self):
+        self.healthy = False
+        self.replay = ReplayClient()
+
+    def invoke_model(self, **kwargs):
+        if not self.healthy:
+            raise ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'}}, 'InvokeModel')
+        return self.replay.invoke_model(**kwargs)
+
+
+def test_failed_bedrock_calls_are_error_rows_and_retried(tmp_path, monkeypatch):
+    monkeypatch.setattr(bedrock_utils, 'classification_cache', None)
+    monkeypatch.setattr(bedrock_utils, 'retrieval_cache', None)
+    monkeypatch.setattr(bedrock_utils, 'retrieval_backend', None)
+    runtime = ThrottledRuntime()
+    bedrock_utils.set_clients(runtime=runtime, agent_runtime=ReplayClient(), resilient=False)
+    questions, results = tmp_path / "questions.jsonl", tmp_path / "results.jsonl"
+    write_questions(questions)
+    try:
+        batch_query.run_batch(str(questions), str(results))
+        rows = read_results(results)
+        assert all("BedrockCallFailed" in row["error"] for row in rows)
+        assert not any("answer" in row for row in rows)
+
+        runtime.healthy = True
+        summary = batch_query.run_batch(str(questions), str(results))
+        rows = read_results(results)
+        assert summary["rows_skipped"] == 0
+        assert sorted(row["id"] for row in rows) == ["r1", "r2", "r3"]
+        assert all(row["answer"] == SYNTHETIC_ANSWER for row in rows)
+    finally:
+        bedrock_utils.clients.close()
+
+
+def test_raise_errors_is_scoped(monkeypatch):
+    monkeypatch.setattr(bedrock_utils, 'classification_cache', None)
+    bedrock_utils.set_clients(runtime=ThrottledRuntime(), resilient=False)
+    try:
+        assert bedrock_utils.generate_response("Hello") == ""
+        with pytest.raises(bedrock_utils.BedrockCallFailed):
+            with bedrock_utils.raise_errors():
+                bedrock_utils.generate_response("Hello")
+        assert bedrock_utils.generate_response("Hello") == ""
+    finally:
+        bedrock_utils.clients.close()
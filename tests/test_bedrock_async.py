@@ -0,0 +1,110 @@
+import asyncio
+import io
+import threading
+
+import pytest
+from botocore.exceptions import EndpointConnectionError
+
+import bedrock_utils
+from bedrock_async import AsyncBedrock
+from resilient_client import FakeBedrockClient, FaultInjectingClient
+
+QUESTION = "What is the bucket capacity of the BD850?"
+
+
+class ThreadRecordingBody(io.BytesIO):
+    """Response body that remembers which thread read it."""
+
+    def read(self, *args):
+        self.thread = threading.current_thread()
+        return super().read(*args)
+
+
+class RecordingClient(FakeBedrockClient):
+    def __init__(self):
+        super().__init__(latency=0)
+        self.bodies = []
+
+    def invoke_model(self, modelId, body, **kwargs):
+        response = super().invoke_model(modelId, body, **kwargs)
+        response['body'] = ThreadRecordingBody(response['body'].read())
+        self.bodies.append(response['body'])
+        return response
+
+
+@pytest.fixture
+def fake_clients(monkeypatch):
+    monkeypatch.setattr(bedrock_utils, 'classification_cache', None)
+    monkeypatch.setattr(bedrock_utils, 'retrieval_cache', None)
+    monkeypatch.setattr(bedrock_utils, 'AUTO_MODEL_FILTER', False)
+    runtime = RecordingClient()
+    bedrock_utils.set_clients(runtime=runtime, agent_runtime=FakeBedrockClient(latency=0))
+    yield runtime
+    bedrock_utils.clients.close()
+
+
+def test_uses_the_shared_registry_clients(fake_clients):
+    client = AsyncBedrock()
+    assert client.bedrock is bedrock_utils.runtime_client()
+    assert client.bedrock_kb is bedrock_utils.agent_runtime_client()
+
+
+def test_response_body_is_read_off_the_event_loop(fake_clients):
+    client = AsyncBedrock()
+
+    async def turn():
+        return await client.valid_prompt(QUESTION), threading.current_thread()
+
+    valid, loop_thread = asyncio.run(turn())
+    assert valid is True
+    assert fake_clients.bodies[0].thread is not loop_thread
+
+
+def test_query_and_generate(fake_clients):
+    client = AsyncBedrock()
+
+    async def turn():
+        chunks = await client.query_knowledge_base(QUESTION)
+        answer = await client.generate_response(QUESTION)
+        return chunks, answer
+
+    chunks, answer = asyncio.run(turn())
+    assert len(chunks) == 3
+    assert answer == "The machine is rated for 100 tons."
+
+
+def test_connection_errors_are_retried_on_the_async_path(monkeypatch):
+    monkeypatch.setattr(bedrock_utils, 'classification_cache', None)
+    faulty = FaultInjectingClient(FakeBedrockClient(latency=0), connection_error_rate=0.5, seed=3)
+    bedrock_utils.set_clients(runtime=faulty)
+    runtime = bedrock_utils.runtime_client()
+    runtime.base_delay = runtime.max_delay = 0.001
+    runtime.max_attempts = 20
+    try:
+        client = AsyncBedrock()
+
+        async def sessions():
+            return await asyncio.gather(*(client.valid_prompt(QUESTION) for _ in range(10)))
+
+        results = asyncio.run(sessions())
+        assert all(results)
+        assert runtime.stats()['invoke_model']['connection_errors'] > 0
+    finally:
+        bedrock_utils.clients.close()
+
+
+def test_connection_failure_returns_false(monkeypatch):
+    monkeypatch.setattr(bedrock_utils, 'classification_cache', None)
+    error = EndpointConnectionError(endpoint_url="https://bedrock.fake")
+
+    class Unreachable:
+        def invoke_model(self, **kwargs):
+            raise error
+
+    bedrock_utils.set_clients(runtime=Unreachable())
+    runtime = bedrock_utils.runtime_client()
+    runtime.base_delay = runtime.max_delay = 0.001
+    try:
+        assert asyncio.run(AsyncBedrock().valid_prompt(QUESTION)) is False
+    finally:
+        bedrock_utils.clients.close()
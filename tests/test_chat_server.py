@@ -0,0 +1,66 @@
+import contextvars
+import io
+import threading
+import time
+
+import chat_server
+from chat_server import ChatService, QuietableStdout, SessionStore
+
+
+def test_unknown_session_id_gets_a_server_generated_one():
+    store = SessionStore(rate=None)
+    session = store.get("chosen-by-the-client")
+    assert session.id != "chosen-by-the-client"
+    assert store.get(session.id) is session
+    assert store.get("chosen-by-the-client") is not session
+
+
+def test_queued_turn_of_a_session_holds_no_slot():
+    service = ChatService(SessionStore(rate=None), max_turns=2)
+    first, other = service.sessions.get(), service.sessions.get()
+    running, release = threading.Event(), threading.Event()
+    queued = threading.Event()
+
+    def run_turn(wait):
+        with service.turn(first) as refusal:
+            assert refusal is None
+            running.set()
+            if wait:
+                release.wait(5)
+
+    threads = [threading.Thread(target=run_turn, args=(True,)),
+               threading.Thread(target=lambda: (queued.set(), run_turn(False)))]
+    threads[0].start()
+    assert running.wait(5)
+    threads[1].start()  # Waits for the session lock behind the running turn
+    assert queued.wait(5)
+    time.sleep(0.05)  # Let it reach the lock
+    with service.turn(other) as refusal:
+        assert refusal is None  # The second slot is still free for another session
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert service.counters['turns'] == 3
+    assert service.active_turns == 0
+
+
+def test_busy_when_every_slot_is_taken():
+    service = ChatService(SessionStore(rate=None), max_turns=1)
+    with service.turn(service.sessions.get()) as refusal:
+        assert refusal is None
+        with service.turn(service.sessions.get()) as refusal:
+            assert refusal == "busy"
+    assert service.counters['busy'] == 1
+
+
+def test_quiet_turns_print_nothing_and_others_still_do():
+    stream = io.StringIO()
+    stdout = QuietableStdout(stream)
+
+    def quiet_turn():
+        chat_server._quiet.set(True)
+        print("Bot: Validating prompt...", file=stdout)
+
+    contextvars.copy_context().run(quiet_turn)
+    print("Chat server on http://127.0.0.1:8080", file=stdout)
+    assert stream.getvalue() == "Chat server on http://127.0.0.1:8080\n"
@@ -0,0 +1,100 @@
+import json
+import os
+import time
+
+import pytest
+
+import bedrock_utils
+from client_registry import ClientRegistry
+from resilient_client import FakeBedrockClient, ResilientClient
+
+CLASSIFY_BODY = json.dumps({'max_tokens': 10, 'messages': []})
+
+fork_only = pytest.mark.skipif(not hasattr(os, 'fork'), reason="needs os.fork")
+
+
+def in_child(function):
+    """Runs `function` in a forked child and returns what it returned (JSON-encodable)."""
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        try:
+            result = {'value': function()}
+        except BaseException as error:  # Reported to the parent, never raised in the child
+            result = {'error': repr(error)}
+        with os.fdopen(write_end, 'w') as pipe:
+            json.dump(result, pipe)
+        os._exit(0)
+    os.close(write_end)
+    with os.fdopen(read_end) as pipe:
+        result = json.load(pipe)
+    os.waitpid(pid, 0)
+    assert 'error' not in result, result.get('error')
+    return result['value']
+
+
+def test_get_builds_each_client_once():
+    registry = ClientRegistry()
+    built = []
+    registry.register("runtime", lambda: built.append(object()) or built[-1])
+    assert registry.get("runtime") is registry.get("runtime")
+    assert len(built) == 1
+
+
+def test_set_client_replaces_factory_until_cleared():
+    registry = ClientRegistry()
+    registry.register("runtime", lambda: "built")
+    registry.set("runtime", "installed")
+    assert registry.get("runtime") == "installed"
+    registry.set("runtime", None)
+    assert registry.get("runtime") == "built"
+
+
+@fork_only
+def test_child_rebuilds_factory_clients_and_keeps_installed_ones():
+    registry = ClientRegistry()
+    registry.register("built", object)
+    registry.register("installed", object)
+    parent_built = registry.get("built")
+    registry.set("installed", "fake")
+
+    def child():
+        return [registry.get("built") is parent_built, registry.get("installed")]
+
+    assert in_child(child) == [False, "fake"]
+
+
+@fork_only
+def test_resilient_client_works_in_a_forked_child():
+    client = ResilientClient(FakeBedrockClient(latency=0), deadline=2.0)
+    client.invoke_model(modelId="m", body=CLASSIFY_BODY)  # Starts the parent's pool threads
+
+    def child():
+        start = time.monotonic()
+        client.invoke_model(modelId="m", body=CLASSIFY_BODY)
+        return time.monotonic() - start
+
+    assert in_child(child) < 1.0
+    client.close()
+
+
+@fork_only
+def test_valid_prompt_in_a_forked_child_with_installed_clients(monkeypatch):
+    monkeypatch.setattr(bedrock_utils, 'classification_cache', None)
+    monkeypatch.setattr(bedrock_utils, 'INVOKE_DEADLINE', 2.0)
+    bedrock_utils.set_clients(runtime=FakeBedrockClient(latency=0))
+    try:
+        question = "What is the bucket capacity of the BD850?"
+        assert bedrock_utils.valid_prompt(question)
+
+        def child():
+            start = time.monotonic()
+            valid = bedrock_utils.valid_prompt(question)
+            return [valid, time.monotonic() - start]
+
+        valid, seconds = in_child(child)
+        assert valid is True
+        assert seconds < 1.0
+    finally:
+        bedrock_utils.clients.close()
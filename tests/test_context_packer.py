@@ -0,0 +1,41 @@
+from context_packer import CHARS_PER_TOKEN, format_context, pack_context
+
+
+def chunk(text, score, uri="s3://spec-sheets/bd850-spec-sheet.pdf"):
+    return {'content': {'text': text}, 'location': {'type': 'S3', 's3Location': {'uri': uri}}, 'score': score}
+
+
+def test_chunks_are_packed_best_first():
+    packed, _ = pack_context([chunk("Low score text.", 0.2), chunk("High score text.", 0.9)])
+    assert [text for _, text in packed] == ["High score text.", "Low score text."]
+
+
+def test_repeated_sentences_are_packed_once():
+    packed, _ = pack_context([
+        chunk("Rated load is 100 tons. Engine is 600 hp.", 0.9),
+        chunk("Engine is 600 hp. Blade width is 5 m.", 0.8),
+    ])
+    assert [text for _, text in packed] == ["Rated load is 100 tons. Engine is 600 hp.", "Blade width is 5 m."]
+
+
+def test_budget_cuts_at_a_sentence_boundary():
+    sentences = " ".join(f"Sentence number {i} about the BD850." for i in range(50))
+    packed, tokens = pack_context([chunk(sentences, 0.9), chunk("Never reached.", 0.5)], token_budget=40)
+    assert len(packed) == 1
+    assert packed[0][1].endswith(".")
+    assert tokens <= 40
+
+
+def test_oversized_first_sentence_is_hard_truncated():
+    huge = "word " * 2000  # One "sentence" far over the budget
+    packed, tokens = pack_context([chunk(huge, 0.9), chunk("Second chunk.", 0.5)], token_budget=50)
+    assert len(packed) == 1
+    assert packed[0][1] and huge.startswith(packed[0][1])
+    assert tokens <= 50
+    assert len(format_context(packed)) <= 50 * CHARS_PER_TOKEN
+
+
+def test_oversized_later_chunk_is_not_truncated_in():
+    huge = "word " * 2000
+    packed, _ = pack_context([chunk("Rated load is 100 tons.", 0.9), chunk(huge, 0.5)], token_budget=50)
+    assert [text for _, text in packed] == ["Rated load is 100 tons."]
@@ -0,0 +1,107 @@
+"""Follow-up rewriting, history budget and chunk reuse in conversation_memory.ConversationMemory."""
+import threading
+
+import pytest
+
+import bedrock_utils
+from conversation_memory import ConversationMemory, summarize_with_model
+from model_routing import DEFAULT_ROUTES
+
+
+@pytest.fixture
+def memory():
+    memory = ConversationMemory(summarizer=None)
+    memory.rewrite("What is the payload capacity of the DT1000?")
+    return memory
+
+
+@pytest.mark.parametrize("follow_up, standalone", [
+    ("How heavy is it?", "How heavy is the DT1000?"),
+    ("and what about its engine?", "What is the DT1000's engine?"),
+    ("Does it have a cab?", "Does the DT1000 have a cab?"),
+    ("How heavy is that?", "How heavy is the DT1000?"),
+    ("And the top speed?", "What is the top speed of the DT1000?"),
+])
+def test_follow_ups_are_rewritten(memory, follow_up, standalone):
+    assert memory.rewrite(follow_up) == standalone
+
+
+@pytest.mark.parametrize("message", [
+    "Is it true that operators need a licence to drive a forklift?",
+    "Is it safe to operate a crane in strong wind?",
+    "What is the recommended tyre pressure?",
+])
+def test_standalone_questions_are_left_alone(memory, message):
+    assert memory.rewrite(message) == message
+
+
+def test_elliptical_question_swaps_the_model(memory):
+    assert memory.rewrite("And the BD850?") == "What is the payload capacity of the BD850?"
+
+
+def test_elliptical_question_matches_codes_written_differently():
+    memory = ConversationMemory(summarizer=None)
+    memory.rewrite("What is the payload of the dt-1000?")
+    assert memory.rewrite("And the BD850?") == "What is the payload of the BD850?"
+
+
+def test_elliptical_question_keeps_the_new_model_when_the_old_one_is_not_in_the_text(memory):
+    memory._last_standalone = "How fast does the truck go?"
+    assert "BD850" in memory.rewrite("And the BD850?")
+
+
+def test_old_turns_are_folded_into_the_summary():
+    memory = ConversationMemory(summarizer=None, history_tokens=40)
+    for i in range(4):
+        memory.add_turn(f"Question {i} about the DT1000?", "An answer of several words. " * 3)
+    assert memory.summary.startswith("Asked: Question 0")
+    assert len(memory.turns) < 4
+    assert "Summary of earlier turns" in memory.history_text()
+
+
+def test_pooled_chunks_are_reused_for_a_covered_query():
+    memory = ConversationMemory(summarizer=None)
+    chunk = {'content': {'text': "DT1000 payload capacity 100 tons"},
+             'location': {'s3Location': {'uri': "s3://spec-sheets/dump-truck-dt1000-spec-sheet.pdf"}}}
+    calls = []
+    retrieve = memory.retriever(lambda query: calls.append(query) or [chunk])
+    retrieve("DT1000 payload capacity")
+    assert retrieve("payload capacity of the DT1000") == [chunk]
+    assert len(calls) == 1
+    assert memory.stats()['retrievals_skipped'] == 1
+
+
+def test_model_summary_is_written_after_the_turn():
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_summarizer(summary, turns_text):
+        started.set()
+        release.wait(5)
+        return "DT1000 summary"
+
+    memory = ConversationMemory(summarizer=slow_summarizer, history_tokens=40)
+    for i in range(4):
+        memory.add_turn(f"Question {i} about the DT1000?", "An answer of several words. " * 3)
+    assert started.wait(5)  # add_turn returned while the summarizer was still running
+    release.set()
+    assert memory.summary == "DT1000 summary"
+    assert memory.stats()['summaries'] >= 1
+
+
+def test_failed_model_summary_falls_back_to_extractive():
+    def failing_summarizer(summary, turns_text):
+        raise RuntimeError("model down")
+
+    memory = ConversationMemory(summarizer=failing_summarizer, history_tokens=40)
+    for i in range(4):
+        memory.add_turn(f"Question {i} about the DT1000?", "An answer of several words. " * 3)
+    assert memory.summary.startswith("Asked: Question 0")
+
+
+def test_default_summarizer_uses_the_small_route(monkeypatch):
+    calls = []
+    monkeypatch.setattr(bedrock_utils, 'generate_response', lambda prompt, **kwargs: calls.append(kwargs) or "ok")
+    assert summarize_with_model("", "User: hi\nAssistant: hello") == "ok"
+    assert calls[0]['model_id'] == DEFAULT_ROUTES["summarize"]['model_id']
+    assert calls[0]['max_tokens'] == DEFAULT_ROUTES["summarize"]['max_tokens']
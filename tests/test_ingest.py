@@ -0,0 +1,54 @@
+from embedders import HashingEmbedder
+from ingest import LocalChunkStore, ingest
+
+SPEC_TEXT = "The BD850 bulldozer has an operating weight of 85,000 kg and a 600 hp engine."
+
+
+def ingest_folder(store, folder, **kwargs):
+    return ingest(store, HashingEmbedder(64), str(folder), workers=1, **kwargs)
+
+
+def test_second_run_is_unchanged(tmp_path):
+    (tmp_path / "bd850-spec-sheet.txt").write_text(SPEC_TEXT)
+    store = LocalChunkStore(None)
+    first = ingest_folder(store, tmp_path)
+    second = ingest_folder(store, tmp_path)
+    assert first['added'] > 0
+    assert second['added'] == 0
+    assert second['unchanged'] == first['added']
+    assert second['tombstoned'] == 0
+
+
+def test_missing_folder_changes_nothing(tmp_path, capsys):
+    (tmp_path / "bd850-spec-sheet.txt").write_text(SPEC_TEXT)
+    store = LocalChunkStore(None)
+    ingest_folder(store, tmp_path)
+    live = store.live_ids()
+
+    assert ingest_folder(store, tmp_path / "typo") is None
+    assert store.live_ids() == live
+    assert "does not exist" in capsys.readouterr().out
+
+
+def test_empty_folder_changes_nothing(tmp_path):
+    (tmp_path / "docs").mkdir()
+    (tmp_path / "docs" / "bd850-spec-sheet.txt").write_text(SPEC_TEXT)
+    (tmp_path / "empty").mkdir()
+    store = LocalChunkStore(None)
+    ingest_folder(store, tmp_path / "docs")
+    live = store.live_ids()
+
+    assert ingest_folder(store, tmp_path / "empty") is None
+    assert store.live_ids() == live
+
+
+def test_allow_empty_tombstones_everything(tmp_path):
+    (tmp_path / "docs").mkdir()
+    (tmp_path / "docs" / "bd850-spec-sheet.txt").write_text(SPEC_TEXT)
+    (tmp_path / "empty").mkdir()
+    store = LocalChunkStore(None)
+    added = ingest_folder(store, tmp_path / "docs")['added']
+
+    stats = ingest_folder(store, tmp_path / "empty", allow_empty=True)
+    assert stats['tombstoned'] == added
+    assert not store.live_ids()
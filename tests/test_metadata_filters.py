@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+
+import bedrock_utils
+from retrieval_cache import RetrievalCache
+
+QUESTION = "What is the payload of the XZ900?"
+
+UNTAGGED_CHUNK = {
+    'content': {'text': "The XZ900 hauls 90 tons."},
+    'location': {'type': 'S3', 's3Location': {'uri': 's3://spec-sheets/xz900.pdf'}},
+    'metadata': {},
+    'score': 0.9,
+}
+
+
+class UntaggedBackend:
+    """Local engine over an untagged KB: filtered searches find nothing (or fail)."""
+
+    name = "untagged"
+
+    def __init__(self, fail_filtered=False):
+        self.fail_filtered = fail_filtered
+        self.searches = []
+
+    def retrieve(self, query, number_of_results=3, filters=None):
+        self.searches.append(filters)
+        if filters:
+            if self.fail_filtered:
+                raise TimeoutError("statement timeout")
+            return []
+        return [UNTAGGED_CHUNK]
+
+
+@pytest.fixture(autouse=True)
+def filter_state(monkeypatch):
+    monkeypatch.setattr(bedrock_utils, 'AUTO_MODEL_FILTER', True)
+    monkeypatch.setattr(bedrock_utils, 'retrieval_cache', None)
+    monkeypatch.setattr(bedrock_utils, 'rerank_stage', None)
+    monkeypatch.setattr(bedrock_utils, '_unfilterable_models', {})
+    yield
+    bedrock_utils.set_retrieval_backend(None)
+
+
+def test_query_names_model_filter():
+    assert bedrock_utils.model_filters(QUESTION) == {'machine_model': ['XZ900', 'general']}
+    assert bedrock_utils.model_filters("What is a bulldozer?") is None
+
+
+def test_empty_filtered_search_falls_back_and_marks_model():
+    backend = UntaggedBackend()
+    bedrock_utils.set_retrieval_backend(backend)
+    assert bedrock_utils.query_knowledge_base(QUESTION) == [UNTAGGED_CHUNK]
+    assert bedrock_utils.model_filters(QUESTION) is None
+
+    backend.searches.clear()
+    bedrock_utils.query_knowledge_base(QUESTION)
+    assert backend.searches == [None]  # No filtered search first any more
+
+
+def test_failed_filtered_search_falls_back_without_marking():
+    backend = UntaggedBackend(fail_filtered=True)
+    bedrock_utils.set_retrieval_backend(backend)
+    assert bedrock_utils.query_knowledge_base(QUESTION) == [UNTAGGED_CHUNK]
+    assert backend.searches[-1] is None
+    assert bedrock_utils.model_filters(QUESTION) is not None
+
+
+def test_outranked_model_chunks_are_not_marked():
+    tagged = dict(UNTAGGED_CHUNK, metadata={'machine_model': 'XZ900'}, score=0.5)
+    general = dict(UNTAGGED_CHUNK, metadata={'machine_model': 'general'}, score=0.9)
+
+    class OutrankedBackend:
+        name = "outranked"
+
+        def retrieve(self, query, number_of_results=3, filters=None):
+            # The filtered top-k only holds general chunks; the XZ900 one ranks lower
+            return [general] if filters else [general, tagged]
+
+    bedrock_utils.set_retrieval_backend(OutrankedBackend())
+    assert bedrock_utils.query_knowledge_base(QUESTION) == [general, tagged]
+    assert bedrock_utils.model_filters(QUESTION) is not None
+
+
+def test_async_path_shares_the_fallback():
+    from bedrock_async import AsyncBedrock
+
+    backend = UntaggedBackend(fail_filtered=True)
+    bedrock_utils.set_retrieval_backend(backend)
+    chunks = asyncio.run(AsyncBedrock().query_knowledge_base(QUESTION))
+    assert chunks == [UNTAGGED_CHUNK]
+    assert bedrock_utils.model_filters(QUESTION) is not None
+
+    backend.fail_filtered = False
+    asyncio.run(AsyncBedrock().query_knowledge_base(QUESTION))
+    assert bedrock_utils.model_filters(QUESTION) is None
+
+
+def test_fallback_is_traced():
+    import tracing
+
+    bedrock_utils.set_retrieval_backend(UntaggedBackend())
+    tracer = tracing.enable()
+    try:
+        bedrock_utils.query_knowledge_base(QUESTION)
+    finally:
+        tracing.disable()
+    assert tracer.trace()[0].attributes.get('filter_fallback') is True
+
+
+def test_mark_expires_after_ttl(monkeypatch):
+    bedrock_utils.mark_unfilterable({'machine_model': ['XZ900', 'general']})
+    assert bedrock_utils.model_filters(QUESTION) is None
+    monkeypatch.setattr(bedrock_utils.time, 'monotonic', lambda: float('inf'))
+    assert bedrock_utils.model_filters(QUESTION) is not None
+
+
+def test_mark_is_reset_by_a_new_kb_version(monkeypatch):
+    cache = RetrievalCache(kb_version="sync-1")
+    monkeypatch.setattr(bedrock_utils, 'retrieval_cache', cache)
+    bedrock_utils.mark_unfilterable({'machine_model': ['XZ900', 'general']})
+    assert bedrock_utils.model_filters(QUESTION) is None
+    cache.set_kb_version("sync-2")
+    assert bedrock_utils.model_filters(QUESTION) is not None
@@ -0,0 +1,120 @@
+import json
+
+import pytest
+from botocore.exceptions import ClientError, EndpointConnectionError, ReadTimeoutError
+
+import bedrock_utils
+from resilient_client import (
+    ConnectionFailed,
+    DeadlineExceeded,
+    FakeBedrockClient,
+    FaultInjectingClient,
+    ResilientClient,
+)
+
+CLASSIFY_BODY = json.dumps({'max_tokens': 10, 'messages': []})
+
+
+class FailingClient:
+    """Raises `errors` in turn, then answers like FakeBedrockClient."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+        self.fake = FakeBedrockClient(latency=0)
+
+    def invoke_model(self, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.fake.invoke_model(**kwargs)
+
+
+def fast_client(client, **kwargs):
+    kwargs.setdefault('base_delay', 0.001)
+    kwargs.setdefault('max_delay', 0.001)
+    return ResilientClient(client, **kwargs)
+
+
+def throttled():
+    return ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'}}, 'InvokeModel')
+
+
+def test_throttling_is_retried():
+    client = fast_client(FailingClient(throttled(), throttled()))
+    response = client.invoke_model(modelId="m", body=CLASSIFY_BODY)
+    assert json.loads(response['body'].read())['content'][0]['text'] == "Category E"
+    assert client.stats()['invoke_model']['retries'] == 2
+
+
+def test_non_retryable_error_is_raised_at_once():
+    error = ClientError({'Error': {'Code': 'ValidationException', 'Message': 'bad'}}, 'InvokeModel')
+    inner = FailingClient(error)
+    with pytest.raises(ClientError):
+        fast_client(inner).invoke_model(modelId="m", body=CLASSIFY_BODY)
+    assert inner.calls == 1
+
+
+@pytest.mark.parametrize("error", [
+    EndpointConnectionError(endpoint_url="https://bedrock.fake"),
+    ReadTimeoutError(endpoint_url="https://bedrock.fake"),
+])
+def test_connection_errors_are_retried(error):
+    client = fast_client(FailingClient(error, error))
+    client.invoke_model(modelId="m", body=CLASSIFY_BODY)
+    counters = client.stats()['invoke_model']
+    assert counters['connection_errors'] == 2
+    assert counters['retries'] == 2
+
+
+def test_connection_error_on_last_attempt_is_a_client_error():
+    error = ReadTimeoutError(endpoint_url="https://bedrock.fake")
+    inner = FailingClient(*[error] * 3)
+    with pytest.raises(ConnectionFailed) as raised:
+        fast_client(inner, max_attempts=3).invoke_model(modelId="m", body=CLASSIFY_BODY)
+    assert isinstance(raised.value, ClientError)
+    assert raised.value.response['Error']['Code'] == 'ConnectionFailed'
+    assert inner.calls == 3
+
+
+def test_slow_call_raises_deadline_exceeded():
+    client = ResilientClient(FakeBedrockClient(latency=0.5), deadline=0.05)
+    with pytest.raises(DeadlineExceeded):
+        client.invoke_model(modelId="m", body=CLASSIFY_BODY)
+    client.close()
+
+
+def test_backoff_past_the_deadline_raises_deadline_exceeded(monkeypatch):
+    monkeypatch.setattr('resilient_client.random.uniform', lambda low, high: high)
+    client = ResilientClient(FailingClient(throttled()), base_delay=1.0, deadline=0.5)
+    with pytest.raises(DeadlineExceeded):
+        client.invoke_model(modelId="m", body=CLASSIFY_BODY)
+    assert client.stats()['invoke_model']['deadline_exceeded'] == 1
+
+
+def test_fault_injecting_client_connection_errors_are_absorbed():
+    faulty = FaultInjectingClient(FakeBedrockClient(latency=0), connection_error_rate=0.3, seed=7)
+    client = fast_client(faulty, max_attempts=10)
+    for _ in range(20):
+        client.invoke_model(modelId="m", body=CLASSIFY_BODY)
+    assert client.stats()['invoke_model']['connection_errors'] > 0
+
+
+@pytest.fixture
+def bedrock_clients():
+    yield
+    bedrock_utils.clients.close()
+
+
+def test_valid_prompt_returns_false_on_connection_failure(bedrock_clients, monkeypatch):
+    error = EndpointConnectionError(endpoint_url="https://bedrock.fake")
+    monkeypatch.setattr(bedrock_utils, 'classification_cache', None)
+    bedrock_utils.set_clients(runtime=FailingClient(*[error] * 10), resilient=False)
+    assert bedrock_utils.valid_prompt("What is the bucket capacity of the BD850?") is False
+
+
+def test_valid_prompt_retries_through_connection_errors(bedrock_clients, monkeypatch):
+    error = ReadTimeoutError(endpoint_url="https://bedrock.fake")
+    monkeypatch.setattr(bedrock_utils, 'classification_cache', None)
+    bedrock_utils.set_clients(runtime=fast_client(FailingClient(error)), resilient=False)
+    assert bedrock_utils.valid_prompt("What is the bucket capacity of the BD850?") is True
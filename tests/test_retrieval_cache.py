@@ -0,0 +1,108 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import bedrock_utils
+from bedrock_fake import ReplayClient
+from hybrid_retrieval import BM25Index
+from retrieval_cache import RetrievalCache, publish_kb_version
+from spec_corpus import load_chunks
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts")
+QUESTION = "What is the operating weight of the BD850 bulldozer?"
+
+
+@pytest.fixture
+def replay(monkeypatch):
+    monkeypatch.setattr(bedrock_utils, 'rerank_stage', None)
+    monkeypatch.setattr(bedrock_utils, 'retrieval_backend', None)
+    client = ReplayClient(fallback_backend=BM25Index(load_chunks()))
+    bedrock_utils.set_clients(agent_runtime=client)
+    yield client
+    bedrock_utils.set_retrieval_cache(None)
+    bedrock_utils.clients.close()
+
+
+def searches(client):
+    return client.stats()['misses']  # No cassette: every retrieve call is a miss
+
+
+def test_repeated_search_is_served_from_cache(replay):
+    bedrock_utils.set_retrieval_cache(RetrievalCache(kb_version="sync-1"))
+    first = bedrock_utils.query_knowledge_base(QUESTION)
+    second = bedrock_utils.query_knowledge_base(QUESTION)
+    assert first and second == first
+    assert searches(replay) == 1
+
+
+def test_new_kb_version_misses(replay):
+    cache = RetrievalCache(kb_version="sync-1")
+    bedrock_utils.set_retrieval_cache(cache)
+    bedrock_utils.query_knowledge_base(QUESTION)
+    cache.set_kb_version("sync-2")
+    bedrock_utils.query_knowledge_base(QUESTION)
+    assert searches(replay) == 2
+
+
+def test_unknown_kb_version_disables_caching(replay):
+    cache = RetrievalCache(kb_version="sync-1")
+    bedrock_utils.set_retrieval_cache(cache)
+    bedrock_utils.query_knowledge_base(QUESTION)
+
+    cache.set_kb_version(None)  # fetch_kb_version failed
+    assert cache.kb_version is None
+    bedrock_utils.query_knowledge_base(QUESTION)
+    bedrock_utils.query_knowledge_base(QUESTION)
+    assert searches(replay) == 3
+
+    cache.set_kb_version("sync-1")  # Entries from before the unknown period still belong to sync-1
+    bedrock_utils.query_knowledge_base(QUESTION)
+    assert searches(replay) == 3
+
+
+def test_version_is_never_the_string_none():
+    cache = RetrievalCache()
+    cache.set_kb_version(None)
+    cache.set("kb", "q", {}, [{'content': {'text': "x"}}])
+    assert cache.get("kb", "q", {}) is None
+    assert cache.kb_version != "None"
+
+
+def test_default_version_is_unknown_until_published(replay, tmp_path):
+    version_file = str(tmp_path / "kb_version")
+    bedrock_utils.set_retrieval_cache(RetrievalCache(version_file=version_file))
+    bedrock_utils.query_knowledge_base(QUESTION)
+    bedrock_utils.query_knowledge_base(QUESTION)
+    assert searches(replay) == 2  # Nothing published yet: caching is off
+
+    publish_kb_version("sync-1", version_file)
+    bedrock_utils.query_knowledge_base(QUESTION)
+    bedrock_utils.query_knowledge_base(QUESTION)
+    assert searches(replay) == 3
+
+
+def test_published_version_invalidates_a_running_cache(replay, tmp_path):
+    version_file = str(tmp_path / "kb_version")
+    publish_kb_version("sync-1", version_file)
+    cache = RetrievalCache(version_file=version_file)
+    bedrock_utils.set_retrieval_cache(cache)
+    bedrock_utils.query_knowledge_base(QUESTION)
+
+    publish_kb_version(None, version_file)  # What an S3 upload publishes until the re-sync
+    assert cache.kb_version is None
+    bedrock_utils.query_knowledge_base(QUESTION)
+
+    publish_kb_version("sync-2", version_file)
+    bedrock_utils.query_knowledge_base(QUESTION)
+    bedrock_utils.query_knowledge_base(QUESTION)
+    assert cache.kb_version == "sync-2"
+    assert searches(replay) == 3
+
+
+def test_importing_the_cache_does_not_import_boto3():
+    code = "import sys; import retrieval_cache; print('boto3' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                            env=dict(os.environ, PYTHONPATH=SCRIPTS_DIR))
+    assert result.stdout.strip() == "False", result.stderr
@@ -0,0 +1,36 @@
+from retrieval_cache import publish_kb_version
+from semantic_cache import SemanticCache
+from spec_corpus import model_codes
+
+SOURCES = [{'location': {'s3Location': {'uri': "s3://bucket/DT1000.pdf"}}}]
+
+
+def same_embedding(text):
+    return [1.0, 0.0]  # Every question is a perfect paraphrase of every other
+
+
+def test_answer_is_only_reused_for_the_same_models():
+    cache = SemanticCache(embedder=same_embedding, kb_version="sync-1")
+    question = "What is the operating weight of the DT1000?"
+    cache.add(cache.embed(question), "45 t", SOURCES, model_codes(question))
+
+    other = "What is the operating weight of the DT-850?"
+    assert cache.lookup(cache.embed(other), model_codes(other)) is None
+    assert cache.lookup(cache.embed(question), model_codes("how heavy is the dt-1000")) is not None
+    assert cache.lookup(cache.embed(question), model_codes("how heavy is a bulldozer")) is None
+
+
+def test_new_published_version_drops_entries(tmp_path):
+    version_file = str(tmp_path / "kb_version")
+    cache = SemanticCache(embedder=same_embedding, version_file=version_file)
+    embedding = cache.embed("What is the bucket capacity?")
+    cache.add(embedding, "2 m3", SOURCES)
+    assert len(cache) == 0  # No version published: nothing is cached
+
+    publish_kb_version("sync-1", version_file)
+    cache.add(embedding, "2 m3", SOURCES)
+    assert cache.lookup(embedding) is not None
+
+    publish_kb_version("sync-2", version_file)
+    assert cache.lookup(embedding) is None
+    assert len(cache) == 0
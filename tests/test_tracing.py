@@ -0,0 +1,51 @@
+import pytest
+
+import tracing
+from tracing import span, traced
+
+
+@pytest.fixture
+def tracer():
+    tracer = tracing.enable()
+    yield tracer
+    tracing.disable()
+
+
+@traced("generate")
+def pieces():
+    for text in ("a", "b"):
+        with span("token"):
+            pass
+        yield text
+
+
+def by_name(tracer):
+    return {recorded.name: recorded for recorded in tracer.trace()}
+
+
+def test_caller_spans_between_pieces_are_not_parented_under_the_generator(tracer):
+    with span("chat_turn"):
+        for _ in pieces():
+            with span("send"):
+                pass
+    spans = by_name(tracer)
+    assert spans["send"].parent_id == spans["chat_turn"].span_id
+    assert spans["token"].parent_id == spans["generate"].span_id
+    assert spans["generate"].parent_id == spans["chat_turn"].span_id
+
+
+def test_generator_span_ends_when_closed_and_records_errors(tracer):
+    with span("chat_turn"):
+        stream = pieces()
+        next(stream)
+        stream.close()
+    assert by_name(tracer)["generate"].end_ns is not None
+
+    @traced("generate")
+    def failing():
+        yield "a"
+        raise RuntimeError("stream broke")
+
+    with pytest.raises(RuntimeError):
+        list(failing())
+    assert tracer.trace()[-1].error == "RuntimeError: stream broke"
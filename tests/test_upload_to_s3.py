@@ -0,0 +1,124 @@
+import json
+
+import boto3
+import pytest
+
+from upload_to_s3 import METADATA_SUFFIX, get_files_to_upload, sync_incremental
+
+moto = pytest.importorskip("moto")
+
+BUCKET = "spec-sheets-test"
+
+
+@pytest.fixture
+def s3_client():
+    with moto.mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    folder = tmp_path / "spec-sheets"
+    folder.mkdir()
+    for name in ("bd850-spec-sheet.txt", "ex200-spec-sheet.txt"):
+        (folder / name).write_text(f"Spec sheet {name}: rated load 100 tons.")
+    return folder
+
+
+def keys(s3_client):
+    return {obj['Key'] for obj in s3_client.list_objects_v2(Bucket=BUCKET).get('Contents', [])}
+
+
+def sync(s3_client, folder, manifest, confirm=None, delete=True):
+    return sync_incremental(s3_client, get_files_to_upload(str(folder)), BUCKET, str(manifest), 2, confirm,
+                            delete=delete)
+
+
+def test_removed_file_is_only_reported_without_delete(s3_client, corpus, tmp_path):
+    manifest = tmp_path / "manifest.json"
+    sync(s3_client, corpus, manifest)
+    before = keys(s3_client)
+
+    (corpus / "bd850-spec-sheet.txt").unlink()
+    result = sync(s3_client, corpus, manifest, delete=False)
+    assert result['removed'] == []
+    assert result['pending_removal'] == ["bd850-spec-sheet.txt"]
+    assert keys(s3_client) == before
+
+
+def test_removed_file_is_deleted_with_its_sidecar(s3_client, corpus, tmp_path):
+    manifest = tmp_path / "manifest.json"
+    sync(s3_client, corpus, manifest)
+    assert "bd850-spec-sheet.txt" + METADATA_SUFFIX in keys(s3_client)
+
+    (corpus / "bd850-spec-sheet.txt").unlink()
+    result = sync(s3_client, corpus, manifest)
+    assert result['removed'] == ["bd850-spec-sheet.txt"]
+    assert result['pending_removal'] == []
+    assert keys(s3_client) == {"ex200-spec-sheet.txt", "ex200-spec-sheet.txt" + METADATA_SUFFIX}
+    assert "bd850-spec-sheet.txt" not in json.loads(manifest.read_text())
+
+
+def test_declined_run_keeps_removed_keys(s3_client, corpus, tmp_path):
+    manifest = tmp_path / "manifest.json"
+    sync(s3_client, corpus, manifest)
+    (corpus / "bd850-spec-sheet.txt").unlink()
+
+    for _ in range(2):  # Reported again on the next run
+        result = sync(s3_client, corpus, manifest, confirm=lambda changed, removed, sidecars: False)
+        assert result['removed'] == []
+        assert result['pending_removal'] == ["bd850-spec-sheet.txt"]
+    assert "bd850-spec-sheet.txt" in keys(s3_client)
+    assert "bd850-spec-sheet.txt" in json.loads(manifest.read_text())
+
+
+def test_failed_delete_keeps_removed_keys(s3_client, corpus, tmp_path, monkeypatch):
+    manifest = tmp_path / "manifest.json"
+    sync(s3_client, corpus, manifest)
+    (corpus / "bd850-spec-sheet.txt").unlink()
+
+    def failing_delete(**kwargs):
+        return {'Errors': [{'Key': obj['Key'], 'Code': 'AccessDenied'} for obj in kwargs['Delete']['Objects']]}
+
+    monkeypatch.setattr(s3_client, 'delete_objects', failing_delete)
+    result = sync(s3_client, corpus, manifest)
+    assert result['removed'] == []
+    assert result['pending_removal'] == ["bd850-spec-sheet.txt"]
+    assert "bd850-spec-sheet.txt" in json.loads(manifest.read_text())
+
+
+def test_empty_folder_deletes_nothing(s3_client, corpus, tmp_path):
+    manifest = tmp_path / "manifest.json"
+    sync(s3_client, corpus, manifest)
+    before = keys(s3_client)
+
+    result = sync(s3_client, tmp_path / "missing", manifest)
+    assert result['removed'] == []
+    assert keys(s3_client) == before
+    assert len(result['pending_removal']) == 2
+
+
+def test_unchanged_files_without_a_sidecar_are_backfilled(s3_client, corpus, tmp_path):
+    manifest = tmp_path / "manifest.json"
+    sync(s3_client, corpus, manifest)
+    sidecar = "bd850-spec-sheet.txt" + METADATA_SUFFIX
+    s3_client.delete_object(Bucket=BUCKET, Key=sidecar)
+    entries = json.loads(manifest.read_text())
+    del entries["bd850-spec-sheet.txt"]['sidecar']  # Uploaded before sidecars existed
+    manifest.write_text(json.dumps(entries))
+
+    result = sync(s3_client, corpus, manifest)
+    assert result['uploaded'] == []
+    assert result['sidecars'] == ["bd850-spec-sheet.txt"]
+    assert sidecar in keys(s3_client)
+    assert sync(s3_client, corpus, manifest)['sidecars'] == []
+
+
+def test_changed_file_gets_a_new_sidecar(s3_client, corpus, tmp_path):
+    manifest = tmp_path / "manifest.json"
+    assert len(sync(s3_client, corpus, manifest)['sidecars']) == 2
+    (corpus / "ex200-spec-sheet.txt").write_text("Spec sheet EX200: bucket capacity 1.2 m3.")
+    result = sync(s3_client, corpus, manifest)
+    assert result['uploaded'] == result['sidecars'] == ["ex200-spec-sheet.txt"]